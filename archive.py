@@ -0,0 +1,99 @@
+# archive.py
+# ロケハンで撮った写真の ZIP（カテゴリごとのフォルダ分け）から画像を取り出す。
+# 中身は 1 ファイルずつ読み出すので、展開した全画像を同時にメモリへ載せない。
+#
+#   photos/001.jpg, 平面図/1F.png, ロケ地A/angles/a.jpg ...
+#
+# フォルダ名はカテゴリキー（thumbs, photos, ...）か表示名（ロケ地写真 など）で、
+# パスのどの階層にあってもよい（一番深いものを使う）。batch.py の画像フォルダと同じ並び。
+
+import os
+import zlib
+import zipfile
+from pathlib import PurePosixPath
+
+from categories import CATEGORIES
+from imaging import IMAGE_SUFFIXES
+
+# --- 設定（環境変数で変更可） ---
+# ZIP_MAX_IMAGE_MB : 1 ファイルの展開後サイズの上限（既定 50 MB、超えるものは飛ばす）
+MAX_MEMBER_BYTES = int(os.environ.get("ZIP_MAX_IMAGE_MB", 50)) * 1024 * 1024
+
+# フォルダ名（小文字）→ カテゴリキー
+FOLDER_KEYS = {}
+for _label, _key, _ in CATEGORIES:
+    FOLDER_KEYS[_key.lower()] = _key
+    FOLDER_KEYS[_label.lower()] = _key
+    FOLDER_KEYS[_label.split("：")[0].lower()] = _key   # 「サムネイル：1枚のみ」→「サムネイル」
+
+
+def category_of(name):
+    """ZIP 内のパスからカテゴリキーを決める（どのフォルダにも当たらなければ None）。"""
+    for part in reversed(PurePosixPath(name).parts[:-1]):
+        key = FOLDER_KEYS.get(part.lower())
+        if key is not None:
+            return key
+    return None
+
+
+def _display_name(info):
+    # 古い ZIP ツールは UTF-8 フラグなしで Shift_JIS のファイル名を書く
+    if info.flag_bits & 0x800:
+        return info.filename
+    try:
+        return info.filename.encode("cp437").decode("cp932")
+    except (UnicodeEncodeError, UnicodeDecodeError):
+        return info.filename
+
+
+def plan(fileobj):
+    """
+    取り込む画像の一覧を (ZipInfo, 表示用パス, カテゴリキー) のリストで返す。
+    カテゴリに当たらないもの・画像以外・大きすぎるものは skipped に (パス, 理由) で入れる。
+    戻り値: (entries, skipped)
+    """
+    entries, skipped = [], []
+    with zipfile.ZipFile(fileobj) as zf:
+        for info in zf.infolist():
+            name = _display_name(info)
+            base = PurePosixPath(name).name
+            if info.is_dir() or base.startswith(".") or name.startswith("__MACOSX/"):
+                continue
+            if PurePosixPath(base).suffix.lower() not in IMAGE_SUFFIXES:
+                skipped.append((name, "画像以外"))
+                continue
+            if info.file_size > MAX_MEMBER_BYTES:
+                skipped.append((name, "サイズ超過"))
+                continue
+            key = category_of(name)
+            if key is None:
+                skipped.append((name, "カテゴリ不明のフォルダ"))
+                continue
+            entries.append((info, name, key))
+    # カテゴリ内はパス順（batch.py と同じくファイル名順）
+    entries.sort(key=lambda e: e[1])
+    return entries, skipped
+
+
+def iter_images(fileobj, entries, skipped=None):
+    """
+    plan() の entries を順に展開し、(カテゴリキー, ファイル名, 生バイト) を 1 枚ずつ返す。
+    展開できないもの（暗号化・CRC 不一致・壊れた圧縮データなど）と、ヘッダーのサイズを
+    偽って上限を超えたものは飛ばし、skipped があれば (パス, 理由) を追加する。
+    """
+    with zipfile.ZipFile(fileobj) as zf:
+        for info, name, key in entries:
+            try:
+                with zf.open(info) as fh:
+                    raw = fh.read(MAX_MEMBER_BYTES + 1)
+            except RuntimeError:   # パスワード付き
+                reason = "暗号化されている"
+            except (zipfile.BadZipFile, zlib.error, NotImplementedError, EOFError, OSError):
+                reason = "展開できない（壊れている）"
+            else:
+                if len(raw) <= MAX_MEMBER_BYTES:
+                    yield key, PurePosixPath(name).name, raw
+                    continue
+                reason = "サイズ超過"
+            if skipped is not None:
+                skipped.append((name, reason))
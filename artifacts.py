@@ -0,0 +1,80 @@
+# artifacts.py
+# 生成物（PPTX / Excel）をセッションごとのディレクトリに書き出して管理する。
+# メモリには置かず、古いものは TTL か新しい生成物での置き換えで削除する。
+
+import os
+import time
+import tempfile
+import threading
+from pathlib import Path
+from uuid import uuid4
+
+# --- 設定（環境変数で変更可） ---
+# ARTIFACT_DIR : 生成物の保存先（既定は OS の一時ディレクトリ配下）
+# ARTIFACT_TTL : 生成物の保持秒数（既定 1 時間）
+ARTIFACT_ROOT = Path(os.environ.get(
+    "ARTIFACT_DIR", Path(tempfile.gettempdir()) / "location_uploader"
+))
+ARTIFACT_TTL  = int(os.environ.get("ARTIFACT_TTL", 3600))
+SWEEP_EVERY   = 60   # 期限切れ掃除の最短間隔(秒)
+
+_last_sweep = 0.0
+_sweep_lock = threading.Lock()
+_sweep_hooks = []
+
+
+def new_path(session_id, suffix):
+    """セッション用ディレクトリに新しい生成物のパスを払い出す（ファイルは作らない）。"""
+    d = ARTIFACT_ROOT / session_id
+    d.mkdir(parents=True, exist_ok=True)
+    return d / f"{uuid4().hex}{suffix}"
+
+
+def discard(path):
+    """生成物を削除する（存在しなければ何もしない）。"""
+    if path:
+        Path(path).unlink(missing_ok=True)
+
+
+def is_alive(path):
+    """まだ期限内で存在する生成物かどうか。"""
+    try:
+        return time.time() - Path(path).stat().st_mtime < ARTIFACT_TTL
+    except (OSError, TypeError):
+        return False
+
+
+def on_sweep(fn):
+    """sweep() で掃除を行うたびに fn() を呼ぶ（セッションごとのメモリ上のデータの後始末など）。"""
+    _sweep_hooks.append(fn)
+    return fn
+
+
+def sweep(force=False):
+    """
+    期限切れの生成物と空になったセッションディレクトリを削除する。
+    スクリプト実行のたびに呼ばれても SWEEP_EVERY 秒に 1 回だけ走る。
+    """
+    global _last_sweep
+    now = time.time()
+    with _sweep_lock:
+        if not force and now - _last_sweep < SWEEP_EVERY:
+            return
+        _last_sweep = now
+    for fn in _sweep_hooks:
+        fn()
+    if not ARTIFACT_ROOT.is_dir():
+        return
+    for d in ARTIFACT_ROOT.iterdir():
+        if not d.is_dir():
+            continue
+        for f in d.iterdir():
+            try:
+                if now - f.stat().st_mtime >= ARTIFACT_TTL:
+                    f.unlink()
+            except OSError:
+                pass
+        try:
+            d.rmdir()   # 空のときだけ消える
+        except OSError:
+            pass
@@ -0,0 +1,160 @@
+# batch.py
+# ロケ地情報の Excel（アプリの「ロケ地情報」シートと同じ列）と画像フォルダから、
+# 1 行につき 1 つの PPTX をまとめて生成するコマンドラインツール。
+#
+#   python batch.py locations.xlsx images/ out/ --per-slide 9 --workers 4
+#
+# 画像フォルダは 1 行ごとに images/<画像フォルダ 列 or ロケ地名>/ を使い、
+# その下にカテゴリキー（thumbs, photos, angles, others, floor, map_img）の
+# サブフォルダを置く。各サブフォルダ内の画像はファイル名順に並べる。
+
+import re
+import sys
+import time
+import argparse
+import datetime
+from pathlib import Path
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from openpyxl import load_workbook
+
+import imaging
+import metrics
+from deck import CATEGORIES, GRID_LAYOUTS, LAYOUT_MODES, render_deck
+
+FOLDER_COLUMN  = "画像フォルダ"   # あれば画像フォルダ名に使う（PPTX には載せない）
+
+
+def read_records(workbook, sheet=None):
+    """Excel の各行を {列名: 値} の辞書として返す（空行は飛ばす）。"""
+    wb = load_workbook(workbook, read_only=True, data_only=True)
+    try:
+        ws = wb[sheet] if sheet else wb.worksheets[0]
+        rows = ws.iter_rows(values_only=True)
+        header = [str(h) if h is not None else "" for h in next(rows, ())]
+        records = []
+        for row in rows:
+            if all(v is None or v == "" for v in row):
+                continue
+            rec = {}
+            for col, v in zip(header, row):
+                if not col:
+                    continue
+                if isinstance(v, datetime.time):
+                    v = v.strftime("%H:%M")
+                rec[col] = v
+            records.append(rec)
+        return records
+    finally:
+        wb.close()
+
+
+def image_sources(image_dir):
+    """カテゴリキーごとのサブフォルダにある画像のパスを {キー: [パス, ...]} で返す。"""
+    image_dir = Path(image_dir)
+    if not image_dir.is_dir():
+        raise FileNotFoundError(f"画像フォルダがありません: {image_dir}")
+    sources = {}
+    for _, key, _ in CATEGORIES:
+        folder = image_dir / key
+        if folder.is_dir():
+            sources[key] = sorted(
+                p for p in folder.iterdir()
+                if p.is_file() and p.suffix.lower() in imaging.IMAGE_SUFFIXES
+            )
+    return sources
+
+
+def render_row(index, record, image_dir, out_path, per_slide, dpi, layout_mode="grid"):
+    """1 行分の PPTX を生成し、結果（所要時間・エラーなど）を辞書で返す。"""
+    name = str(record.get("ロケ地名") or "")
+    run  = metrics.start("pptx", source="batch", row=index, per_slide=per_slide, dpi=dpi,
+                         layout=layout_mode)
+    t0 = time.perf_counter()
+    result = {"row": index, "name": name, "out": str(out_path), "images": 0,
+              "bytes": 0, "seconds": 0.0, "error": None}
+    try:
+        sources = image_sources(image_dir)
+        sources["thumbs"] = sources.get("thumbs", [])[:1]
+        fields = {k: v for k, v in record.items() if k != FOLDER_COLUMN}
+        render_deck(fields, sources, per_slide, dpi, out=out_path, measure=run,
+                    layout_mode=layout_mode)
+        result["images"] = sum(len(v) for v in sources.values())
+        result["bytes"]  = Path(out_path).stat().st_size
+    except Exception as e:
+        result["error"] = f"{type(e).__name__}: {e}"
+    result["seconds"] = time.perf_counter() - t0
+    metrics.finish(run, result["error"])
+    return result
+
+
+def _init_worker():
+    # 並列化は行単位で行うので、各ワーカー内の画像処理は 1 スレッドにする
+    imaging.POOL_KIND    = "thread"
+    imaging.POOL_WORKERS = 1
+
+
+def _safe_name(name):
+    return re.sub(r'[\\/:*?"<>|\s]+', "_", name).strip("_") or "location"
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="Excel と画像フォルダからロケ地 PPTX を一括生成")
+    ap.add_argument("workbook", help="ロケ地情報の Excel（1 行目が列名）")
+    ap.add_argument("images", help="ロケ地ごとの画像フォルダを置いたディレクトリ")
+    ap.add_argument("out", help="PPTX の出力先ディレクトリ")
+    ap.add_argument("--sheet", default=None, help="シート名（既定は先頭シート）")
+    ap.add_argument("--per-slide", type=int, choices=sorted(GRID_LAYOUTS), default=6,
+                    help="1 スライドあたりの画像枚数")
+    ap.add_argument("--layout", choices=list(LAYOUT_MODES), default="grid",
+                    help="画像の並べ方（grid: 固定グリッド / justified: 縦横比に合わせて詰める）")
+    ap.add_argument("--dpi", type=int, default=150,
+                    help="画像の書き出し解像度（0 で元画像のまま）")
+    ap.add_argument("--workers", type=int, default=None,
+                    help="並列ワーカープロセス数（既定は CPU コア数）")
+    args = ap.parse_args(argv)
+
+    records = read_records(args.workbook, args.sheet)
+    out_dir = Path(args.out)
+    out_dir.mkdir(parents=True, exist_ok=True)
+    dpi = args.dpi or None
+
+    jobs = []
+    for i, rec in enumerate(records, 1):
+        name   = str(rec.get("ロケ地名") or "")
+        folder = rec.get(FOLDER_COLUMN) or name
+        jobs.append((i, rec, Path(args.images) / str(folder),
+                     out_dir / f"{i:03d}_{_safe_name(name)}.pptx", args.per_slide, dpi,
+                     args.layout))
+
+    t0 = time.perf_counter()
+    results = []
+    with ProcessPoolExecutor(max_workers=args.workers, initializer=_init_worker) as pool:
+        futures = [pool.submit(render_row, *job) for job in jobs]
+        for fut in as_completed(futures):
+            r = fut.result()
+            results.append(r)
+            status = "OK  " if r["error"] is None else "FAIL"
+            print(f"[{status}] #{r['row']:03d} {r['name']}  "
+                  f"{r['images']} 枚  {r['bytes'] / 1e6:.1f} MB  {r['seconds']:.2f} s",
+                  flush=True)
+    wall = time.perf_counter() - t0
+
+    # --- 集計 ---
+    ok     = [r for r in results if r["error"] is None]
+    failed = sorted((r for r in results if r["error"] is not None), key=lambda r: r["row"])
+    print()
+    print(f"完了: {len(ok)}/{len(results)} 件  全体 {wall:.2f} s")
+    if ok:
+        secs = [r["seconds"] for r in ok]
+        print(f"1 件あたり: 平均 {sum(secs) / len(secs):.2f} s / 最大 {max(secs):.2f} s  "
+              f"合計出力 {sum(r['bytes'] for r in ok) / 1e6:.1f} MB")
+    if failed:
+        print(f"失敗: {len(failed)} 件")
+        for r in failed:
+            print(f"  #{r['row']:03d} {r['name']}: {r['error']}")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,118 @@
+# benchmarks/bench_deck.py
+# 合成画像で deck.render_deck() を計測するベンチマーク。
+# 画像枚数 × レイアウト（6枚/9枚）× 並べ方（grid / justified）ごとに、
+# 所要時間・ピーク RSS・出力サイズ・スライド数を表示する。
+#
+#   python benchmarks/bench_deck.py                       # 10/100/500 枚 × 6/9 × grid
+#   python benchmarks/bench_deck.py --counts 10 50 --json results.jsonl
+#   python benchmarks/bench_deck.py --counts 100 --modes grid justified
+#
+# 各ケースは別プロセスで実行するので、ピーク RSS はケースごとの値になる。
+
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import resource
+import tempfile
+import multiprocessing
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT))
+
+from PIL import Image, ImageDraw   # noqa: E402
+
+RECORD = {
+    "ロケ地名": "ベンチマーク用ロケ地",
+    "住所":     "東京都千代田区千代田1-1",
+    "大分類":   "ハウススタジオ",
+    "小分類":   "一軒家",
+}
+
+
+def make_images(folder, n, size, seed=0):
+    """写真に近い（JPEG で圧縮しきれない）合成画像を n 枚作り、パスのリストを返す。"""
+    rnd = random.Random(seed)
+    noise = Image.effect_noise(size, 40).convert("RGB")
+    paths = []
+    for i in range(n):
+        w, h = size if i % 4 else (size[1], size[0])   # 4 枚に 1 枚は縦長
+        base = Image.new("RGB", (w, h), tuple(rnd.randrange(256) for _ in range(3)))
+        base = Image.blend(base, noise.resize((w, h)), 0.35)
+        draw = ImageDraw.Draw(base)
+        for _ in range(8):
+            x0, y0 = rnd.randrange(w), rnd.randrange(h)
+            draw.ellipse((x0, y0, x0 + w // 4, y0 + h // 4),
+                         fill=tuple(rnd.randrange(256) for _ in range(3)))
+        p = Path(folder) / f"img{i:04d}.jpg"
+        base.save(p, quality=90)
+        paths.append(p)
+    return paths
+
+
+def _peak_rss_mb():
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux は KB、macOS は bytes
+    return rss / (1024 * 1024) if sys.platform == "darwin" else rss / 1024
+
+
+def run_case(paths, per_slide, dpi, layout_mode="grid"):
+    """1 ケース分を実行して計測結果を返す（子プロセス内で呼ばれる）。"""
+    import io
+    from pptx import Presentation
+    from deck import render_deck
+
+    t0 = time.perf_counter()
+    data = render_deck(RECORD, {"thumbs": paths[:1], "photos": paths}, per_slide, dpi,
+                       layout_mode=layout_mode)
+    wall = time.perf_counter() - t0
+    return {
+        "images":    len(paths),
+        "per_slide": per_slide,
+        "mode":      layout_mode,
+        "dpi":       dpi,
+        "slides":    len(Presentation(io.BytesIO(data)).slides),
+        "seconds":   round(wall, 3),
+        "peak_rss_mb": round(_peak_rss_mb(), 1),
+        "output_mb": round(len(data) / 1e6, 2),
+    }
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="PPTX 書き出しのベンチマーク")
+    ap.add_argument("--counts", type=int, nargs="+", default=[10, 100, 500])
+    ap.add_argument("--layouts", type=int, nargs="+", default=[6, 9])
+    ap.add_argument("--modes", nargs="+", default=["grid"], choices=["grid", "justified"],
+                    help="画像の並べ方")
+    ap.add_argument("--dpi", type=int, default=150, help="0 で元画像のまま")
+    ap.add_argument("--size", type=int, nargs=2, default=[1600, 1200],
+                    metavar=("W", "H"), help="合成画像のサイズ(px)")
+    ap.add_argument("--json", default=None, help="結果を JSON Lines で追記するファイル")
+    args = ap.parse_args(argv)
+
+    ctx = multiprocessing.get_context("spawn")
+    with tempfile.TemporaryDirectory() as tmp:
+        print(f"合成画像 {max(args.counts)} 枚を生成中 ({args.size[0]}x{args.size[1]}) ...",
+              flush=True)
+        paths = make_images(tmp, max(args.counts), tuple(args.size))
+        print(f"{'images':>7} {'layout':>6} {'mode':>9} {'seconds':>8} {'peakRSS[MB]':>12} "
+              f"{'output[MB]':>11} {'slides':>7}")
+        for n in args.counts:
+            for per_slide in args.layouts:
+                for mode in args.modes:
+                    with ctx.Pool(1) as pool:
+                        r = pool.apply(run_case, (paths[:n], per_slide, args.dpi or None, mode))
+                    print(f"{r['images']:>7} {r['per_slide']:>6} {r['mode']:>9} "
+                          f"{r['seconds']:>8.2f} {r['peak_rss_mb']:>12.1f} "
+                          f"{r['output_mb']:>11.2f} {r['slides']:>7}", flush=True)
+                    if args.json:
+                        with open(args.json, "a", encoding="utf-8") as fh:
+                            r["cpus"] = os.cpu_count()
+                            fh.write(json.dumps(r) + "\n")
+
+
+if __name__ == "__main__":
+    main()
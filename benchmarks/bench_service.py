@@ -0,0 +1,100 @@
+# benchmarks/bench_service.py
+# service.py のレンダリングサービスに、予約システムの代わりの手元クライアントから
+# ジョブをまとめて投入する負荷試験。キューの深さ・503（満杯）の件数・ジョブごとの所要時間を表示する。
+#
+#   python benchmarks/bench_service.py                          # サービスも同じプロセスで起動
+#   python benchmarks/bench_service.py --jobs 40 --clients 8 --workers 2 --queue 4
+#   python benchmarks/bench_service.py --port 8765              # 起動済みのサービスへ投入
+#     （画像は一時ディレクトリに作るので、サービスは --image-root / などで起動しておく）
+#
+# 503 が返ったクライアントは Retry-After だけ待って再送する（service.submit_and_wait）。
+
+import sys
+import json
+import time
+import argparse
+import tempfile
+import threading
+from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT))
+sys.path.insert(0, str(ROOT / "benchmarks"))
+
+import service                          # noqa: E402
+from bench_deck import RECORD, make_images   # noqa: E402
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="レンダリングサービスの負荷試験")
+    ap.add_argument("--jobs", type=int, default=20, help="投入するジョブ数")
+    ap.add_argument("--clients", type=int, default=4, help="同時に投入するクライアント数")
+    ap.add_argument("--images", type=int, default=12, help="1 ジョブあたりの画像枚数")
+    ap.add_argument("--workers", type=int, default=2, help="同じプロセスで起動するサービスのワーカー数")
+    ap.add_argument("--queue", type=int, default=4, help="同じプロセスで起動するサービスのキュー長")
+    ap.add_argument("--port", type=int, default=None, help="起動済みのサービスのポート")
+    ap.add_argument("--json", default=None, help="結果を JSON Lines で追記するファイル")
+    args = ap.parse_args(argv)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        paths = [str(p) for p in make_images(tmp, args.images, (2400, 1600))]
+        payload = {"record": RECORD, "images": {"thumbs": paths[:1], "photos": paths},
+                   "per_slide": 6, "dpi": 150}
+
+        server = None
+        if args.port is None:
+            state  = service.new_service(Path(tmp) / "out", args.workers, args.queue,
+                                         image_root=tmp)
+            server = service.make_server(state, port=0)
+            server.RequestHandlerClass.log_message = lambda *a: None
+            threading.Thread(target=server.serve_forever, daemon=True).start()
+        addr = {"port": args.port or server.server_address[1]}
+
+        # 投入中のキューの深さを見ておく
+        depths, stop = [], threading.Event()
+
+        def watch():
+            while not stop.is_set():
+                _, _, body = service.request("GET", "/status", **addr)
+                depths.append(json.loads(body)["queue_depth"])
+                time.sleep(0.05)
+
+        watcher = threading.Thread(target=watch, daemon=True)
+        watcher.start()
+        t0 = time.perf_counter()
+        with ThreadPoolExecutor(args.clients) as pool:
+            views = list(pool.map(lambda _: service.submit_and_wait(payload, poll=0.1, **addr),
+                                  range(args.jobs)))
+        wall = time.perf_counter() - t0
+        stop.set()
+        watcher.join()
+        _, _, body = service.request("GET", "/status", **addr)
+        stats = json.loads(body)
+        if server is not None:
+            server.shutdown()
+            server.server_close()
+
+    failed = [v for v in views if v["status"] != "done"]
+    result = {
+        "jobs": args.jobs, "clients": args.clients, "images": args.images,
+        "wall_s": round(wall, 2), "jobs_per_s": round(args.jobs / wall, 2),
+        "max_queue_depth": max(depths, default=0), "rejected": stats["rejected"],
+        "failed": len(failed), "queue_s": stats["queue_seconds"],
+        "render_s": stats["render_seconds"], "total_s": stats["total_seconds"],
+    }
+    print(f"{args.jobs} ジョブ（{args.images} 枚ずつ）を {args.clients} クライアントから投入")
+    print(f"  全体 {wall:.2f} s（{result['jobs_per_s']} ジョブ/s）  失敗 {len(failed)}")
+    print(f"  キューの深さの最大 {result['max_queue_depth']}  503（満杯）{result['rejected']} 回")
+    for name in ("queue", "render", "total"):
+        s = stats[f"{name}_seconds"] or {"p50": 0, "p95": 0}
+        print(f"  {name:<7} p50 {s['p50']:>7.3f} s   p95 {s['p95']:>7.3f} s")
+    for v in failed[:5]:
+        print(f"  失敗: {v['id']} {v['error']}")
+    if args.json:
+        with open(args.json, "a", encoding="utf-8") as fh:
+            fh.write(json.dumps(result, ensure_ascii=False) + "\n")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,103 @@
+# benchmarks/bench_startup.py
+# アプリのコールドスタートを計測するベンチマーク。
+#   - 主要な依存ライブラリ／アプリのモジュールごとの import 時間（それぞれ新しいプロセスで）
+#   - 新しいプロセスでの最初のスクリプト実行（フォームが描画されるまで）と 2 回目の実行
+#   - 最初の実行の時点で読み込まれていた重い依存ライブラリ
+#
+#   python benchmarks/bench_startup.py
+#   python benchmarks/bench_startup.py --repeat 5 --json results.jsonl
+#
+# スクリプトの実行には streamlit.testing の AppTest を使う（ブラウザは不要）。
+
+import os
+import sys
+import json
+import argparse
+import tempfile
+import subprocess
+from pathlib import Path
+from statistics import median
+
+ROOT = Path(__file__).resolve().parents[1]
+
+# import 時間を測るモジュール（外部ライブラリ → アプリのモジュール）
+MODULES = [
+    "streamlit", "pandas", "numpy", "PIL.Image", "openpyxl", "pptx",
+    "store", "imaging", "deck", "excel_export",
+]
+# 最初の実行で読み込まれていないことを確認する重いライブラリ
+HEAVY = ["pandas", "numpy", "PIL", "openpyxl", "pptx", "lxml"]
+
+_IMPORT_CODE = """
+import sys, time
+sys.path.insert(0, {root!r})
+t0 = time.perf_counter()
+import {module}
+print(time.perf_counter() - t0)
+"""
+
+_RUN_CODE = """
+import sys, json, time
+t0 = time.perf_counter()
+from streamlit.testing.v1 import AppTest
+t1 = time.perf_counter()
+at = AppTest.from_file({script!r}, default_timeout=300)
+at.run()
+t2 = time.perf_counter()
+assert not at.exception, at.exception
+loaded = [m for m in {heavy!r} if m in sys.modules]
+at.run()
+t3 = time.perf_counter()
+print(json.dumps({{"streamlit_import": t1 - t0, "first_run": t2 - t1,
+                  "rerun": t3 - t2, "loaded": loaded}}))
+"""
+
+
+def _python(code, env):
+    out = subprocess.run([sys.executable, "-c", code], cwd=ROOT, env=env,
+                         capture_output=True, text=True, check=True)
+    return out.stdout.strip().splitlines()[-1]
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="アプリのコールドスタートのベンチマーク")
+    ap.add_argument("--repeat", type=int, default=3, help="各計測の繰り返し回数（中央値を表示）")
+    ap.add_argument("--json", default=None, help="結果を JSON Lines で追記するファイル")
+    args = ap.parse_args(argv)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        # ストア・生成物・メトリクスは一時ディレクトリへ
+        env = dict(os.environ, PROJECT_STORE=str(Path(tmp) / "store"),
+                   ARTIFACT_DIR=str(Path(tmp) / "artifacts"), METRICS_FILE="")
+
+        print(f"{'module':<14} {'import[ms]':>10}")
+        imports = {}
+        for module in MODULES:
+            secs = [float(_python(_IMPORT_CODE.format(root=str(ROOT), module=module), env))
+                    for _ in range(args.repeat)]
+            imports[module] = round(median(secs) * 1000, 1)
+            print(f"{module:<14} {imports[module]:>10.1f}", flush=True)
+
+        runs = [json.loads(_python(_RUN_CODE.format(script=str(ROOT / "test.py"), heavy=HEAVY),
+                                   env))
+                for _ in range(args.repeat)]
+        result = {
+            "imports_ms":         imports,
+            "streamlit_import_ms": round(median(r["streamlit_import"] for r in runs) * 1000, 1),
+            "first_run_ms":       round(median(r["first_run"] for r in runs) * 1000, 1),
+            "rerun_ms":           round(median(r["rerun"] for r in runs) * 1000, 1),
+            "loaded_on_first_run": runs[0]["loaded"],
+        }
+    print()
+    print(f"streamlit の import       {result['streamlit_import_ms']:>8.1f} ms")
+    print(f"最初の実行（フォーム描画） {result['first_run_ms']:>8.1f} ms")
+    print(f"2 回目の実行               {result['rerun_ms']:>8.1f} ms")
+    print(f"最初の実行で読み込まれた重いライブラリ: "
+          f"{', '.join(result['loaded_on_first_run']) or 'なし'}")
+    if args.json:
+        with open(args.json, "a", encoding="utf-8") as fh:
+            fh.write(json.dumps(result, ensure_ascii=False) + "\n")
+
+
+if __name__ == "__main__":
+    main()
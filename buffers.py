@@ -0,0 +1,169 @@
+# buffers.py
+# セッションがメモリ上に持つバッファ（プレビュー画像・書き出し用の縮小画像など）を
+# セッションごと・プロセス全体の予算内で保持する LRU キャッシュ。
+# 予算を超えたら使われていないものから順にメモリを空け、ディスクに退避する
+# （退避ファイルは生成物と同じセッションディレクトリに置き、artifacts.sweep() で消える）。
+# Streamlit に依存しないので、バックグラウンドのジョブからも使える。
+
+import os
+import time
+import threading
+from pathlib import Path
+from collections import OrderedDict, defaultdict
+
+import artifacts
+
+MB = 1024 * 1024
+
+# --- 設定（環境変数で変更可） ---
+# SESSION_MEMORY_MB : 1 セッションが保持できるバッファの上限（既定 128 MB）
+# PROCESS_MEMORY_MB : プロセス全体の上限（既定 1024 MB）
+# MEMORY_READOUT    : 1 にするとサイドバーにメモリ使用量を表示する（管理者向け、既定は表示しない）
+SESSION_BUDGET = int(os.environ.get("SESSION_MEMORY_MB", 128)) * MB
+PROCESS_BUDGET = int(os.environ.get("PROCESS_MEMORY_MB", 1024)) * MB
+SHOW_READOUT   = os.environ.get("MEMORY_READOUT", "") == "1"
+
+# エントリ：[bytes（メモリ上にないとき None）, サイズ, 退避先パス, 自前の退避ファイルか]
+# セッション → (カテゴリ, 名前) → エントリ（退避済みも含む）
+_entries  = defaultdict(OrderedDict)
+# メモリ上にあるものだけの LRU（古い順、使うたびに末尾へ移す）
+_resident = OrderedDict()                      # (セッション, カテゴリ, 名前) → エントリ
+_session_resident = defaultdict(OrderedDict)   # セッション → (カテゴリ, 名前) → エントリ
+_usage    = defaultdict(lambda: defaultdict(int))   # セッション → カテゴリ → メモリ上のバイト数
+_last_use = {}                                 # セッション → 最後に使った時刻
+_total    = 0
+_lock     = threading.Lock()
+
+
+def put(session, category, name, data, path=None):
+    """
+    バッファを登録する。path にディスク上の同じ内容のファイルがあれば、
+    退避時は書き出さずにメモリを空けるだけにする。
+    """
+    global _total
+    k = (category, name)
+    with _lock:
+        path = Path(path) if path else None
+        old  = _entries[session].pop(k, None)
+        owned = False
+        if old is not None:
+            owned = old[3] and old[2] == path   # 自前の退避ファイルから読み戻した
+            _forget(session, k, old, unlink=not owned)
+        entry = [data, len(data), path, owned]
+        _entries[session][k] = entry
+        _resident[(session, *k)] = entry
+        _session_resident[session][k] = entry
+        _usage[session][category] += len(data)
+        _total += len(data)
+        _last_use[session] = time.time()
+        _enforce(session)
+    return data
+
+
+def get(session, category, name, path=None, load=None):
+    """
+    バッファを返す。メモリになければ退避先（または path）から読み戻し、
+    どこにもなければ load() で作って登録する。いずれもなければ None。
+    """
+    k = (category, name)
+    with _lock:
+        _last_use[session] = time.time()
+        entry = _entries[session].get(k) if session in _entries else None
+        if entry is not None:
+            if entry[0] is not None:
+                _resident.move_to_end((session, *k))
+                _session_resident[session].move_to_end(k)
+                return entry[0]
+            path = path or entry[2]
+    if path is not None and Path(path).exists():
+        return put(session, category, name, Path(path).read_bytes(), path)
+    if load is not None:
+        return put(session, category, name, load(), path)
+    return None
+
+
+def drop(session, category=None):
+    """セッション（category を渡せばそのカテゴリだけ）のバッファを捨てる。"""
+    with _lock:
+        _drop(session, category)
+
+
+def expire(idle_seconds):
+    """idle_seconds 以上使われていないセッションのバッファを捨て、捨てたセッション数を返す。"""
+    limit = time.time() - idle_seconds
+    with _lock:
+        idle = [s for s, t in _last_use.items() if t < limit]
+        for session in idle:
+            _drop(session)
+    return len(idle)
+
+
+def usage():
+    """{セッション: {カテゴリ: メモリ上のバイト数}} と プロセス全体のバイト数を返す。"""
+    with _lock:
+        return ({s: dict(c) for s, c in _usage.items() if any(c.values())}, _total)
+
+
+def _drop(session, category=None):
+    # _lock を持った状態で呼ぶ
+    entries = _entries.get(session)
+    if entries is None:
+        return
+    for k in [k for k in entries if category is None or k[0] == category]:
+        _forget(session, k, entries.pop(k), unlink=True)
+    if category is None:
+        for table in (_entries, _session_resident, _usage, _last_use):
+            table.pop(session, None)
+
+
+def _forget(session, k, entry, unlink=False):
+    # _lock を持った状態で呼ぶ
+    global _total
+    if entry[0] is not None:
+        _resident.pop((session, *k), None)
+        _session_resident[session].pop(k, None)
+        _usage[session][k[0]] -= entry[1]
+        _total -= entry[1]
+    if unlink and entry[3]:
+        artifacts.discard(entry[2])
+
+
+def _spill(session, k, entry):
+    # メモリ上の内容をディスクへ移す（_lock を持った状態で呼ぶ）
+    global _total
+    if entry[2] is None:
+        entry[2] = artifacts.new_path(session, ".buf")
+        entry[2].write_bytes(entry[0])
+        entry[3] = True
+    entry[0] = None
+    _resident.pop((session, *k), None)
+    _session_resident[session].pop(k, None)
+    _usage[session][k[0]] -= entry[1]
+    _total -= entry[1]
+
+
+def _enforce(session):
+    # セッションの予算 → プロセス全体の予算の順に、メモリ上にあるものの古い順に退避する
+    resident = _session_resident[session]
+    over = sum(_usage[session].values()) - SESSION_BUDGET
+    while over > 0 and resident:
+        k, entry = next(iter(resident.items()))
+        over -= entry[1]
+        _spill(session, k, entry)
+    while _total > PROCESS_BUDGET and _resident:
+        (s, *k), entry = next(iter(_resident.items()))
+        _spill(s, tuple(k), entry)
+
+
+# 生成物の期限切れ掃除のついでに、同じ期限のあいだ使われていないセッションを捨てる
+# （そのセッションの退避ファイルも同じ掃除で消えている）
+artifacts.on_sweep(lambda: expire(artifacts.ARTIFACT_TTL))
+
+
+def process_rss():
+    """プロセスの現在の RSS（バイト）。取得できない環境では None。"""
+    try:
+        with open("/proc/self/statm") as fh:
+            return int(fh.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, AttributeError):
+        return None
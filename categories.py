@@ -0,0 +1,13 @@
+# categories.py
+# 画像カテゴリの定義。フォーム・ギャラリー・PPTX・バッチ・ZIP 取り込みで共通。
+# 重いライブラリに依存しないので、アプリの起動時に読み込んでも軽い。
+
+# (表示名, キー, 複数枚可)。キーはセッションのキーやバッチの画像フォルダ名にも使う
+CATEGORIES = [
+    ("サムネイル：1枚のみ", "thumbs", False),
+    ("ロケ地写真", "photos", True),
+    ("アングル写真", "angles", True),
+    ("その他設備・搬入搬出経路", "others", True),
+    ("平面図", "floor", True),
+    ("ロケ地MAP", "map_img", True),
+]
@@ -0,0 +1,256 @@
+# deck.py
+# ロケ地情報と画像から PPTX を組み立てる。Streamlit に依存しないので
+# アプリ（test.py）からもバッチ（batch.py）からも呼べる。
+
+import io
+import time
+from pathlib import Path
+from functools import lru_cache
+
+from pptx import Presentation
+from pptx.util import Inches, Pt
+from pptx.enum.text import PP_ALIGN
+from pptx.oxml.ns import qn
+
+import metrics
+from categories import CATEGORIES
+from imaging import ingest_many, submit_rendition
+from layout import GRID_LAYOUTS, LAYOUT_MODES, thumb_box, image_pages
+
+# --- フォントサイズ定義 ---
+HEADING_FONT = Pt(20)   # スライド上部の見出し
+LOC_FONT     = Pt(20)   # ロケ地名
+TABLE_FONT   = Pt(10)   # 表の文字
+
+
+TEMPLATE_PATH = Path(__file__).with_name("template.pptx")
+NO_STYLE_TABLE = "{2D5ABB26-0587-4C30-8999-92F81FD0307C}"   # 表スタイル「スタイルなし、表のグリッドなし」
+
+
+def load_sources(sources, preview=False):
+    """
+    画像ソース（ファイルパス・bytes・imaging.make_record() のレコード）を
+    並びを保ったままレコードにそろえる。デコードは画像処理プールで並列に行う。
+    """
+    sources = list(sources)
+    recs = [s if isinstance(s, dict) else None for s in sources]
+    todo = [i for i, r in enumerate(recs) if r is None]
+    raws = [sources[i] if isinstance(sources[i], (bytes, bytearray))
+            else Path(sources[i]).read_bytes() for i in todo]
+    for i, rec in zip(todo, ingest_many(raws, preview=preview)):
+        recs[i] = rec
+    return recs
+
+
+def render_deck(record, images, per_slide=6, dpi=150, out=None, progress=None,
+                measure=None, rendition_dir=None, layout_mode="grid"):
+    """
+    ロケ地 1 件分の PPTX を作る。out（パス）があればそこへ保存してパスを、なければ bytes を返す。
+    record: {項目名: 値}（Excel の列と同じ。並び順がメタデータスライドの並びになる）
+    images: {カテゴリキー: [画像ソース, ...]}。ソースはファイルパス・bytes・
+            imaging.make_record() のレコードで、並び順がスライド上の順になる。
+            "thumbs" は先頭の 1 枚だけ使う
+    per_slide: GRID_LAYOUTS のキー（6 または 9）
+    dpi: 画像の書き出し解像度（None で元画像のまま）
+    measure: metrics.start() の記録先。渡すと工程ごとの所要時間・バイト数を記録する
+    rendition_dir: 書き出し用画像のディスクキャッシュ。渡すと前回までの生成で
+                   エンコード済みの画像（同じ画像・同じ配置枠）は再エンコードしない
+    layout_mode: 画像スライドの配置方式（layout.LAYOUT_MODES のキー）
+    """
+    cols, rows = GRID_LAYOUTS[per_slide]
+    with metrics.phase(measure, "load"):
+        thumbs = load_sources(images.get("thumbs", [])[:1])
+        sections = [
+            (label, load_sources(images.get(key, [])))
+            for label, key, _ in CATEGORIES if key != "thumbs"
+        ]
+    return build_pptx(
+        str(record.get("ロケ地名") or ""), list(record.items()),
+        thumbs[0] if thumbs else None, sections, cols, rows, dpi,
+        progress=progress, out=out, measure=measure, rendition_dir=rendition_dir,
+        layout_mode=layout_mode,
+    )
+
+
+@lru_cache(maxsize=1)
+def template_bytes():
+    """
+    テンプレート（template.pptx：16:9 のスライドサイズ・テーマフォント YuGothic・
+    標準のレイアウト一式）をプロセスで 1 度だけ読み込み、bytes を返す。
+    見た目の共通設定はテンプレートを PowerPoint で編集して変える。
+    """
+    return TEMPLATE_PATH.read_bytes()
+
+
+def blank_layout(prs):
+    """テンプレートの Blank レイアウト（名前で探し、なければ最後のもの）。"""
+    return next((lay for lay in prs.slide_layouts if lay.name.lower() == "blank"),
+                prs.slide_layouts[-1])
+
+
+def add_fields_table(slide, fields, slide_w):
+    """
+    メタデータの (ラベル, 値) を左右 2 組に分け、1 つの表（4 列）として配置する。
+    """
+    # 2分割
+    mid = len(fields) // 2
+    left_fields  = fields[:mid]
+    right_fields = fields[mid:]
+
+    # ↓↓ ここから調整可能 ↓↓
+    start_y   = Inches(1.0)               # タイトルと被らない位置
+    margin_x  = Inches(0.7)               # 左右マージン
+    half_w    = (slide_w - margin_x*2) / 2
+    label_w   = Inches(2.0)               # 左コラムのラベル幅
+    label_w_r = Inches(1.8)               # 右コラムのラベル幅
+    row_h     = Inches(0.3)               # 行の高さ
+    # ↑↑ ここまで調整可能 ↑↑
+
+    n_rows = max(len(left_fields), len(right_fields))
+    frame  = slide.shapes.add_table(n_rows, 4, margin_x, start_y,
+                                    int(half_w * 2), int(row_h * n_rows))
+    table  = frame.table
+    # 罫線・塗りなしのスタイルにして、従来のテキスト配置と同じ見た目に
+    table.first_row = table.horz_banding = False
+    frame._element.graphic.graphicData.tbl.tblPr.find(qn("a:tableStyleId")).text = NO_STYLE_TABLE
+    for col, w in zip(table.columns,
+                      (label_w, half_w - label_w, label_w_r, half_w - label_w_r)):
+        col.width = int(w)
+    for row in table.rows:
+        row.height = int(row_h)
+
+    for c0, part in ((0, left_fields), (2, right_fields)):
+        for r, (label, val) in enumerate(part):
+            for c, text in ((c0, label), (c0 + 1, val)):
+                cell = table.cell(r, c)
+                cell.margin_top = cell.margin_bottom = 0
+                run = cell.text_frame.paragraphs[0].add_run()
+                run.text = f"{text}"
+                run.font.size = TABLE_FONT
+
+
+def build_pptx(location_name, fields, thumb, sections, cols, rows, dpi,
+               progress=None, out=None, measure=None, rendition_dir=None,
+               layout_mode="grid"):
+    """
+    PPTX を組み立て、out（パス）があればそこへ保存してパスを、なければ bytes を返す。
+    st.* を呼ばないのでバックグラウンドで実行できる。通常は render_deck() から呼ぶ。
+    fields: メタデータスライドの (ラベル, 値) のリスト
+    thumb: サムネイル画像のレコード（なければ None）
+    sections: (カテゴリ名, [レコード, ...]) のリスト
+    progress: progress(完了枚数, 全枚数) で画像 1 枚ごとに呼ばれる
+    measure: 工程（slides / encode / add_picture / save）の計測の記録先
+    rendition_dir: 書き出し用画像のディスクキャッシュ（render_deck() を参照）
+    layout_mode: 画像スライドの配置方式（layout.LAYOUT_MODES のキー）
+    """
+    t_slides = time.perf_counter()
+    # 共通：テンプレート（スライドサイズ・フォント・Blank レイアウト設定済み）から開始
+    prs = Presentation(io.BytesIO(template_bytes()))
+    blank = blank_layout(prs)
+
+    # --- 1枚目：サムネイルスライド ---
+    thumb_slide = prs.slides.add_slide(blank)
+    # 上部にロケ地名
+    TITLE_W = Inches(10)
+    left    = (prs.slide_width - TITLE_W) / 2
+    tb = thumb_slide.shapes.add_textbox(left, Inches(0.2), TITLE_W, Inches(0.6))
+    p  = tb.text_frame.paragraphs[0]
+    run = p.add_run()
+    run.text = location_name
+    p.alignment  = PP_ALIGN.CENTER
+    run.font.name = "YuGothic"
+    run.font.size = Pt(24)
+
+    # サムネイル画像を中央に縮小表示（幅を60%に）
+    # 画像の縮小・再エンコードはプールに投げ、図形の追加は最後にまとめて順番に行う
+    # 同じ画像のエンコード結果はスライド間で共有する
+    renditions = {}
+    placements = []   # (slide, Future, left, top, width, height)
+    if thumb is not None:
+        left, top, pic_w, pic_h = thumb_box(thumb["size"], prs.slide_width, prs.slide_height)
+        fut = submit_rendition(thumb, pic_w, pic_h, dpi, cache=renditions,
+                               cache_dir=rendition_dir)
+        placements.append((thumb_slide, fut, left, top, pic_w, pic_h))
+
+    # --- 2枚目：メタデータスライド ---
+    meta_slide = prs.slides.add_slide(blank)
+
+    # (A) タイトル「ロケ地情報」
+    META_TITLE_W = Inches(10)
+    left_title   = (prs.slide_width - META_TITLE_W) / 2
+    tb_meta_title = meta_slide.shapes.add_textbox(
+        left_title, Inches(0.2), META_TITLE_W, Inches(0.6)
+    )
+    p_title = tb_meta_title.text_frame.paragraphs[0]
+    run_title = p_title.add_run()
+    run_title.text = "ロケ地情報"
+    p_title.alignment = PP_ALIGN.CENTER
+    run_title.font.name = "YuGothic"
+    run_title.font.size = Pt(24)
+
+    # (B) 全項目を 1 つの表で（左右 2 組の「ラベル | 値」）
+    add_fields_table(meta_slide, fields, prs.slide_width)
+
+    # --- 3枚目以降：その他カテゴリの画像スライド（省略せず従来どおり） ---
+    for label, imgs in sections:
+        if not imgs:
+            continue
+
+        pages = image_pages([rec["size"] for rec in imgs], cols, rows,
+                            prs.slide_width, prs.slide_height, layout_mode)
+        for page in pages:
+            slide = prs.slides.add_slide(blank)
+
+            # カテゴリ見出し
+            tb_cat = slide.shapes.add_textbox(
+                Inches(0.5), Inches(0.3),
+                Inches(3), Inches(0.5)
+            )
+            p_cat    = tb_cat.text_frame.paragraphs[0]
+            run_cat  = p_cat.add_run()
+            run_cat.text = label
+            p_cat.alignment = PP_ALIGN.LEFT
+            run_cat.font.name = "YuGothic"
+            run_cat.font.size = HEADING_FONT
+
+            # ロケ地名
+            TEXT_W = Inches(10)
+            LEFT   = (prs.slide_width - TEXT_W) / 2
+            tb_loc2 = slide.shapes.add_textbox(LEFT, Inches(0.3), TEXT_W, Inches(0.5))
+            p_loc2  = tb_loc2.text_frame.paragraphs[0]
+            run_loc2= p_loc2.add_run()
+            run_loc2.text = location_name
+            p_loc2.alignment = PP_ALIGN.CENTER
+            run_loc2.font.name = "YuGothic"
+            run_loc2.font.size = HEADING_FONT
+
+            # 画像グリッド…（配置は layout.image_pages()、プレビューと共通）
+            for i, px, py, pw, ph in page:
+                fut = submit_rendition(imgs[i], pw, ph, dpi, cache=renditions,
+                                       cache_dir=rendition_dir)
+                placements.append((slide, fut, px, py, pw, ph))
+
+    metrics.add(measure, "slides", time.perf_counter() - t_slides)
+
+    # エンコードの完了数を進捗として通知し、完了したものから図形を追加
+    # encode はエンコード完了待ちの時間（プールが追いつかない分）
+    total = len(placements)
+    for done, (slide, fut, px, py, pw, ph) in enumerate(placements, 1):
+        t0 = time.perf_counter()
+        data = fut.result()
+        t1 = time.perf_counter()
+        slide.shapes.add_picture(io.BytesIO(data), px, py, width=pw, height=ph)
+        metrics.add(measure, "encode", t1 - t0, len(data))
+        metrics.add(measure, "add_picture", time.perf_counter() - t1)
+        if progress:
+            progress(done, total)
+
+    t0 = time.perf_counter()
+    if out is not None:
+        prs.save(out)
+        metrics.add(measure, "save", time.perf_counter() - t0, Path(out).stat().st_size)
+        return out
+    buf = io.BytesIO()
+    prs.save(buf)
+    metrics.add(measure, "save", time.perf_counter() - t0, buf.tell())
+    return buf.getvalue()
@@ -0,0 +1,91 @@
+# excel_export.py
+# 複数ロケ地のレコードを 1 つの Excel にまとめて書き出す。
+# openpyxl の write-only モードで 1 行ずつ流し込むので、数千行でもメモリを食わない。
+
+import io
+import time
+from pathlib import Path
+
+from openpyxl import Workbook
+from openpyxl.drawing.image import Image as XLImage
+from openpyxl.utils import get_column_letter
+
+import imaging
+import metrics
+
+XLSX_MIME   = "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+SHEET_NAME  = "ロケ地情報"
+IMAGE_SHEET = "画像"
+THUMB_PX    = 96   # 画像シートのサムネイルの長辺(px)
+
+
+def sheet_thumbnail(src):
+    """画像シートに載せる小さなサムネイル(bytes)を元画像（bytes またはパス）から作る。"""
+    return imaging.render(src, THUMB_PX, THUMB_PX, quality=70)
+
+
+def write_locations(path, records, columns=None, images=None, image_columns=(),
+                    measure=None):
+    """
+    ロケ地レコードを「ロケ地情報」シートに 1 行ずつ書き出す。
+    records: {列名: 値} の反復可能オブジェクト（ジェネレータ可）
+    columns: 列名の並び（省略時は最初のレコードのキー順）
+    images: (ロケ地名, {カテゴリ名: サムネイルの bytes またはパス}) の反復可能オブジェクト。
+            渡すと「画像」シートに image_columns の順でサムネイルを並べる
+    measure: metrics.start() の記録先（rows / images / save の工程を記録）
+    書き出した行数を返す。
+    """
+    t0 = time.perf_counter()
+    wb = Workbook(write_only=True)
+    ws = wb.create_sheet(SHEET_NAME)
+
+    records = iter(records)
+    first = next(records, None)
+    if columns is None:
+        columns = list(first) if first is not None else []
+    ws.append(list(columns))
+
+    n = 0
+    if first is not None:
+        ws.append([_cell(first.get(c)) for c in columns])
+        n = 1
+        for rec in records:
+            ws.append([_cell(rec.get(c)) for c in columns])
+            n += 1
+    metrics.add(measure, "rows", time.perf_counter() - t0)
+
+    if images is not None:
+        with metrics.phase(measure, "images"):
+            _write_image_sheet(wb.create_sheet(IMAGE_SHEET), images, image_columns)
+
+    t0 = time.perf_counter()
+    wb.save(path)
+    metrics.add(measure, "save", time.perf_counter() - t0, Path(path).stat().st_size)
+    return n
+
+
+def _cell(v):
+    # Excel に書けない型（None 以外のオブジェクトなど）は文字列にする
+    if v is None or isinstance(v, (str, int, float, bool)):
+        return v
+    return str(v)
+
+
+def _write_image_sheet(ws, images, image_columns):
+    """ロケ地ごとに 1 行、カテゴリごとに 1 列でサムネイルを貼る。"""
+    # write-only では列幅・行高は行を書く前に設定する
+    ws.column_dimensions["A"].width = 24
+    for c in range(len(image_columns)):
+        ws.column_dimensions[get_column_letter(c + 2)].width = THUMB_PX / 7 + 2
+    ws.append(["ロケ地名", *image_columns])
+
+    for r, (name, thumbs) in enumerate(images, start=2):
+        ws.row_dimensions[r].height = THUMB_PX * 0.75 + 4   # px → pt
+        ws.append([name])
+        for c, label in enumerate(image_columns, start=2):
+            data = thumbs.get(label)
+            if not data:
+                continue
+            img = XLImage(io.BytesIO(data) if isinstance(data, bytes) else data)
+            img.anchor = f"{get_column_letter(c)}{r}"
+            ws.add_image(img)
@@ -0,0 +1,84 @@
+# gallery.py
+# カテゴリごとの画像の並び（ギャラリー）の索引。
+# 並び順のリストと ハッシュ → 位置 の辞書を持ち、参照は一定時間、ページの切り出しは
+# そのページ分だけで済む。削除・移動・並べ替えはまとめて 1 回で並びを作り直す。
+# 選択状態（一括操作の対象）もここで持つ。Streamlit には依存しない。
+
+def new(items=()):
+    """(ハッシュ, ファイル名, 資料出力) の並びから索引を作る。"""
+    idx = {"order": [], "pos": {}, "name": {}, "include": {}, "selected": set()}
+    for digest, name, include in items:
+        append(idx, digest, name, include)
+    return idx
+
+
+def size(idx):
+    return len(idx["order"])
+
+
+def append(idx, digest, name, include=True):
+    """末尾に追加する。すでにあれば何もせず False を返す。"""
+    if digest in idx["pos"]:
+        return False
+    idx["pos"][digest] = len(idx["order"])
+    idx["order"].append(digest)
+    idx["name"][digest]    = name
+    idx["include"][digest] = include
+    return True
+
+
+def page(idx, start, stop):
+    """start 番目から stop 番目の手前までのハッシュ（コピーはそのページ分だけ）。"""
+    return idx["order"][start:stop]
+
+
+def included(idx):
+    """資料出力する画像のハッシュを並び順で返す。"""
+    inc = idx["include"]
+    return [d for d in idx["order"] if inc[d]]
+
+
+def remove(idx, digests):
+    """まとめて取り除き、実際に取り除いたハッシュのリストを返す。"""
+    gone = [d for d in dict.fromkeys(digests) if d in idx["pos"]]
+    if gone:
+        drop = set(gone)
+        _reorder(idx, [d for d in idx["order"] if d not in drop])
+        for d in gone:
+            del idx["name"][d], idx["include"][d]
+            idx["selected"].discard(d)
+    return gone
+
+
+def move_to_front(idx, digests):
+    """指定した画像を（今の並びのまま）先頭へ移す。"""
+    front = set(digests) & idx["pos"].keys()
+    _reorder(idx, [d for d in idx["order"] if d in front] +
+                  [d for d in idx["order"] if d not in front])
+
+
+def _reorder(idx, order):
+    idx["order"] = order
+    idx["pos"]   = {d: i for i, d in enumerate(order)}
+
+
+# --- 選択（一括操作の対象） ---
+
+def select_all(idx):
+    idx["selected"] = set(idx["order"])
+
+
+def select_none(idx):
+    idx["selected"] = set()
+
+
+def select_invert(idx):
+    idx["selected"] = set(idx["order"]) - idx["selected"]
+
+
+def selection(idx):
+    """選択中のハッシュを並び順で返す。"""
+    sel = idx["selected"]
+    if len(sel) * 8 < len(idx["order"]):   # 少ないときは位置で並べた方が速い
+        return sorted(sel, key=idx["pos"].__getitem__)
+    return [d for d in idx["order"] if d in sel]
@@ -0,0 +1,273 @@
+# imaging.py
+# 画像の取り込み（ハッシュ・メタデータ・プレビュー）と書き出し用の縮小・再エンコード。
+# Streamlit に依存しないので、スレッド／プロセスプールのワーカーからも呼べる。
+
+import io
+import os
+import time
+import hashlib
+import threading
+from uuid import uuid4
+from pathlib import Path
+from functools import partial
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor
+
+from PIL import Image, ImageOps, features
+
+import similar
+from layout import EMU_PER_INCH
+
+JPEG_QUALITY  = 85
+PREVIEW_WIDTH = 320   # プレビュー用サムネイルの長辺(px)
+PREVIEW_FORMAT = "WEBP" if features.check("webp") else "JPEG"
+IMAGE_SUFFIXES = {".png", ".jpg", ".jpeg"}   # 取り込む画像ファイルの拡張子
+RENDITION_STEP = 64   # 書き出し用画像の長辺をこの px 単位に切り上げる（枠が少し変わっても再利用）
+
+# EXIF Orientation のうち縦横が入れ替わるもの
+_SWAP_AXES = {5, 6, 7, 8}
+
+# --- ワーカープール設定（環境変数で変更可） ---
+# IMAGE_POOL    : "thread"（既定）または "process"
+# IMAGE_WORKERS : ワーカー数（既定は CPU コア数）
+POOL_KIND    = os.environ.get("IMAGE_POOL", "thread")
+POOL_WORKERS = int(os.environ.get("IMAGE_WORKERS", 0)) or (os.cpu_count() or 1)
+
+_pool      = None
+_pool_lock = threading.Lock()
+
+
+def get_pool():
+    """プロセス全体で共有する画像処理プールを返す（初回に生成）。"""
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            if POOL_KIND == "process":
+                _pool = ProcessPoolExecutor(max_workers=POOL_WORKERS)
+            else:
+                _pool = ThreadPoolExecutor(max_workers=POOL_WORKERS,
+                                           thread_name_prefix="imaging")
+        return _pool
+
+
+def has_transparency(img):
+    """実際に透過ピクセルを含む画像かどうか。"""
+    if img.mode == "P":
+        return "transparency" in img.info
+    if img.mode in ("RGBA", "LA", "PA"):
+        return img.getchannel("A").getextrema()[0] < 255
+    return False
+
+
+def source(rec):
+    """レコードの元画像（元バイトがあればそれ、なければストア上のファイルパス）。"""
+    return rec["raw"] if "raw" in rec else rec["path"]
+
+
+def read_source(src):
+    """source() の結果を bytes にする。"""
+    return src if isinstance(src, (bytes, bytearray)) else Path(src).read_bytes()
+
+
+def _open(src):
+    return Image.open(io.BytesIO(src) if isinstance(src, (bytes, bytearray)) else src)
+
+
+def _decode(src, max_w=None, max_h=None):
+    """
+    元画像（bytes またはパス）をデコードし、EXIF の向きを補正した画像を返す。
+    max_w/max_h を渡すと JPEG はその大きさに近い解像度で縮小デコードする。
+    """
+    with _open(src) as img:
+        orientation = img.getexif().get(0x0112, 1)
+        if max_w and max_h:
+            if orientation in _SWAP_AXES:
+                img.draft("RGB", (max_h, max_w))
+            else:
+                img.draft("RGB", (max_w, max_h))
+        img.load()
+        out = ImageOps.exif_transpose(img)
+        if out is img:
+            out = img.copy()
+    return out
+
+
+def _encode(img, quality, fmt=None):
+    """透過が必要なら PNG（fmt 指定時はそれ）、それ以外は JPEG/fmt で bytes にする。"""
+    buf = io.BytesIO()
+    if has_transparency(img):
+        if fmt in (None, "JPEG"):
+            img.save(buf, format="PNG", optimize=True)
+        else:
+            img.convert("RGBA").save(buf, format=fmt, quality=quality)
+    else:
+        if img.mode != "RGB":
+            img = img.convert("RGB")
+        if fmt in (None, "JPEG"):
+            img.save(buf, format="JPEG", quality=quality, optimize=True)
+        else:
+            img.save(buf, format=fmt, quality=quality)
+    return buf.getvalue()
+
+
+def probe(raw, preview=True):
+    """
+    取り込み用ワーカー：向き補正後のサイズ・形式・プレビューを作る。
+    元バイトは返さない（プロセスプールでの往復コピーを避ける）。
+    preview=False ならプレビューは作らない（バッチ出力など）。
+    プレビューを作るときは近似重複の検出用に phash（dHash）と sharpness（鮮鋭度）も付ける。
+    probe_seconds はワーカー内での所要時間（計測用）。
+    """
+    t0 = time.perf_counter()
+    with Image.open(io.BytesIO(raw)) as img:   # ヘッダーのみ読む
+        fmt         = img.format
+        orientation = img.getexif().get(0x0112, 1)
+        w, h        = img.size
+    if orientation in _SWAP_AXES:
+        w, h = h, w
+    meta = {
+        "size":        (w, h),
+        "format":      fmt,
+        "orientation": orientation,
+    }
+    if preview:
+        prev = _decode(raw, PREVIEW_WIDTH, PREVIEW_WIDTH)
+        prev.thumbnail((PREVIEW_WIDTH, PREVIEW_WIDTH), Image.LANCZOS)
+        meta["phash"], meta["sharpness"] = similar.features(prev)
+        meta["preview"] = _encode(prev, 75, PREVIEW_FORMAT)
+        prev.close()
+    meta["probe_seconds"] = time.perf_counter() - t0
+    return meta
+
+
+def preview_features(src):
+    """プレビュー（bytes またはパス）から similar.features() を計算する（後から補うとき用）。"""
+    with _open(src) as img:
+        return similar.features(img)
+
+
+def make_record(raw, digest=None, meta=None):
+    """
+    アップロード画像をセッションに保持する形にする。
+    圧縮済みの元バイトと軽量なメタデータ（＋プレビュー）のみで、
+    元画像のピクセルは保持しない。
+    """
+    rec = {"raw": raw, "hash": digest or hashlib.sha256(raw).hexdigest()}
+    rec.update(meta or probe(raw))
+    return rec
+
+
+def ingest_many(raws, digests=None, preview=True, errors=None):
+    """
+    複数の生バイトをプールで並列に取り込み、make_record() のレコードを
+    入力順に返す。計算済みのハッシュがあれば digests に渡す。
+    errors にリストを渡すと、読めない画像は例外を投げずにその位置を None にし、
+    errors に (添字, 例外) を追加する。
+    """
+    if digests is None:
+        digests = [hashlib.sha256(raw).hexdigest() for raw in raws]
+    if errors is None:
+        metas = get_pool().map(partial(probe, preview=preview), raws)
+        return [make_record(raw, d, m) for raw, d, m in zip(raws, digests, metas)]
+    futs = [get_pool().submit(probe, raw, preview) for raw in raws]
+    recs = []
+    for i, (raw, d, fut) in enumerate(zip(raws, digests, futs)):
+        try:
+            recs.append(make_record(raw, d, fut.result()))
+        except Exception as e:
+            errors.append((i, e))
+            recs.append(None)
+    return recs
+
+
+def box_pixels(box_w, box_h, dpi):
+    """配置枠（EMU）の物理サイズ × dpi のピクセル数。"""
+    return (max(1, round(box_w / EMU_PER_INCH * dpi)),
+            max(1, round(box_h / EMU_PER_INCH * dpi)))
+
+
+def rendition_box(box_w, box_h, dpi):
+    """
+    配置枠（EMU）用に書き出す画像のピクセル枠。長辺を RENDITION_STEP px 単位に
+    切り上げた正方形にする（縦横比は画像のまま縮小され、スライド上では配置枠に
+    合わせて縮小表示される）。縦横比に合わせる配置で行の高さが少し変わっても、
+    同じ枠になって再エンコードせずに済む。
+    """
+    long_edge = max(box_pixels(box_w, box_h, dpi))
+    step = -(-long_edge // RENDITION_STEP) * RENDITION_STEP
+    return step, step
+
+
+def render(src, max_w=None, max_h=None, quality=JPEG_QUALITY):
+    """
+    書き出し用ワーカー：元画像（bytes またはパス）を max_w × max_h に収まるよう
+    縮小（拡大はしない）して再エンコードした bytes を返す。
+    max_w/max_h が None なら原寸のまま向きだけ補正。
+    """
+    img = _decode(src, max_w, max_h)
+    if max_w and max_h:
+        img.thumbnail((max_w, max_h), Image.LANCZOS)   # thumbnail は拡大しない
+    data = _encode(img, quality)
+    img.close()
+    return data
+
+
+def rendition_path(cache_dir, digest, max_w, max_h, quality=JPEG_QUALITY):
+    """書き出し用画像のディスクキャッシュ上のパス（元画像・ピクセル枠・品質で決まる）。"""
+    return Path(cache_dir) / digest[:2] / f"{digest}-{max_w or 0}x{max_h or 0}-q{quality}"
+
+
+def _keep_rendition(path, fut):
+    # エンコード結果をディスクキャッシュに置く（一時ファイル経由で置き換え）
+    if fut.cancelled() or fut.exception() is not None:
+        return
+    try:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = path.with_name(f".{path.name}.{uuid4().hex}")   # 複数プロセスでも重ならない名前
+        tmp.write_bytes(fut.result())
+        os.replace(tmp, path)
+    except OSError:
+        pass
+
+
+def submit_rendition(rec, box_w, box_h, dpi=None, quality=JPEG_QUALITY, cache=None,
+                     cache_dir=None):
+    """
+    配置枠（box_w × box_h, EMU）用の画像をプールでエンコードし、bytes の Future を返す。
+    透過が必要な画像のみ PNG、それ以外は JPEG。
+    dpi を渡すと rendition_box() の枠（長辺を RENDITION_STEP px 単位に切り上げ）に縮小する。
+    dpi=None なら元画像のまま（向き補正が必要な場合のみ原寸で再エンコード）。
+    cache に dict を渡すと (hash, 幅, 高さ) 単位で結果を再利用する。
+    cache_dir を渡すと結果をディスクにも置き、次回以降の書き出しで再利用する
+    （同じ画像・同じピクセル枠なら再エンコードしない）。
+    同一バイト列の画像は python-pptx が 1 つの画像パートにまとめる。
+    """
+    if dpi is None:
+        if rec.get("orientation", 1) == 1:
+            fut = Future()
+            fut.set_result(read_source(source(rec)))
+            return fut
+        max_w = max_h = None
+    else:
+        max_w, max_h = rendition_box(box_w, box_h, dpi)
+
+    ck = (rec["hash"], max_w, max_h)
+    if cache is not None and ck in cache:
+        return cache[ck]
+    path = rendition_path(cache_dir, *ck, quality) if cache_dir is not None else None
+    data = None
+    if path is not None:
+        try:   # 掃除・画像の削除で消えた直後なら、作り直す
+            data = path.read_bytes()
+            os.utime(path)   # 最後に使った時刻（store.sweep_renditions() の LRU 用）
+        except OSError:
+            pass
+    if data is not None:
+        fut = Future()
+        fut.set_result(data)
+    else:
+        fut = get_pool().submit(render, source(rec), max_w, max_h, quality)
+        if path is not None:
+            fut.add_done_callback(partial(_keep_rendition, path))
+    if cache is not None:
+        cache[ck] = fut
+    return fut
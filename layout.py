@@ -0,0 +1,146 @@
+# layout.py
+# スライド上の画像の配置計算（EMU 単位）。python-pptx に依存しないので、
+# アプリの起動時やプレビューの描画からも軽く使える。
+
+EMU_PER_INCH = 914400
+
+# 1スライドあたりの画像枚数 → (列数, 行数)
+GRID_LAYOUTS = {6: (3, 2), 9: (3, 3)}
+
+# 画像スライドの配置方式 → 表示名
+#   grid      : 列数 × 行数の同じ大きさのセルに 1 枚ずつ収める（従来どおり）
+#   justified : 縦横比に合わせて行ごとに横幅いっぱいに並べる（縦長の画像が多いほど枚数が減る）
+LAYOUT_MODES = {"grid": "固定グリッド", "justified": "縦横比に合わせて詰める"}
+MIN_ROW_SCALE = 0.85   # justified：1 行多く入れるために行を縮めてよい下限
+
+
+def inches(x):
+    """インチ → EMU（pptx.util.Inches と同じ値）。"""
+    return int(x * EMU_PER_INCH)
+
+
+SLIDE_W = inches(13.333)
+SLIDE_H = inches(7.5)
+
+
+def _image_area(slide_w, slide_h):
+    """画像スライドで画像を置ける範囲 (左, 上, 幅, 高さ) と画像の間隔（EMU）。"""
+    return inches(0.5), inches(1.5), slide_w - inches(1), slide_h - inches(1.5), inches(0.2)
+
+
+def grid_cells(slide_w, slide_h, cols, rows):
+    """画像グリッドの各セル (x, y, 幅, 高さ) を左上から行順に返す（EMU）。"""
+    left_m, top_m, usable_w, usable_h, gap = _image_area(slide_w, slide_h)
+    gap_w, gap_h = gap, gap
+    cell_w = (usable_w - gap_w*(cols-1)) / cols
+    cell_h = (usable_h - gap_h*(rows-1)) / rows
+    cells = []
+    for idx in range(cols * rows):
+        r, c = divmod(idx, cols)
+        x = left_m + c*(cell_w+gap_w)
+        y = top_m + r*(cell_h+gap_h)
+        cells.append((x, y, cell_w, cell_h))
+    return cells
+
+
+def fit_in_cell(size, x, y, cell_w, cell_h):
+    """縦横比を保ってセルに収め、中央寄せした (x, y, 幅, 高さ) を返す。"""
+    ow, oh = size
+    ratio, cell_ratio = ow/oh, cell_w/cell_h
+    if ratio > cell_ratio:
+        pw, ph = cell_w, cell_w/ratio
+    else:
+        ph, pw = cell_h, cell_h*ratio
+    px = x + (cell_w-pw)/2
+    py = y + (cell_h-ph)/2
+    return px, py, pw, ph
+
+
+def thumb_box(size, slide_w, slide_h):
+    """サムネイルスライドの画像の (x, y, 幅, 高さ)：幅をスライドの 60% にして中央に置く。"""
+    ow, oh = size
+    pic_w = slide_w * 0.6
+    pic_h = pic_w * oh / ow
+    left  = (slide_w - pic_w) / 2
+    top   = (slide_h - pic_h) / 2 + inches(0.2)
+    return left, top, pic_w, pic_h
+
+
+def image_pages(sizes, cols, rows, slide_w, slide_h, mode="grid"):
+    """
+    1 カテゴリの画像（向き補正後のサイズのリスト、並び順どおり）をスライドに割り付け、
+    スライドごとに [(画像の添字, x, y, 幅, 高さ), ...] のリストを返す。
+    PPTX の書き出しとプレビューで同じ配置になるよう、どちらもこれを使う。
+    mode: LAYOUT_MODES のキー。justified では cols × rows のグリッドのセルの高さを
+          行の高さの目安にする（同じ設定なら画像の見た目の大きさはグリッドと同程度）
+    """
+    if mode == "justified":
+        return justified_pages(sizes, rows, slide_w, slide_h)
+    per_slide = cols * rows
+    cells = grid_cells(slide_w, slide_h, cols, rows)
+    return [
+        [(i, *fit_in_cell(sizes[i], *cell)) for i, cell in zip(range(s, len(sizes)), cells)]
+        for s in range(0, len(sizes), per_slide)
+    ]
+
+
+def justified_pages(sizes, rows, slide_w, slide_h):
+    """
+    並び順を保ったまま、画像を行ごとに横幅いっぱいに並べる（行内の画像は同じ高さ）。
+    各行は高さが目安（rows 行のグリッドのセルの高さ）に最も近くなる枚数で区切り、
+    行を上から積んで入りきらなくなったら次のスライドへ（少し縮めれば入るなら縮める）。
+    計算量は画像の枚数に比例する。
+    戻り値は image_pages() と同じ。
+    """
+    left_m, top_m, usable_w, usable_h, gap = _image_area(slide_w, slide_h)
+    target = (usable_h - gap*(rows-1)) / rows
+    ratios = [ow/oh if oh else 1.0 for ow, oh in sizes]
+
+    def row_height(total_ratio, k):
+        # k 枚の縦横比の合計が total_ratio の行を横幅いっぱいにしたときの高さ
+        return min((usable_w - gap*(k-1)) / total_ratio, usable_h)
+
+    # 1) 行に区切る：(先頭の添字, 末尾の次の添字, 高さ)
+    lines, start, n = [], 0, len(ratios)
+    while start < n:
+        total = ratios[start]
+        stop, h = start + 1, row_height(total, 1)
+        while h > target and stop < n:
+            h_next = row_height(total + ratios[stop], stop - start + 1)
+            if target - h_next > h - target:   # 1 枚足すと目安から遠ざかる
+                break
+            total += ratios[stop]
+            stop, h = stop + 1, h_next
+        if stop == n and h > target:   # 最後の行は横に引き伸ばさない
+            h = target
+        lines.append((start, stop, h))
+        start = stop
+
+    # 2) 行をスライドに積む。少し（MIN_ROW_SCALE まで）縮めれば入る行は縮めて同じスライドへ
+    groups, group = [], []
+    for line in lines:
+        heights = [h for _, _, h in group] + [line[2]]
+        if group and sum(heights) + gap*(len(heights)-1) > usable_h + 1:   # 1 EMU は丸め誤差の分
+            if (usable_h - gap*(len(heights)-1)) / sum(heights) < MIN_ROW_SCALE:
+                groups.append(group)
+                group = []
+        group.append(line)
+    if group:
+        groups.append(group)
+
+    # 3) 各行を左右中央に置く
+    pages = []
+    for group in groups:
+        total_h = sum(h for _, _, h in group)
+        scale   = min(1.0, (usable_h - gap*(len(group)-1)) / total_h)
+        page, y = [], top_m
+        for start, stop, h in group:
+            h *= scale
+            widths = [ratios[i] * h for i in range(start, stop)]
+            x = left_m + (usable_w - sum(widths) - gap*(len(widths)-1)) / 2
+            for i, w in zip(range(start, stop), widths):
+                page.append((i, x, y, w, h))
+                x += w + gap
+            y += h + gap
+        pages.append(page)
+    return pages
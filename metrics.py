@@ -0,0 +1,168 @@
+# metrics.py
+# 取り込み・Excel / PPTX 書き出しの工程ごとの所要時間とバイト数を記録する。
+# 1 回の処理（run）ごとに工程別の集計を作り、メトリクスファイルへ書き出す。
+# Streamlit に依存しないので、バックグラウンドのジョブやバッチのワーカーからも使える。
+#
+#   run = metrics.start("pptx", images=12)
+#   with metrics.phase(run, "save"):
+#       ...
+#   metrics.finish(run)
+
+import os
+import json
+import time
+import tempfile
+import threading
+from pathlib import Path
+from collections import deque, defaultdict
+from contextlib import contextmanager
+
+# --- 設定（環境変数で変更可） ---
+# METRICS_FORMAT : "jsonl"（既定、1 回の処理を 1 行で追記）
+#                  または "prom"（Prometheus のテキスト形式で累計を書き直す。累計は
+#                  プロセス単位なので、複数プロセスでは METRICS_FILE を分ける）
+# METRICS_FILE   : 出力先（既定は OS の一時ディレクトリ配下）。空文字で書き出さない
+# METRICS_MAX_MB : jsonl のファイルの上限（既定 16 MB）。超えたら <ファイル>.1 に
+#                  置き換えて新しく書き始める（残るのは直近の 2 ファイル分）
+# METRICS_PANEL  : 1 にするとサイドバーに直近の処理時間を表示する（管理者向け、既定は表示しない。
+#                  プロセス内の全セッションの記録（ファイル名を含む）が見える）
+METRICS_FORMAT = os.environ.get("METRICS_FORMAT", "jsonl")
+METRICS_FILE   = os.environ.get(
+    "METRICS_FILE",
+    str(Path(tempfile.gettempdir()) / f"location_uploader_metrics.{METRICS_FORMAT}"),
+)
+METRICS_MAX_BYTES = int(float(os.environ.get("METRICS_MAX_MB", 16)) * 1024 * 1024)
+SHOW_PANEL  = os.environ.get("METRICS_PANEL", "") == "1"
+RECENT_RUNS = 50   # デバッグ表示用にプロセス内で覚えておく件数
+
+recent = deque(maxlen=RECENT_RUNS)
+
+# Prometheus 用の累計：(kind, phase) → [秒, バイト, 回数]、(kind, status) → 件数
+_phase_totals = defaultdict(lambda: [0.0, 0, 0])
+_run_totals   = defaultdict(int)
+_lock         = threading.Lock()
+
+
+def start(kind, **labels):
+    """処理を 1 回分開始する。labels は記録にそのまま載る（画像枚数など）。"""
+    return {"kind": kind, "labels": labels, "t0": time.perf_counter(),
+            "phases": {}, "items": [], "lock": threading.Lock()}
+
+
+def add(run, name, seconds, nbytes=0):
+    """工程 name の所要時間とバイト数を加算する（同じ工程は回数とともに合算）。"""
+    if run is None:
+        return
+    with run["lock"]:
+        p = run["phases"].setdefault(name, {"seconds": 0.0, "bytes": 0, "count": 0})
+        p["seconds"] += seconds
+        p["bytes"]   += nbytes
+        p["count"]   += 1
+
+
+@contextmanager
+def phase(run, name, nbytes=0):
+    """with ブロックの所要時間を工程 name として記録する。"""
+    t0 = time.perf_counter()
+    try:
+        yield
+    finally:
+        add(run, name, time.perf_counter() - t0, nbytes)
+
+
+def item(run, **fields):
+    """画像 1 枚ごとなど、個別の明細を記録する。"""
+    if run is not None:
+        with run["lock"]:
+            run["items"].append(fields)
+
+
+def finish(run, error=None):
+    """処理を締めて記録し、メトリクスファイルへ書き出す。記録（dict）を返す。"""
+    if run is None:
+        return None
+    entry = {
+        "ts":      round(time.time(), 3),
+        "kind":    run["kind"],
+        **run["labels"],
+        "seconds": round(time.perf_counter() - run["t0"], 4),
+        "phases":  {k: {"seconds": round(v["seconds"], 4), "bytes": v["bytes"],
+                        "count": v["count"]} for k, v in run["phases"].items()},
+        "error":   error,
+    }
+    if run["items"]:
+        entry["items"] = run["items"]
+    with _lock:
+        recent.append(entry)
+        for name, v in run["phases"].items():
+            t = _phase_totals[(run["kind"], name)]
+            t[0] += v["seconds"]
+            t[1] += v["bytes"]
+            t[2] += v["count"]
+        _run_totals[(run["kind"], "error" if error else "ok")] += 1
+        _run_totals[(run["kind"], "seconds")] += entry["seconds"]
+        try:
+            _write(entry)
+        except OSError:
+            pass   # 計測のせいで本処理を失敗させない
+    return entry
+
+
+def _write(entry):
+    # _lock を持った状態で呼ぶ
+    if not METRICS_FILE:
+        return
+    path = Path(METRICS_FILE)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    if METRICS_FORMAT == "prom":
+        tmp = path.with_name(f".{path.name}.{os.getpid()}")
+        tmp.write_text(_prometheus_text(), encoding="utf-8")
+        os.replace(tmp, path)
+    else:
+        line = json.dumps(entry, ensure_ascii=False, default=str) + "\n"
+        try:
+            if path.stat().st_size + len(line.encode("utf-8")) > METRICS_MAX_BYTES:
+                os.replace(path, path.with_name(path.name + ".1"))
+        except FileNotFoundError:
+            pass
+        with open(path, "a", encoding="utf-8") as fh:
+            fh.write(line)
+
+
+def _prometheus_text():
+    # プロセス起動からの累計（ファイルはスクレイパー／textfile collector が読む）
+    lines = [
+        "# HELP location_export_phase_seconds_total Time spent per export phase.",
+        "# TYPE location_export_phase_seconds_total counter",
+    ]
+    for (kind, name), (secs, _, _) in sorted(_phase_totals.items()):
+        lines.append(f'location_export_phase_seconds_total{{kind="{kind}",phase="{name}"}} {secs:.6f}')
+    lines += [
+        "# HELP location_export_phase_bytes_total Bytes produced per export phase.",
+        "# TYPE location_export_phase_bytes_total counter",
+    ]
+    for (kind, name), (_, nbytes, _) in sorted(_phase_totals.items()):
+        lines.append(f'location_export_phase_bytes_total{{kind="{kind}",phase="{name}"}} {nbytes}')
+    lines += [
+        "# HELP location_export_phase_count_total Number of times each phase ran.",
+        "# TYPE location_export_phase_count_total counter",
+    ]
+    for (kind, name), (_, _, count) in sorted(_phase_totals.items()):
+        lines.append(f'location_export_phase_count_total{{kind="{kind}",phase="{name}"}} {count}')
+    lines += [
+        "# HELP location_export_runs_total Finished runs by status.",
+        "# TYPE location_export_runs_total counter",
+    ]
+    kinds = sorted({kind for kind, _ in _run_totals})
+    for kind in kinds:
+        for status in ("ok", "error"):
+            lines.append(f'location_export_runs_total{{kind="{kind}",status="{status}"}} '
+                         f'{_run_totals[(kind, status)]}')
+    lines += [
+        "# HELP location_export_seconds_total Total wall time of finished runs.",
+        "# TYPE location_export_seconds_total counter",
+    ]
+    for kind in kinds:
+        lines.append(f'location_export_seconds_total{{kind="{kind}"}} '
+                     f'{_run_totals[(kind, "seconds")]:.6f}')
+    return "\n".join(lines) + "\n"
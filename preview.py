@@ -0,0 +1,208 @@
+# preview.py
+# PPTX を書き出す前の確認用に、各スライドを小さなラスター画像として Pillow で描く。
+# 画像の配置は書き出しと同じ layout.py の計算（thumb_box / image_pages）を使い、
+# 画像にはレコードのプレビュー（長辺 320px）を貼る。描いたスライドは内容の指紋ごとに
+# キャッシュするので、1 スライドあたりの枚数や資料出力を切り替えても
+# 変わったスライドだけ描き直す。Streamlit・python-pptx には依存しない。
+
+import io
+import os
+import hashlib
+import threading
+from pathlib import Path
+from functools import lru_cache
+from collections import OrderedDict
+
+from PIL import Image, ImageDraw, ImageFont
+
+import imaging
+from categories import CATEGORIES
+from layout import GRID_LAYOUTS, SLIDE_W, SLIDE_H, inches, thumb_box, image_pages
+
+# --- 設定（環境変数で変更可） ---
+# DECK_PREVIEW_WIDTH : プレビュー 1 枚の幅（px、既定 480）
+# DECK_PREVIEW_CACHE : キャッシュしておくスライド数（既定 512、1 枚 20〜40 KB 程度）
+# DECK_PREVIEW_FONT  : 日本語を描くフォントファイル（未指定なら一般的な場所から探し、
+#                      見つからなければ文字の位置を灰色の帯で示す）
+PREVIEW_WIDTH = int(os.environ.get("DECK_PREVIEW_WIDTH", 480))
+CACHE_SLIDES  = int(os.environ.get("DECK_PREVIEW_CACHE", 512))
+FONT_PATH     = os.environ.get("DECK_PREVIEW_FONT", "")
+
+FONT_DIRS  = ["/usr/share/fonts", "/usr/local/share/fonts", "/System/Library/Fonts",
+              "/Library/Fonts", "C:/Windows/Fonts"]
+FONT_NAMES = ["NotoSansCJK-Regular.ttc", "NotoSansJP-Regular.otf", "NotoSansJP-Regular.ttf",
+              "ipaexg.ttf", "ipag.ttf", "YuGothM.ttc", "yugothic.ttf", "meiryo.ttc",
+              "msgothic.ttc", "ヒラギノ角ゴシック W3.ttc"]
+
+PREVIEW_QUALITY = 80
+BACKGROUND = (255, 255, 255)
+TEXT_COLOR = (40, 40, 40)
+BAR_COLOR  = (200, 200, 200)   # フォントがないときの文字の代わり
+EMPTY_CELL = (240, 240, 240)   # プレビューが読めない画像の代わり
+
+_cache = OrderedDict()   # 指紋 → JPEG bytes
+_lock  = threading.Lock()
+
+
+@lru_cache(maxsize=1)
+def _font_file():
+    if FONT_PATH:
+        return FONT_PATH
+    for folder in FONT_DIRS:
+        if not os.path.isdir(folder):
+            continue
+        for name in FONT_NAMES:
+            found = next(Path(folder).rglob(name), None)
+            if found is not None:
+                return str(found)
+    return None
+
+
+@lru_cache(maxsize=16)
+def _font(px):
+    path = _font_file()
+    return ImageFont.truetype(path, px) if path else None
+
+
+def _scale(width):
+    return width / SLIDE_W
+
+
+def _text(draw, text, x, y, w, h, scale, pt, align="left"):
+    """枠 (x, y, w, h)（EMU）の上端に pt ポイントの文字を描く（フォントがなければ帯）。"""
+    text = str(text or "")
+    if not text:
+        return
+    px = max(6, round(pt / 72 * inches(1) * scale))
+    font = _font(px)
+    if font is not None:
+        tw = draw.textlength(text, font=font)
+    else:
+        tw = min(w * scale, px * len(text) * 0.9)
+    left = x * scale + {"left": 0, "center": (w * scale - tw) / 2}[align]
+    top  = y * scale + px * 0.3
+    if font is not None:
+        draw.text((left, top), text, font=font, fill=TEXT_COLOR)
+    else:
+        draw.rectangle((left, top, left + tw, top + px * 0.8), fill=BAR_COLOR)
+
+
+def _paste(canvas, rec, x, y, w, h, scale):
+    """レコードのプレビューを枠 (x, y, w, h)（EMU）に合わせて貼る。"""
+    box = (round(x * scale), round(y * scale),
+           max(1, round(w * scale)), max(1, round(h * scale)))
+    src = rec.get("preview")
+    try:
+        if src is None:   # プレビューなし（バッチなど）は元画像から縮小
+            src = imaging.render(imaging.source(rec), box[2], box[3])
+        with Image.open(io.BytesIO(src) if isinstance(src, (bytes, bytearray)) else src) as img:
+            pic = img.convert("RGB").resize(box[2:], Image.BILINEAR)
+        canvas.paste(pic, box[:2])
+    except (OSError, ValueError):
+        ImageDraw.Draw(canvas).rectangle(
+            (box[0], box[1], box[0] + box[2], box[1] + box[3]), fill=EMPTY_CELL)
+
+
+def _encode(canvas):
+    buf = io.BytesIO()
+    canvas.save(buf, "JPEG", quality=PREVIEW_QUALITY)
+    return buf.getvalue()
+
+
+# --- スライドごとの描画（deck.build_pptx() と同じ位置・大きさ） ---
+
+def _thumb_slide(location_name, thumb, width):
+    scale  = _scale(width)
+    canvas = Image.new("RGB", (width, round(SLIDE_H * scale)), BACKGROUND)
+    draw   = ImageDraw.Draw(canvas)
+    _text(draw, location_name, (SLIDE_W - inches(10)) / 2, inches(0.2), inches(10),
+          inches(0.6), scale, 24, "center")
+    if thumb is not None:
+        _paste(canvas, thumb, *thumb_box(thumb["size"], SLIDE_W, SLIDE_H), scale)
+    return _encode(canvas)
+
+
+def _meta_slide(fields, width):
+    scale  = _scale(width)
+    canvas = Image.new("RGB", (width, round(SLIDE_H * scale)), BACKGROUND)
+    draw   = ImageDraw.Draw(canvas)
+    _text(draw, "ロケ地情報", (SLIDE_W - inches(10)) / 2, inches(0.2), inches(10),
+          inches(0.6), scale, 24, "center")
+    # deck.add_fields_table() と同じ寸法の左右 2 組の表
+    mid      = len(fields) // 2
+    margin_x = inches(0.7)
+    half_w   = (SLIDE_W - margin_x * 2) / 2
+    row_h    = inches(0.3)
+    for x0, label_w, part in ((margin_x, inches(2.0), fields[:mid]),
+                              (margin_x + half_w, inches(1.8), fields[mid:])):
+        for r, (label, val) in enumerate(part):
+            y = inches(1.0) + r * row_h
+            _text(draw, label, x0, y, label_w, row_h, scale, 10)
+            _text(draw, val, x0 + label_w, y, half_w - label_w, row_h, scale, 10)
+    return _encode(canvas)
+
+
+def _image_slide(location_name, label, recs, page, width):
+    scale  = _scale(width)
+    canvas = Image.new("RGB", (width, round(SLIDE_H * scale)), BACKGROUND)
+    draw   = ImageDraw.Draw(canvas)
+    _text(draw, label, inches(0.5), inches(0.3), inches(3), inches(0.5), scale, 20)
+    _text(draw, location_name, (SLIDE_W - inches(10)) / 2, inches(0.3), inches(10),
+          inches(0.5), scale, 20, "center")
+    for i, x, y, w, h in page:
+        _paste(canvas, recs[i], x, y, w, h, scale)
+    return _encode(canvas)
+
+
+def _cached(fingerprint, draw):
+    key = hashlib.sha256(repr(fingerprint).encode()).hexdigest()
+    with _lock:
+        if key in _cache:
+            _cache.move_to_end(key)
+            return _cache[key], True
+    data = draw()
+    with _lock:
+        _cache[key] = data
+        while len(_cache) > CACHE_SLIDES:
+            _cache.popitem(last=False)
+    return data, False
+
+
+def render_slides(record, images, per_slide=6, layout_mode="grid", width=PREVIEW_WIDTH):
+    """
+    PPTX と同じ並びのスライドのプレビューを作る。
+    record / images / per_slide / layout_mode は deck.render_deck() と同じ（images はレコードのみ）。
+    戻り値: ([(見出し, JPEG bytes), ...], 描き直したスライド数（残りはキャッシュから）)
+    """
+    cols, rows = GRID_LAYOUTS[per_slide]
+    name   = str(record.get("ロケ地名") or "")
+    fields = list(record.items())
+    thumbs = images.get("thumbs", [])[:1]
+    thumb  = thumbs[0] if thumbs else None
+
+    # 指紋：そのスライドの見た目を決めるもの（文字・画像のハッシュとサイズ・配置・幅）
+    jobs = [
+        ("サムネイル", ("thumb", name, thumb and (thumb["hash"], tuple(thumb["size"])), width),
+         lambda: _thumb_slide(name, thumb, width)),
+        ("ロケ地情報", ("meta", fields, width),
+         lambda: _meta_slide(fields, width)),
+    ]
+    for label, key, _ in CATEGORIES:
+        recs = images.get(key, []) if key != "thumbs" else []
+        if not recs:
+            continue
+        pages = image_pages([r["size"] for r in recs], cols, rows, SLIDE_W, SLIDE_H, layout_mode)
+        for n, page in enumerate(pages, 1):
+            fp = ("image", name, label, width,
+                  tuple((recs[i]["hash"], round(x), round(y), round(w), round(h))
+                        for i, x, y, w, h in page))
+            title = f"{label} {n}/{len(pages)}" if len(pages) > 1 else label
+            jobs.append((title, fp, lambda recs=recs, page=page, label=label:
+                         _image_slide(name, label, recs, page, width)))
+
+    slides, drawn = [], 0
+    for title, fp, draw in jobs:
+        data, hit = _cached(fp, draw)
+        slides.append((title, data))
+        drawn += not hit
+    return slides, drawn
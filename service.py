@@ -0,0 +1,476 @@
+# service.py
+# ロケ地 PPTX を HTTP（TCP または Unix ソケット）で生成するローカルのレンダリングサービス。
+# 予約システムなどからの自動生成用。ジョブはキューに積み、決まった数のワーカーで処理する。
+#
+#   python service.py serve --port 8765 --workers 2 --queue 16 --out renders/ --image-root /srv/photos
+#   python service.py serve --socket /tmp/location_render.sock
+#   python service.py submit job.json --wait -o deck.pptx      # 手元での動作確認用クライアント
+#   python service.py status
+#
+# POST /jobs             {"record": {列名: 値}, "images": {カテゴリキー: [画像パス, ...]},
+#                         "per_slide": 6, "dpi": 150, "layout": "grid"}
+#                        images の代わりに "image_dir"（batch.py と同じフォルダ構成）でもよい
+#                        パスは --image-root（既定はカレントディレクトリ）の下に限る
+#                        → 202 {"id", "status": "queued", "queue_depth"}
+#                          キューが満杯なら 503（Retry-After 付き）、入力の誤りは 400
+# GET  /jobs/<id>        → 状態（queued / running / done / failed）と待ち時間・生成時間
+# GET  /jobs/<id>/result → 生成した PPTX（保持期限を過ぎて消えていれば 410）
+# GET  /status           → キューの深さ・実行中の数・直近のジョブの所要時間（p50 / p95）
+
+import os
+import sys
+import json
+import math
+import time
+import queue
+import socket
+import argparse
+import threading
+import http.client
+from pathlib import Path
+from uuid import uuid4
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from socketserver import ThreadingMixIn, UnixStreamServer
+
+import metrics
+from categories import CATEGORIES
+from layout import GRID_LAYOUTS, LAYOUT_MODES
+
+PPTX_MIME = "application/vnd.openxmlformats-officedocument.presentationml.presentation"
+
+# --- 設定（環境変数で変更可） ---
+# RENDER_RESULT_TTL : 生成結果とジョブ情報の保持秒数（既定 1 日）
+RESULT_TTL     = int(os.environ.get("RENDER_RESULT_TTL", 86400))
+SWEEP_EVERY    = 60    # 期限切れのジョブを掃除する間隔（秒、リクエストのたびに確認）
+DEFAULT_PORT   = 8765
+LATENCY_WINDOW = 200   # /status の p50 / p95 を計算する直近のジョブ数
+MAX_BODY       = 1024 * 1024   # リクエスト本文の上限（画像はパスで渡す）
+
+CATEGORY_KEYS = [key for _, key, _ in CATEGORIES]
+
+
+# --- ジョブの受け付けと実行 ---
+
+def new_service(out_dir, workers=2, queue_size=16, image_root=None):
+    """
+    サービスの状態を作り、ワーカースレッドを起動する。
+    image_root: 受け付ける画像パスの範囲（None ならカレントディレクトリ）
+    """
+    out_dir = Path(out_dir)
+    out_dir.mkdir(parents=True, exist_ok=True)
+    state = {
+        "out":        out_dir,
+        "image_root": Path(image_root or Path.cwd()).resolve(),
+        "queue":      queue.Queue(maxsize=queue_size),
+        "jobs":       {},
+        "lock":       threading.Lock(),
+        "workers":    workers,
+        "running":    0,
+        "done":       0,
+        "failed":     0,
+        "rejected":   0,
+        "latencies":  deque(maxlen=LATENCY_WINDOW),   # (待ち時間, 生成時間, 合計)
+        "swept":      0.0,
+    }
+    for i in range(workers):
+        threading.Thread(target=_worker, args=(state,), name=f"render-{i}", daemon=True).start()
+    return state
+
+
+def parse_job(payload, image_root=None):
+    """
+    リクエスト本文を検証して (record, {キー: [パス]}, per_slide, dpi, layout) を返す。
+    画像パスは image_root（None ならカレントディレクトリ）の下に限る。誤りは ValueError。
+    """
+    image_root = Path(image_root or Path.cwd()).resolve()
+    if not isinstance(payload, dict):
+        raise ValueError("本文は JSON オブジェクトにしてください")
+    record = payload.get("record")
+    if not isinstance(record, dict) or not record:
+        raise ValueError("record（{列名: 値}）が必要です")
+    record = {str(k): v if v is None or isinstance(v, (str, int, float, bool)) else str(v)
+              for k, v in record.items()}
+
+    if "image_dir" in payload:
+        from batch import image_sources
+        if not isinstance(payload["image_dir"], str):
+            raise ValueError("image_dir は文字列（フォルダのパス）にしてください")
+        try:
+            images = image_sources(_checked_path(payload["image_dir"], image_root))
+        except FileNotFoundError as e:
+            raise ValueError(str(e))
+    else:
+        images = payload.get("images") or {}
+        if not isinstance(images, dict):
+            raise ValueError("images は {カテゴリキー: [画像パス, ...]} にしてください")
+        unknown = sorted(set(images) - set(CATEGORY_KEYS))
+        if unknown:
+            raise ValueError(f"不明なカテゴリキー: {', '.join(unknown)}（{', '.join(CATEGORY_KEYS)}）")
+        bad = [k for k, v in images.items()
+               if not isinstance(v, list) or not all(isinstance(p, str) for p in v)]
+        if bad:
+            raise ValueError(f"images の値は画像パス（文字列）のリストにしてください: {', '.join(bad)}")
+        images = {k: [_checked_path(p, image_root) for p in v] for k, v in images.items()}
+        missing = [str(p) for paths in images.values() for p in paths if not p.is_file()]
+        if missing:
+            raise ValueError(f"画像が見つかりません: {', '.join(missing[:5])}"
+                             + (f" ほか {len(missing) - 5} 件" if len(missing) > 5 else ""))
+    images["thumbs"] = images.get("thumbs", [])[:1]
+
+    per_slide = payload.get("per_slide", 6)
+    if type(per_slide) is not int or per_slide not in GRID_LAYOUTS:
+        raise ValueError(f"per_slide は {sorted(GRID_LAYOUTS)} のいずれかにしてください")
+    dpi = payload.get("dpi", 150)
+    if dpi is not None and (type(dpi) is not int or dpi <= 0):
+        raise ValueError("dpi は正の整数か null（元画像のまま）にしてください")
+    layout_mode = payload.get("layout", "grid")
+    if not isinstance(layout_mode, str) or layout_mode not in LAYOUT_MODES:
+        raise ValueError(f"layout は {', '.join(LAYOUT_MODES)} のいずれかにしてください")
+    return record, images, per_slide, dpi, layout_mode
+
+
+def _checked_path(p, image_root):
+    path = Path(str(p)).expanduser().resolve()
+    if not path.is_relative_to(image_root):
+        raise ValueError(f"--image-root の外のパスは使えません: {p}")
+    return path
+
+
+def submit(state, payload):
+    """ジョブを検証してキューに積む。キューが満杯なら queue.Full。"""
+    record, images, per_slide, dpi, layout_mode = parse_job(payload, state["image_root"])
+    job = {
+        "id":        uuid4().hex[:16],
+        "status":    "queued",
+        "name":      str(record.get("ロケ地名") or ""),
+        "images":    sum(map(len, images.values())),
+        "created":   time.time(),
+        "started":   None,
+        "finished":  None,
+        "error":     None,
+        "bytes":     0,
+        "args":      (record, images, per_slide, dpi, layout_mode),
+    }
+    with state["lock"]:
+        state["queue"].put_nowait(job)   # 満杯なら queue.Full（呼び出し側で 503）
+        state["jobs"][job["id"]] = job
+    return job
+
+
+def _worker(state):
+    from deck import render_deck   # サービスの起動を軽くするため、最初のジョブで読み込む
+    while True:
+        job = state["queue"].get()
+        record, images, per_slide, dpi, layout_mode = job.pop("args")
+        out = state["out"] / f"{job['id']}.pptx"
+        tmp = out.with_suffix(".part")
+        with state["lock"]:
+            state["running"] += 1
+            job.update(status="running", started=time.time())
+        run = metrics.start("pptx", source="service", job=job["id"],
+                            images=job["images"], per_slide=per_slide, dpi=dpi,
+                            layout=layout_mode)
+        error = None
+        try:
+            render_deck(record, images, per_slide, dpi, out=tmp, measure=run,
+                        layout_mode=layout_mode)
+            os.replace(tmp, out)
+        except Exception as e:
+            error = f"{type(e).__name__}: {e}"
+            tmp.unlink(missing_ok=True)
+        metrics.finish(run, error)
+        with state["lock"]:
+            state["running"] -= 1
+            job["finished"] = time.time()
+            if error is None:
+                job.update(status="done", bytes=out.stat().st_size)
+                state["done"] += 1
+            else:
+                job.update(status="failed", error=error)
+                state["failed"] += 1
+            state["latencies"].append((job["started"] - job["created"],
+                                       job["finished"] - job["started"],
+                                       job["finished"] - job["created"]))
+        state["queue"].task_done()
+
+
+def job_view(job):
+    """API で返すジョブの状態。"""
+    now = time.time()
+    started, finished = job["started"], job["finished"]
+    return {
+        "id":             job["id"],
+        "status":         job["status"],
+        "name":           job["name"],
+        "images":         job["images"],
+        "queue_seconds":  round((started or now) - job["created"], 3),
+        "render_seconds": round((finished or now) - started, 3) if started else None,
+        "bytes":          job["bytes"],
+        "error":          job["error"],
+        "result":         f"/jobs/{job['id']}/result" if job["status"] == "done" else None,
+    }
+
+
+def status(state):
+    """キューの深さ・実行中の数・件数・直近のジョブの所要時間。"""
+    with state["lock"]:
+        lat = list(state["latencies"])
+        view = {
+            "queue_depth": state["queue"].qsize(),
+            "queue_limit": state["queue"].maxsize,
+            "running":     state["running"],
+            "workers":     state["workers"],
+            "done":        state["done"],
+            "failed":      state["failed"],
+            "rejected":    state["rejected"],
+        }
+    for i, name in enumerate(("queue", "render", "total")):
+        xs = sorted(x[i] for x in lat)
+        view[f"{name}_seconds"] = ({"p50": round(_percentile(xs, 50), 3),
+                                    "p95": round(_percentile(xs, 95), 3)} if xs else None)
+    return view
+
+
+def retry_after(state):
+    """キューが空くまでのおおよその秒数（503 の Retry-After 用）。"""
+    lat = [x[1] for x in list(state["latencies"])]
+    per_job = sum(lat) / len(lat) if lat else 1.0
+    return max(1, math.ceil(per_job * (state["queue"].qsize() + 1) / state["workers"]))
+
+
+def sweep(state, force=False):
+    """
+    保持期限を過ぎた完了ジョブと結果ファイルを削除する。
+    リクエストのたびに呼ばれても SWEEP_EVERY 秒に 1 回だけ走る。
+    """
+    now = time.time()
+    with state["lock"]:
+        if not force and now - state["swept"] < SWEEP_EVERY:
+            return
+        state["swept"] = now
+        old = [j for j in state["jobs"].values()
+               if j["finished"] and j["finished"] < now - RESULT_TTL]
+        for job in old:
+            del state["jobs"][job["id"]]
+            (state["out"] / f"{job['id']}.pptx").unlink(missing_ok=True)
+
+
+def _percentile(xs, q):
+    # 並べ替え済みの xs の q パーセンタイル（最近傍）
+    return xs[min(len(xs) - 1, max(0, math.ceil(q / 100 * len(xs)) - 1))]
+
+
+# --- HTTP ---
+
+class Handler(BaseHTTPRequestHandler):
+    server_version = "LocationRender/1.0"
+
+    def do_POST(self):
+        if self.path.rstrip("/") != "/jobs":
+            return self._json(404, {"error": "not found"})
+        state = self.server.state
+        sweep(state)
+        try:
+            length = int(self.headers.get("Content-Length") or 0)
+            if length < 0:
+                raise ValueError(length)
+        except ValueError:
+            return self._json(400, {"error": "Content-Length が不正です"})
+        if length > MAX_BODY:
+            return self._json(413, {"error": "本文が大きすぎます（画像はパスで渡してください）"})
+        try:
+            job = submit(state, json.loads(self.rfile.read(length) or b"null"))
+        except ValueError as e:   # json.JSONDecodeError・UnicodeDecodeError も含む
+            return self._json(400, {"error": str(e)})
+        except queue.Full:
+            with state["lock"]:
+                state["rejected"] += 1
+            return self._json(503, {"error": "キューが満杯です", **status(state)},
+                              headers={"Retry-After": str(retry_after(state))})
+        self._json(202, {"id": job["id"], "status": job["status"],
+                         "queue_depth": state["queue"].qsize()},
+                   headers={"Location": f"/jobs/{job['id']}"})
+
+    def do_GET(self):
+        state = self.server.state
+        sweep(state)
+        parts = [p for p in self.path.split("?")[0].split("/") if p]
+        if parts == ["status"]:
+            return self._json(200, status(state))
+        if len(parts) in (2, 3) and parts[0] == "jobs":
+            with state["lock"]:   # ワーカー・掃除と同時に書き換わるので、見るのはロック内で
+                job  = state["jobs"].get(parts[1])
+                view = job_view(job) if job is not None else None
+            if view is None:
+                return self._json(404, {"error": "ジョブがありません（期限切れの可能性）"})
+            if len(parts) == 2:
+                return self._json(200, view)
+            if parts[2] == "result":
+                if view["status"] != "done":
+                    return self._json(409, view)
+                return self._file(state["out"] / f"{view['id']}.pptx", PPTX_MIME,
+                                  f"{view['id']}.pptx")
+        self._json(404, {"error": "not found"})
+
+    def _json(self, code, body, headers=None):
+        data = json.dumps(body, ensure_ascii=False).encode("utf-8")
+        self.send_response(code)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(data)))
+        for k, v in (headers or {}).items():
+            self.send_header(k, v)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _file(self, path, mime, name):
+        try:
+            fh = open(path, "rb")
+        except FileNotFoundError:   # 状態を見た後に掃除で消えた
+            return self._json(410, {"error": "生成結果は保持期限を過ぎて削除されました"})
+        with fh:
+            self.send_response(200)
+            self.send_header("Content-Type", mime)
+            self.send_header("Content-Length", str(os.fstat(fh.fileno()).st_size))
+            self.send_header("Content-Disposition", f'attachment; filename="{name}"')
+            self.end_headers()
+            while chunk := fh.read(1024 * 1024):
+                self.wfile.write(chunk)
+
+    def address_string(self):
+        # Unix ソケットでは接続元アドレスがない
+        return self.client_address[0] if self.client_address else "unix"
+
+
+class UnixHTTPServer(ThreadingMixIn, UnixStreamServer):
+    daemon_threads = True
+
+    def get_request(self):
+        request, _ = super().get_request()
+        return request, ("unix", 0)
+
+
+def make_server(state, host="127.0.0.1", port=DEFAULT_PORT, socket_path=None):
+    """TCP（既定はローカルホストのみ）か Unix ソケットで待ち受けるサーバーを作る。"""
+    if socket_path:
+        Path(socket_path).unlink(missing_ok=True)
+        server = UnixHTTPServer(str(socket_path), Handler)
+    else:
+        server = ThreadingHTTPServer((host, port), Handler)
+        server.daemon_threads = True
+    server.state = state
+    return server
+
+
+# --- クライアント（手元での動作確認・連携テスト用） ---
+
+class UnixHTTPConnection(http.client.HTTPConnection):
+    def __init__(self, socket_path, timeout=60):
+        super().__init__("localhost", timeout=timeout)
+        self.socket_path = socket_path
+
+    def connect(self):
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.settimeout(self.timeout)
+        self.sock.connect(self.socket_path)
+
+
+def request(method, path, body=None, host="127.0.0.1", port=DEFAULT_PORT, socket_path=None):
+    """サービスに 1 回リクエストし、(ステータス, ヘッダー, 本文 bytes) を返す。"""
+    conn = (UnixHTTPConnection(socket_path) if socket_path
+            else http.client.HTTPConnection(host, port, timeout=60))
+    try:
+        data = json.dumps(body, ensure_ascii=False).encode("utf-8") if body is not None else None
+        conn.request(method, path, body=data,
+                     headers={"Content-Type": "application/json"} if data else {})
+        resp = conn.getresponse()
+        return resp.status, dict(resp.getheaders()), resp.read()
+    finally:
+        conn.close()
+
+
+def submit_and_wait(payload, out=None, poll=0.5, **addr):
+    """
+    ジョブを投入し（503 なら Retry-After だけ待って再送）、終わるまで状態を問い合わせる。
+    out を渡すと結果の PPTX を保存する。最後のジョブの状態を返す。
+    """
+    while True:
+        code, headers, body = request("POST", "/jobs", payload, **addr)
+        if code != 503:
+            break
+        time.sleep(float(headers.get("Retry-After", 1)))
+    info = json.loads(body)
+    if code != 202:
+        raise RuntimeError(f"{code}: {info.get('error')}")
+    while True:
+        _, _, body = request("GET", f"/jobs/{info['id']}", **addr)
+        view = json.loads(body)
+        if view["status"] in ("done", "failed"):
+            break
+        time.sleep(poll)
+    if out is not None and view["status"] == "done":
+        _, _, data = request("GET", view["result"], **addr)
+        Path(out).write_bytes(data)
+    return view
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="ロケ地 PPTX のローカルレンダリングサービス")
+    sub = ap.add_subparsers(dest="cmd", required=True)
+
+    def address(p):
+        p.add_argument("--host", default="127.0.0.1")
+        p.add_argument("--port", type=int, default=DEFAULT_PORT)
+        p.add_argument("--socket", default=None, help="TCP の代わりに使う Unix ソケットのパス")
+
+    p = sub.add_parser("serve", help="サービスを起動する")
+    address(p)
+    p.add_argument("--workers", type=int, default=2, help="同時に生成するジョブ数")
+    p.add_argument("--queue", type=int, default=16, help="待たせておけるジョブ数（超えると 503）")
+    p.add_argument("--out", default="renders", help="生成結果の保存先")
+    p.add_argument("--image-root", default=".",
+                   help="この下の画像パスだけ受け付ける（既定はカレントディレクトリ）")
+
+    p = sub.add_parser("submit", help="ジョブを投入して結果を待つ")
+    address(p)
+    p.add_argument("job", help="POST /jobs の本文（JSON ファイル）")
+    p.add_argument("-o", "--output", default=None, help="結果の PPTX の保存先")
+    p.add_argument("--no-wait", action="store_true", help="投入だけして ID を表示する")
+
+    p = sub.add_parser("status", help="キューの状態を表示する")
+    address(p)
+    args = ap.parse_args(argv)
+    addr = {"host": args.host, "port": args.port, "socket_path": args.socket}
+
+    if args.cmd == "serve":
+        state = new_service(args.out, args.workers, args.queue, args.image_root)
+        server = make_server(state, **addr)
+        where = args.socket or f"http://{args.host}:{args.port}"
+        print(f"待ち受け中: {where}  ワーカー {args.workers}  キュー {args.queue}", flush=True)
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.server_close()
+        return 0
+
+    if args.cmd == "status":
+        _, _, body = request("GET", "/status", **addr)
+        print(json.dumps(json.loads(body), ensure_ascii=False, indent=2))
+        return 0
+
+    payload = json.loads(Path(args.job).read_text(encoding="utf-8"))
+    if args.no_wait:
+        code, _, body = request("POST", "/jobs", payload, **addr)
+        print(code, body.decode("utf-8"))
+        return 0 if code == 202 else 1
+    t0 = time.perf_counter()
+    view = submit_and_wait(payload, out=args.output, **addr)
+    print(json.dumps(view, ensure_ascii=False, indent=2))
+    print(f"投入から完了まで {time.perf_counter() - t0:.2f} s")
+    return 0 if view["status"] == "done" else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
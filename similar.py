@@ -0,0 +1,78 @@
+# similar.py
+# 連写などのほぼ同じ写真を見つける。
+# 取り込み時にプレビューから 64bit の dHash（知覚ハッシュ）と鮮鋭度を計算しておき、
+# ハミング距離はビットを詰めた uint64 の XOR とビット数えで NumPy 上でまとめて求める。
+
+import numpy as np
+from PIL import Image
+
+HASH_SIZE = 8   # dHash は (HASH_SIZE+1) × HASH_SIZE に縮めて横方向の明暗差を 64bit にする
+BLOCK     = 512   # 距離計算を何行ずつまとめるか（メモリ BLOCK × 枚数 × 8 バイト）
+
+_POPCOUNT8 = np.array([bin(i).count("1") for i in range(256)], dtype=np.uint8)
+
+
+def features(img):
+    """画像（プレビューで十分）から (dHash の 16 進文字列, 鮮鋭度) を計算する。"""
+    gray = img.convert("L")
+    small = np.asarray(gray.resize((HASH_SIZE + 1, HASH_SIZE), Image.BILINEAR), dtype=np.int16)
+    bits = (small[:, 1:] > small[:, :-1]).ravel()
+    phash = np.packbits(bits).tobytes().hex()
+
+    # 鮮鋭度：ラプラシアンの分散（ピンぼけ・手ぶれほど小さい）
+    g = np.asarray(gray, dtype=np.float32)
+    if min(g.shape) < 3:
+        return phash, 0.0
+    lap = (4 * g[1:-1, 1:-1] - g[:-2, 1:-1] - g[2:, 1:-1] - g[1:-1, :-2] - g[1:-1, 2:])
+    return phash, float(lap.var())
+
+
+def _popcount(x):
+    # uint64 配列のビット数（NumPy 2 以降は組み込み、古い版は 8bit ごとの表引き）
+    if hasattr(np, "bitwise_count"):
+        return np.bitwise_count(x)
+    return _POPCOUNT8[x.view(np.uint8)].reshape(*x.shape, 8).sum(axis=-1, dtype=np.uint8)
+
+
+def clusters(phashes, threshold=6):
+    """
+    ハミング距離が threshold 以下でつながる画像をまとめ、2 枚以上のグループを
+    入力の添字のリストで返す（グループ内・グループ間とも入力順）。
+    phashes: features() の 16 進文字列のリスト
+    """
+    n = len(phashes)
+    if n < 2:
+        return []
+    h = np.array([int(p, 16) for p in phashes], dtype=np.uint64)
+
+    # 連結成分をラベルの伝播で求める。各画像のラベルは同じ成分の画像の添字で、
+    # 近い画像のうち最小のラベルを自分とラベル先へ写し、ラベルをたどって縮める
+    # （ポインタジャンプ）のを、どこも変わらなくなるまで繰り返す。どれもブロック単位の配列演算
+    labels  = np.arange(n)
+    changed = True
+    while changed:
+        changed = False
+        for s in range(0, n, BLOCK):
+            near = _popcount(h[s:s + BLOCK, None] ^ h[None, :]) <= threshold
+            low  = np.where(near, labels[None, :], n).min(axis=1)
+            own  = labels[s:s + BLOCK].copy()
+            hook = low < own
+            if hook.any():
+                changed = True
+                np.minimum.at(labels, own[hook], low[hook])
+                np.minimum(labels[s:s + BLOCK], low, out=labels[s:s + BLOCK])
+        while True:
+            jumped = labels[labels]
+            if np.array_equal(jumped, labels):
+                break
+            labels = jumped
+
+    groups = {}
+    for i, label in enumerate(labels.tolist()):
+        groups.setdefault(label, []).append(i)
+    return [g for g in groups.values() if len(g) > 1]
+
+
+def best_of(group, scores):
+    """グループ（添字のリスト）のうち score が最大のもの（同点なら先のもの）。"""
+    return max(group, key=lambda i: (scores[i], -i))
@@ -0,0 +1,375 @@
+# store.py
+# プロジェクト（ロケ地 1 件分の入力・画像・一覧）を永続化するローカルストア。
+# メタデータは SQLite、画像とその派生物（プレビューなど）は内容ハッシュで
+# 名前を付けたファイルに置く。複数のサーバープロセスから同時に使える。
+
+import os
+import json
+import time
+import sqlite3
+import threading
+from pathlib import Path
+from uuid import uuid4
+
+# --- 設定（環境変数で変更可） ---
+# PROJECT_STORE      : ストアのディレクトリ（既定は ~/.location_uploader）
+# RENDITION_MAX_MB   : 書き出し用画像のキャッシュの上限（既定 2048 MB、超えたら古いものから削除）
+# RENDITION_TTL_DAYS : 書き出し用画像を使われないまま残す日数（既定 30 日）
+STORE_DIR = Path(os.environ.get("PROJECT_STORE", Path.home() / ".location_uploader"))
+DB_PATH   = STORE_DIR / "projects.sqlite3"
+BLOB_DIR  = STORE_DIR / "blobs"
+# 書き出し用に縮小・再エンコードした画像（imaging.rendition_path() の置き場所）
+RENDITION_DIR    = BLOB_DIR / "rendition"
+RENDITION_BUDGET = int(os.environ.get("RENDITION_MAX_MB", 2048)) * 1024 * 1024
+RENDITION_TTL    = float(os.environ.get("RENDITION_TTL_DAYS", 30)) * 86400
+RENDITION_SWEEP_EVERY = 600   # 掃除の最短間隔(秒)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS projects (
+    id       TEXT PRIMARY KEY,
+    created  REAL NOT NULL,
+    updated  REAL NOT NULL,
+    draft    TEXT NOT NULL DEFAULT '{}'          -- 入力フォームの内容（JSON）
+);
+CREATE TABLE IF NOT EXISTS images (
+    hash        TEXT PRIMARY KEY,               -- 元画像の SHA-256
+    width       INTEGER NOT NULL,
+    height      INTEGER NOT NULL,
+    format      TEXT,
+    orientation INTEGER NOT NULL DEFAULT 1,
+    bytes       INTEGER NOT NULL,
+    phash       TEXT,                           -- 近似重複の検出用（similar.features()）
+    sharpness   REAL
+);
+CREATE TABLE IF NOT EXISTS gallery (
+    project  TEXT NOT NULL REFERENCES projects(id) ON DELETE CASCADE,
+    category TEXT NOT NULL,
+    hash     TEXT NOT NULL REFERENCES images(hash),
+    name     TEXT NOT NULL,                     -- アップロード時のファイル名
+    position INTEGER NOT NULL,                  -- カテゴリ内の並び順
+    include  INTEGER NOT NULL DEFAULT 1,        -- 資料出力する/しない
+    PRIMARY KEY (project, category, hash)
+);
+CREATE INDEX IF NOT EXISTS gallery_order ON gallery (project, category, position);
+CREATE INDEX IF NOT EXISTS gallery_hash  ON gallery (hash);
+CREATE TABLE IF NOT EXISTS locations (
+    project  TEXT NOT NULL REFERENCES projects(id) ON DELETE CASCADE,
+    name     TEXT NOT NULL,                     -- ロケ地名
+    position INTEGER NOT NULL,
+    record   TEXT NOT NULL,                     -- Excel の 1 行分（JSON）
+    thumbs   TEXT NOT NULL DEFAULT '{}',        -- {カテゴリ名: サムネイルのハッシュ}
+    PRIMARY KEY (project, name)
+);
+"""
+
+_local       = threading.local()
+_schema_done = False
+_schema_lock = threading.Lock()
+
+_last_rendition_sweep = 0.0
+_rendition_lock       = threading.Lock()
+
+
+def connect():
+    """スレッドごとに 1 本の接続を使い回す（WAL で複数プロセスから同時アクセス可）。"""
+    global _schema_done
+    conn = getattr(_local, "conn", None)
+    if conn is None:
+        STORE_DIR.mkdir(parents=True, exist_ok=True)
+        conn = sqlite3.connect(DB_PATH, timeout=30, isolation_level=None)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA foreign_keys=ON")
+        _local.conn = conn
+    with _schema_lock:
+        if not _schema_done:
+            conn.executescript(SCHEMA)
+            _migrate(conn)
+            _schema_done = True
+    return conn
+
+
+def _migrate(conn):
+    # 後から増えた列を古いデータベースに足す
+    cols = {row[1] for row in conn.execute("PRAGMA table_info(images)")}
+    for name, decl in (("phash", "TEXT"), ("sharpness", "REAL")):
+        if name not in cols:
+            conn.execute(f"ALTER TABLE images ADD COLUMN {name} {decl}")
+
+
+# --- ブロブ（内容アドレスのファイル） ---
+
+def blob_path(digest, kind="orig"):
+    """kind ごと（元画像 orig / プレビュー preview / 一覧用サムネイル thumb）のパス。"""
+    return BLOB_DIR / kind / digest[:2] / digest
+
+
+def put_blob(data, digest, kind="orig"):
+    """ブロブを書き込む。同じハッシュが既にあれば何もしない（一時ファイル経由で置き換え）。"""
+    path = blob_path(digest, kind)
+    if not path.exists():
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = path.with_name(f".{digest}.{uuid4().hex}")
+        tmp.write_bytes(data)
+        os.replace(tmp, path)
+    return path
+
+
+# --- プロジェクト ---
+
+def new_project():
+    """空のプロジェクトを作って ID を返す。"""
+    pid = uuid4().hex[:12]
+    now = time.time()
+    connect().execute("INSERT INTO projects (id, created, updated) VALUES (?, ?, ?)",
+                      (pid, now, now))
+    return pid
+
+
+def project_exists(pid):
+    row = connect().execute("SELECT 1 FROM projects WHERE id = ?", (pid,)).fetchone()
+    return row is not None
+
+
+def load_draft(pid):
+    """入力フォームの内容を返す（未保存なら空の dict）。"""
+    row = connect().execute("SELECT draft FROM projects WHERE id = ?", (pid,)).fetchone()
+    return json.loads(row[0]) if row else {}
+
+
+def save_draft(pid, record):
+    connect().execute("UPDATE projects SET draft = ?, updated = ? WHERE id = ?",
+                      (json.dumps(record, ensure_ascii=False, default=str), time.time(), pid))
+
+
+# --- 画像 ---
+
+# image_record() が受け取る列の並び
+IMAGE_COLUMNS = "hash, width, height, format, orientation, phash, sharpness"
+
+
+def image_record(row):
+    """images テーブルの行を imaging のレコード形式（元バイトの代わりに path）にする。"""
+    digest, w, h, fmt, orientation, phash, sharpness = row
+    return {
+        "hash":        digest,
+        "size":        (w, h),
+        "format":      fmt,
+        "orientation": orientation,
+        "phash":       phash,
+        "sharpness":   sharpness,
+        "path":        str(blob_path(digest)),
+        "preview":     str(blob_path(digest, "preview")),
+    }
+
+
+def _put_blobs(rec):
+    put_blob(rec["raw"], rec["hash"])
+    if rec.get("preview"):
+        put_blob(rec["preview"], rec["hash"], "preview")
+
+
+def put_images(pid, category, recs, items):
+    """
+    imaging.make_record() のレコード（recs）をストアに書き込み、(ハッシュ, ファイル名)
+    （items）をカテゴリの末尾に追加する（既にあるものは無視）。
+    画像の行・ギャラリーの行の追加とブロブの確認を 1 つの書き込みトランザクションで行うので、
+    別のプロジェクトの release_images() が間に入って行やブロブを消すことはない。
+    items のハッシュは recs にあるか、既にストアにあること（なければ sqlite3.IntegrityError）。
+    戻り値: recs の {ハッシュ: 元バイトとプレビューを持たない（path を持つ）レコード}
+    """
+    for rec in recs:   # 大きな書き込みはロックの外で済ませておく
+        _put_blobs(rec)
+    conn = connect()
+    with conn:
+        conn.execute("BEGIN IMMEDIATE")
+        conn.executemany(
+            "INSERT OR IGNORE INTO images (bytes, " + IMAGE_COLUMNS + ") "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+            [(len(rec["raw"]), rec["hash"], rec["size"][0], rec["size"][1], rec["format"],
+              rec.get("orientation", 1), rec.get("phash"), rec.get("sharpness"))
+             for rec in recs])
+        (pos,) = conn.execute(
+            "SELECT COALESCE(MAX(position), 0) FROM gallery WHERE project = ? AND category = ?",
+            (pid, category)).fetchone()
+        conn.executemany("INSERT OR IGNORE INTO gallery VALUES (?, ?, ?, ?, ?, 1)",
+                         [(pid, category, digest, name, pos + i)
+                          for i, (digest, name) in enumerate(items, 1)])
+        for rec in recs:   # トランザクションの前に消されていたら書き直す
+            _put_blobs(rec)
+    return get_images(rec["hash"] for rec in recs)
+
+
+def get_images(digests):
+    """ハッシュのリストから {ハッシュ: レコード} を返す。"""
+    digests = list(digests)
+    out = {}
+    conn = connect()
+    for i in range(0, len(digests), 500):   # SQLite の変数上限を避けて分割
+        part = digests[i:i + 500]
+        q = f"SELECT {IMAGE_COLUMNS} FROM images WHERE hash IN ({','.join('?' * len(part))})"
+        for row in conn.execute(q, part):
+            out[row[0]] = image_record(row)
+    return out
+
+
+def set_features(digest, phash, sharpness):
+    """近似重複の検出用の値を後から書き込む（取り込み時に計算していなかった画像）。"""
+    connect().execute("UPDATE images SET phash = ?, sharpness = ? WHERE hash = ?",
+                      (phash, sharpness, digest))
+
+
+def release_images(digests):
+    """どのプロジェクトからも参照されなくなった画像の行とブロブを削除する。"""
+    conn = connect()
+    with conn:
+        # 参照の確認・行の削除・ブロブの削除を 1 つの書き込みトランザクションで行い、
+        # 同じ画像を追加する put_images() と入れ違わないようにする
+        conn.execute("BEGIN IMMEDIATE")
+        for digest in dict.fromkeys(digests):
+            cur = conn.execute(
+                "DELETE FROM images WHERE hash = ? "
+                "AND NOT EXISTS (SELECT 1 FROM gallery WHERE hash = ?)", (digest, digest))
+            if not cur.rowcount:
+                continue
+            for kind in ("orig", "preview"):
+                blob_path(digest, kind).unlink(missing_ok=True)
+            for p in (RENDITION_DIR / digest[:2]).glob(f"{digest}-*"):
+                p.unlink(missing_ok=True)
+
+
+def sweep_renditions(force=False):
+    """
+    書き出し用画像のキャッシュを掃除する。RENDITION_TTL より長く使われていないものを消し、
+    残りが RENDITION_BUDGET を超えていれば最後に使った時刻（mtime、キャッシュから
+    読むたびに更新）の古い順に消す。呼ばれても RENDITION_SWEEP_EVERY 秒に 1 回だけ走る。
+    戻り値: (削除したファイル数, 残りの合計バイト数)。走らなかったときは None
+    """
+    global _last_rendition_sweep
+    now = time.time()
+    with _rendition_lock:
+        if not force and now - _last_rendition_sweep < RENDITION_SWEEP_EVERY:
+            return None
+        _last_rendition_sweep = now
+    if not RENDITION_DIR.is_dir():
+        return 0, 0
+    files = []   # (mtime, サイズ, パス)
+    for d in RENDITION_DIR.iterdir():
+        if not d.is_dir():
+            continue
+        for entry in os.scandir(d):
+            try:
+                st = entry.stat()
+            except OSError:
+                continue
+            files.append((st.st_mtime, st.st_size, entry.path))
+    files.sort()
+    total   = sum(size for _, size, _ in files)
+    removed = 0
+    for mtime, size, path in files:
+        if now - mtime < RENDITION_TTL and total <= RENDITION_BUDGET:
+            break
+        try:
+            os.unlink(path)
+        except OSError:
+            continue
+        total   -= size
+        removed += 1
+    return removed, total
+
+
+# --- ギャラリー（カテゴリごとの画像の並び・資料出力フラグ） ---
+
+def load_gallery(pid, category):
+    """並び順の (ハッシュ, ファイル名, 資料出力) のリストを返す。"""
+    rows = connect().execute(
+        "SELECT hash, name, include FROM gallery WHERE project = ? AND category = ? "
+        "ORDER BY position", (pid, category)).fetchall()
+    return [(h, n, bool(i)) for h, n, i in rows]
+
+
+def set_included(pid, category, flags):
+    """{ハッシュ: 資料出力} をまとめて更新する。"""
+    conn = connect()
+    with conn:
+        conn.execute("BEGIN IMMEDIATE")
+        conn.executemany(
+            "UPDATE gallery SET include = ? WHERE project = ? AND category = ? AND hash = ?",
+            [(int(v), pid, category, h) for h, v in flags.items()])
+
+
+def reorder_gallery(pid, category, order):
+    """カテゴリ内の並び順を order（ハッシュのリスト）どおりに書き直す。"""
+    conn = connect()
+    with conn:
+        conn.execute("BEGIN IMMEDIATE")
+        conn.executemany(
+            "UPDATE gallery SET position = ? WHERE project = ? AND category = ? AND hash = ?",
+            [(i, pid, category, h) for i, h in enumerate(order, 1)])
+
+
+def move_in_gallery(pid, src, dst, digests):
+    """src から dst の末尾へ移す（ファイル名・資料出力は引き継ぎ、dst に既にあれば src から外すだけ）。"""
+    conn = connect()
+    with conn:
+        conn.execute("BEGIN IMMEDIATE")
+        (pos,) = conn.execute(
+            "SELECT COALESCE(MAX(position), 0) FROM gallery WHERE project = ? AND category = ?",
+            (pid, dst)).fetchone()
+        for i, h in enumerate(digests, 1):
+            conn.execute(
+                "INSERT OR IGNORE INTO gallery SELECT project, ?, hash, name, ?, include "
+                "FROM gallery WHERE project = ? AND category = ? AND hash = ?",
+                (dst, pos + i, pid, src, h))
+        conn.executemany(
+            "DELETE FROM gallery WHERE project = ? AND category = ? AND hash = ?",
+            [(pid, src, h) for h in digests])
+
+
+def remove_from_gallery(pid, category, digests):
+    """ギャラリーから外し、参照のなくなった画像は削除する。"""
+    digests = list(digests)
+    conn = connect()
+    with conn:
+        conn.execute("BEGIN IMMEDIATE")
+        conn.executemany(
+            "DELETE FROM gallery WHERE project = ? AND category = ? AND hash = ?",
+            [(pid, category, h) for h in digests])
+    release_images(digests)
+
+
+# --- ロケ地一覧（Excel 一括出力用） ---
+
+def load_locations(pid):
+    """{ロケ地名: {"record": ..., "thumbs": {カテゴリ名: サムネイルのパス}}} を返す。"""
+    rows = connect().execute(
+        "SELECT name, record, thumbs FROM locations WHERE project = ? ORDER BY position",
+        (pid,)).fetchall()
+    return {
+        name: {"record": json.loads(rec),
+               "thumbs": {k: str(blob_path(d, "thumb")) for k, d in json.loads(th).items()}}
+        for name, rec, th in rows
+    }
+
+
+def save_location(pid, name, record, thumbs):
+    """
+    一覧に追加（同名は上書き）。thumbs は {カテゴリ名: (ハッシュ, サムネイル bytes)}。
+    """
+    for digest, data in thumbs.values():
+        put_blob(data, digest, "thumb")
+    conn = connect()
+    with conn:
+        conn.execute("BEGIN IMMEDIATE")
+        (pos,) = conn.execute(
+            "SELECT COALESCE(MAX(position), 0) FROM locations WHERE project = ?",
+            (pid,)).fetchone()
+        conn.execute(
+            "INSERT INTO locations VALUES (?, ?, ?, ?, ?) "
+            "ON CONFLICT (project, name) DO UPDATE SET record = excluded.record, "
+            "thumbs = excluded.thumbs",
+            (pid, name, pos + 1, json.dumps(record, ensure_ascii=False, default=str),
+             json.dumps({k: d for k, (d, _) in thumbs.items()})))
+
+
+def clear_locations(pid):
+    connect().execute("DELETE FROM locations WHERE project = ?", (pid,))
@@ -1,52 +1,33 @@
 # app.py
 
 import streamlit as st
-import streamlit.components.v1 as components
-import pandas as pd
-import io
-from pptx import Presentation
-from pptx.util import Inches, Pt
-from pptx.enum.text import PP_ALIGN
-from PIL import Image
+import sqlite3
+import hashlib
 import datetime
 from uuid import uuid4
-from pptx.enum.shapes import MSO_SHAPE
-from pptx.dml.color import RGBColor
+from pathlib import Path, PurePosixPath
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+
+import artifacts
+import buffers
+import gallery
+import metrics
+import store
+from categories import CATEGORIES
+from layout import GRID_LAYOUTS, LAYOUT_MODES
+# 書き出し・画像処理の依存（python-pptx / openpyxl / Pillow / NumPy）は、
+# フォームを入力するだけのセッションでは読み込まない。各モジュール（deck / excel_export /
+# imaging / similar / archive）は初めて使う処理の中で import し、以後は sys.modules から再利用される
 
 st.set_page_config(page_title="Location Uploader & PPTX Export", layout="wide")
 
 
-# --- 追加：JSで画面幅をクエリにセット ---
-components.html(
-     """
-    <script>
-      const w = window.innerWidth;
-      const url = new URL(window.location);
-      // すでに同じ値ならリロードしない
-      if (url.searchParams.get('screen_width') != w) {
-        url.searchParams.set('screen_width', w);
-        window.location.search = url.searchParams.toString();
-      }
-    </script>
-    """,
-    height=0,
-)
-
-# 画面幅に応じたプレビュー列数の設定（3段階レスポンシブ）
-# 画面幅読み込み
-screen_w = int(st.query_params.get("screen_width", ["0"])[0])
-
-# screen_w が 0（まだ取得前）ならPC扱い
-if screen_w == 0 or screen_w >= 1200:
-    PREVIEW_COLS = 4
-elif screen_w >= 768:
-    PREVIEW_COLS = 4
-else:
-    PREVIEW_COLS = 4
-
+# プレビュー列数は固定。画面幅への追従はブラウザ側の CSS（下記）で行い、
+# 画面幅取得のためのページ再読み込み・スクリプト再実行はしない
+PREVIEW_COLS     = 4
 PREVIEW_ROWS     = 2
 PREVIEW_PER_PAGE = PREVIEW_COLS * PREVIEW_ROWS
-PADDING          = 1
 
 # 全体のCSS調整
 st.markdown(
@@ -55,11 +36,93 @@ st.markdown(
     img {{ width:100% !important; height:auto !important; }}
     .stCheckbox label {{ font-size: 0.9em; }}
     .stDownloadButton button {{ font-size: 0.9em; padding: 0.4em 0.8em; }}
+    /* ギャラリーの列は画面幅に応じて折り返す（4列 → 2列 → 1列） */
+    [class*="st-key-gallery_"] [data-testid="stHorizontalBlock"] {{ flex-wrap: wrap; }}
+    @media (max-width: 1199px) {{
+      [class*="st-key-gallery_"] [data-testid="stColumn"] {{
+        flex: 1 1 calc(50% - 1rem) !important; min-width: calc(50% - 1rem) !important;
+      }}
+    }}
+    @media (max-width: 767px) {{
+      [class*="st-key-gallery_"] [data-testid="stColumn"] {{
+        flex: 1 1 100% !important; min-width: 100% !important;
+      }}
+    }}
     </style>
     """,
     unsafe_allow_html=True,
 )
 
+# 生成物（PPTX / Excel）はセッションごとのディレクトリに書き出し、メモリに置かない
+st.session_state.setdefault("session_id", uuid4().hex)
+artifacts.sweep()
+
+def download_artifact(label, path, file_name, mime):
+    """
+    ディスク上の生成物をダウンロードボタンで配信する。
+    対応バージョンではクリック時に読み込み（callable）、古い版ではファイルを渡す。
+    """
+    try:
+        st.download_button(label, data=Path(path).read_bytes,
+                           file_name=file_name, mime=mime)
+    except st.errors.StreamlitAPIException:
+        with open(path, "rb") as fh:
+            st.download_button(label, data=fh, file_name=file_name, mime=mime)
+
+# --- プロジェクト ---
+# 入力内容・画像・ロケ地一覧は永続ストア（store.py）に保存し、URL の ?project=<ID> で再開する。
+# セッションには小さなメタデータ（並び・フラグ・ファイルパス）だけを置く
+def open_project(pid):
+    """プロジェクトをストアから読み込んでセッションに展開する。"""
+    st.session_state["project_id"]  = pid
+    st.session_state["draft"]       = store.load_draft(pid)
+    st.session_state["draft_saved"] = st.session_state["draft"]
+    digests = set()
+    for _, key, _ in CATEGORIES:
+        idx = gallery.new(store.load_gallery(pid, key))
+        st.session_state[f"{key}_index"] = idx
+        st.session_state[f"{key}_page"]  = 1
+        digests.update(idx["order"])
+    st.session_state["images"]    = store.get_images(digests)
+    buffers.drop(st.session_state["session_id"])
+    st.session_state["locations"] = store.load_locations(pid)
+    # 前のプロジェクトの生成物は引き継がない
+    artifacts.discard(st.session_state.pop("pptx_path", None))
+    for k in ("pptx_sig", "pptx_job"):
+        st.session_state.pop(k, None)
+    st.query_params["project"] = pid
+
+pid = st.query_params.get("project")
+if not pid or pid != st.session_state.get("project_id"):
+    if not pid or not store.project_exists(pid):
+        if pid:
+            st.warning(f"プロジェクト {pid} が見つからないため、新しく作成しました")
+        pid = store.new_project()
+    open_project(pid)
+draft = st.session_state["draft"]
+
+def fk(name):
+    """フォーム部品の key（プロジェクトごとに別の部品にして、保存値を初期値にする）。"""
+    return f"{pid}:{name}"
+
+def draft_index(options, name, default):
+    """保存値が選択肢にあればその位置、なければ default。"""
+    return options.index(draft[name]) if draft.get(name) in options else default
+
+with st.sidebar:
+    st.subheader("プロジェクト")
+    st.code(pid, language=None)
+    open_id = st.text_input("プロジェクトIDを開く")
+    s1, s2 = st.columns(2)
+    if s1.button("開く") and open_id:
+        if store.project_exists(open_id.strip()):
+            st.query_params["project"] = open_id.strip()
+            st.rerun()
+        st.error("そのプロジェクトIDは見つかりません")
+    if s2.button("新規作成"):
+        st.query_params["project"] = store.new_project()
+        st.rerun()
+
 # --- 定義しておく ---
 subcats = {
     "ハウススタジオ": ["和風","洋風","一軒家","マンション","アパート"],
@@ -86,34 +149,37 @@ st.title("📍 ロケ地Info・資料出力アプリ")
 
 # --- 1. 基本情報 ---
 st.header("1. ロケ地基本情報")
-loc_name       = st.text_input("ロケ地名")
-address        = st.text_input("住所")
-hp_link        = st.text_input("HPリンク（URL）")
+loc_name       = st.text_input("ロケ地名", value=draft.get("ロケ地名", ""), key=fk("ロケ地名"))
+address        = st.text_input("住所", value=draft.get("住所", ""), key=fk("住所"))
+hp_link        = st.text_input("HPリンク（URL）", value=draft.get("HPリンク", ""), key=fk("HPリンク"))
 
 # ロケ地種類：2カラム
 c1, c2 = st.columns(2)
 with c1:
-    cat_main_val = st.selectbox("ロケ地種類（大分類）", list(subcats.keys()))
+    cat_main_val = st.selectbox("ロケ地種類（大分類）", list(subcats.keys()),
+                                index=draft_index(list(subcats), "大分類", 0), key=fk("大分類"))
 with c2:
-    cat_sub_val  = st.selectbox("ロケ地種類（小分類）", subcats[cat_main_val])
+    cat_sub_val  = st.selectbox("ロケ地種類（小分類）", subcats[cat_main_val],
+                                index=draft_index(subcats[cat_main_val], "小分類", 0),
+                                key=fk(f"小分類/{cat_main_val}"))
 
-transport_info = st.text_area("交通機関情報", height=80)
+transport_info = st.text_area("交通機関情報", value=draft.get("交通機関情報", ""), height=80, key=fk("交通機関情報"))
 
 # 面積・天高：2カラム
 a1, a2 = st.columns(2)
 with a1:
-    area_val   = st.number_input("面積 [m²]", min_value=0.0)
+    area_val   = st.number_input("面積 [m²]", min_value=0.0, value=float(draft.get("面積[m²]", 0.0)), key=fk("面積[m²]"))
 with a2:
-    ceiling_val= st.number_input("天高 [cm]", min_value=0.0)
+    ceiling_val= st.number_input("天高 [cm]", min_value=0.0, value=float(draft.get("天高[cm]", 0.0)), key=fk("天高[cm]"))
 
 # 窓口連絡先：名前 + 電話3分割 + メール
 st.subheader("窓口連絡先")
-contact_person = st.text_input("窓口の担当者名")
+contact_person = st.text_input("窓口の担当者名", value=draft.get("担当者名", ""), key=fk("担当者名"))
 ph1, ph2  = st.columns(2)
 with ph1:
-    phone1 = st.text_input("電話番号")
+    phone1 = st.text_input("電話番号", value=draft.get("電話番号", ""), key=fk("電話番号"))
 with ph2:
-    contact_email = st.text_input("窓口のメールアドレス")
+    contact_email = st.text_input("窓口のメールアドレス", value=draft.get("メールアドレス", ""), key=fk("メールアドレス"))
 
 st.markdown("---")
 
@@ -121,21 +187,23 @@ st.markdown("---")
 st.header("2. 利用情報")
 d1, d2 = st.columns(2)
 with d1:
-    price_day  = st.number_input("金額／day（¥）", min_value=0)
+    price_day  = st.number_input("金額／day（¥）", min_value=0, value=int(draft.get("金額/day", 0)), key=fk("金額/day"))
 with d2:
-    price_hour = st.number_input("金額／h（¥）",  min_value=0)
+    price_hour = st.number_input("金額／h（¥）",  min_value=0, value=int(draft.get("金額/h", 0)), key=fk("金額/h"))
 
-price_note = st.text_area("金額備考", height=80)
+price_note = st.text_area("金額備考", value=draft.get("金額備考", ""), height=80, key=fk("金額備考"))
 
 # 利用可能日時：24h + 開始・終了
 st.subheader("利用可能日時")
 t1, t2, t3 = st.columns([1,1,1])
 with t1:
-    open_24h   = st.checkbox("24時間利用可")
+    open_24h   = st.checkbox("24時間利用可", value=bool(draft.get("24時間可")), key=fk("24時間可"))
 with t2:
-    start_time = st.time_input("開始時間", value=datetime.time(9,0))
+    start_time = st.time_input("開始時間", value=datetime.time.fromisoformat(draft.get("開始時間", "09:00")),
+                               key=fk("開始時間"))
 with t3:
-    end_time   = st.time_input("終了時間", value=datetime.time(18,0))
+    end_time   = st.time_input("終了時間", value=datetime.time.fromisoformat(draft.get("終了時間", "18:00")),
+                               key=fk("終了時間"))
 
 st.markdown("---")
 
@@ -145,22 +213,27 @@ detail_values = {}
 for i in range(0, len(detail_opts), 3):
     cols = st.columns(3)
     for j, opt in enumerate(detail_opts[i:i+3]):
-        detail_values[opt] = cols[j].selectbox(opt, ["あり","なし","不明"], index=2, key=opt)
+        detail_values[opt] = cols[j].selectbox(opt, ["あり","なし","不明"],
+                                               index=draft_index(["あり","なし","不明"], opt, 2),
+                                               key=fk(opt))
 
 # 支払い方法
-payment    = st.selectbox("支払い方法", ["現金","カード","請求書","不明"], index=3)
-pay_note   = st.text_input("支払い備考")
+payment    = st.selectbox("支払い方法", ["現金","カード","請求書","不明"],
+                          index=draft_index(["現金","カード","請求書","不明"], "支払い方法", 3),
+                          key=fk("支払い方法"))
+pay_note   = st.text_input("支払い備考", value=draft.get("支払い備考", ""), key=fk("支払い備考"))
 # 使用可能人数
 st.subheader("使用可能人数")
 u1, u2, u3, u4 = st.columns([1,1,1,1])
 with u1:
-    specify_num   = st.checkbox("人数指定")
+    specify_num   = st.checkbox("人数指定", value=bool(draft.get("人数指定")), key=fk("人数指定"))
 with u2:
-    max_number    = st.number_input("最大人数", min_value=0) if specify_num else None
+    max_number    = st.number_input("最大人数", min_value=0, value=int(draft.get("最大人数") or 0),
+                                    key=fk("最大人数")) if specify_num else None
 with u3:
-    unlimited     = st.checkbox("上限なし")
+    unlimited     = st.checkbox("上限なし", value=bool(draft.get("上限なし")), key=fk("上限なし"))
 with u4:
-    unknown_count = st.checkbox("不明")
+    unknown_count = st.checkbox("不明", value=bool(draft.get("不明(人数)")), key=fk("不明(人数)"))
 
 
 
@@ -168,62 +241,110 @@ st.markdown("---")
 
 # --- 4. 対象作品 & 担当者 ---
 st.header("4. 対象作品")
-work_no     = st.text_input("作品番号")
+work_no     = st.text_input("作品番号", value=draft.get("作品番号", ""), key=fk("作品番号"))
 pm, p, co   = st.columns(3)
 with pm:
-    pm_person   = st.text_input("担当者 PM")
+    pm_person   = st.text_input("担当者 PM", value=draft.get("担当者 PM", ""), key=fk("担当者 PM"))
 with p:
-    p_person    = st.text_input("担当者 P")
+    p_person    = st.text_input("担当者 P", value=draft.get("担当者 P", ""), key=fk("担当者 P"))
 with co:
-    coordinator = st.text_input("ロケコーディネーター")
+    coordinator = st.text_input("ロケコーディネーター", value=draft.get("コーディネーター", ""), key=fk("コーディネーター"))
 
 st.markdown("---")
 
 # --- 5. Excel 保存ボタン ---
 st.header("5. 入力データをExcelで保存")
+# 辞書にまとめる（Excel の列・PPTX のメタデータ項目・バッチの入力列で共通）
+record = {
+    "ロケ地名":       loc_name,
+    "住所":           address,
+    "HPリンク":       hp_link,
+    "大分類":         cat_main_val,
+    "小分類":         cat_sub_val,
+    "交通機関情報":   transport_info,
+    "面積[m²]":       area_val,
+    "天高[cm]":       ceiling_val,
+    "担当者名":       contact_person,
+    "電話番号":       phone1,
+    "メールアドレス":  contact_email,
+    "金額/day":       price_day,
+    "金額/h":         price_hour,
+    "金額備考":       price_note,
+    "24時間可":       open_24h,
+    "開始時間":       start_time.strftime("%H:%M"),
+    "終了時間":       end_time.strftime("%H:%M"),
+    **detail_values,
+    "人数指定":       specify_num,
+    "最大人数":       max_number,
+    "上限なし":       unlimited,
+    "不明(人数)":     unknown_count,
+    "支払い方法":     payment,
+    "支払い備考":     pay_note,
+    "作品番号":       work_no,
+    "担当者 PM":      pm_person,
+    "担当者 P":       p_person,
+    "コーディネーター": coordinator,
+}
+# 入力が変わったときだけ下書きを保存する（URL を開き直すと復元される）
+if record != st.session_state["draft_saved"]:
+    store.save_draft(pid, record)
+    st.session_state["draft_saved"] = record
+
+# 複数ロケ地を一覧に貯めて 1 つの Excel に書き出す
+# locations: ロケ地名 → {"record": レコード, "thumbs": {カテゴリ名: サムネイルのパス}}
+locations = st.session_state["locations"]
+
+x1, x2 = st.columns(2)
+with x1:
+    if st.button("➕ 一覧に追加（同じロケ地名は上書き）"):
+        if not loc_name:
+            st.warning("ロケ地名を入力してください")
+        else:
+            # サムネイルは追加時点で小さく作っておく（後で画像を消しても残る）
+            import imaging
+            from excel_export import sheet_thumbnail
+            thumbs = {}
+            for label, key, _ in CATEGORIES:
+                first = next(iter(gallery.included(st.session_state[f"{key}_index"])), None)
+                if first is not None:
+                    rec = st.session_state["images"][first]
+                    thumbs[label] = (first, sheet_thumbnail(imaging.source(rec)))
+            store.save_location(pid, loc_name, record, thumbs)
+            locations = st.session_state["locations"] = store.load_locations(pid)
+with x2:
+    if locations and st.button("🗑 一覧をクリア"):
+        store.clear_locations(pid)
+        locations.clear()
+
+if locations:
+    st.caption(f"一覧: {len(locations)} 件（{'、'.join(list(locations)[:10])}"
+               f"{' ほか' if len(locations) > 10 else ''}）")
+else:
+    st.caption("一覧が空のときは現在の入力内容を 1 行で書き出します")
+with_images = st.checkbox("画像シート（カテゴリごとのサムネイル）を含める")
+
 if st.button("💾 データをExcelでダウンロード"):
-    # 辞書にまとめる
-    data = {
-        "ロケ地名":       loc_name,
-        "住所":           address,
-        "HPリンク":       hp_link,
-        "大分類":         cat_main_val,
-        "小分類":         cat_sub_val,
-        "交通機関情報":   transport_info,
-        "面積[m²]":       area_val,
-        "天高[cm]":       ceiling_val,
-        "担当者名":       contact_person,
-        "電話番号":       phone1,
-        "メールアドレス":  contact_email,
-        "金額/day":       price_day,
-        "金額/h":         price_hour,
-        "金額備考":       price_note,
-        "24時間可":       open_24h,
-        "開始時間":       start_time.strftime("%H:%M"),
-        "終了時間":       end_time.strftime("%H:%M"),
-        **detail_values,
-        "人数指定":       specify_num,
-        "最大人数":       max_number,
-        "上限なし":       unlimited,
-        "不明(人数)":     unknown_count,
-        "支払い方法":     payment,
-        "支払い備考":     pay_note,
-        "作品番号":       work_no,
-        "担当者 PM":      pm_person,
-        "担当者 P":       p_person,
-        "コーディネーター": coordinator,
-    }
-    df = pd.DataFrame([data])
-    buf = io.BytesIO()
-    with pd.ExcelWriter(buf, engine="openpyxl") as writer:
-        df.to_excel(writer, index=False, sheet_name="ロケ地情報")
-    buf.seek(0)
-
-    st.download_button(
-        label="📥 Excelをダウンロード",
-        data=buf,
+    from excel_export import XLSX_MIME, write_locations
+    entries = list(locations.values()) or [{"record": record, "thumbs": {}}]
+    path = artifacts.new_path(st.session_state["session_id"], ".xlsx")
+    run  = metrics.start("xlsx", rows=len(entries), with_images=with_images)
+    write_locations(
+        path,
+        (e["record"] for e in entries),
+        columns=list(record),
+        images=((e["record"]["ロケ地名"], e["thumbs"]) for e in entries) if with_images else None,
+        image_columns=[label for label, _, _ in CATEGORIES],
+        measure=run,
+    )
+    metrics.finish(run)
+    artifacts.discard(st.session_state.get("xlsx_path"))
+    st.session_state["xlsx_path"] = path
+
+    download_artifact(
+        "📥 Excelをダウンロード",
+        path,
         file_name="location_data.xlsx",
-        mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+        mime=XLSX_MIME
     )
 
 st.markdown("---")
@@ -231,27 +352,37 @@ st.markdown("---")
 # --- 6. 画像アップロード & PPTX 出力 ---
 # --- Configuration ---
 
-# Inputs for location metadata
-location_name = loc_name
-address = address
-
 # --- ユーザー入力：1スライドあたりの画像枚数を選択 ---
 
 total_per_slide = st.selectbox(
     "1スライドあたりの画像枚数",
-    [6, 9],
+    list(GRID_LAYOUTS),
     index=0
 )
-if total_per_slide == 6:
-    PPT_COLS, PPT_ROWS = 3, 2
-else:
-    PPT_COLS, PPT_ROWS = 3, 3
-PPT_PER_SLIDE = PPT_COLS * PPT_ROWS
 
-# --- フォントサイズ定義 ---
-HEADING_FONT = Pt(20)   # スライド上部の見出し
-LOC_FONT     = Pt(20)   # ロケ地名
-TABLE_FONT   = Pt(10)   # 表の文字
+# --- ユーザー入力：画像の並べ方 ---
+# 縦横比に合わせて詰めると、縦長の画像（平面図・地図など）が多いカテゴリはスライドが減る
+layout_mode = st.selectbox(
+    "画像の並べ方",
+    list(LAYOUT_MODES),
+    format_func=LAYOUT_MODES.get,
+    index=0,
+    help="「縦横比に合わせて詰める」では、上の枚数は画像の大きさの目安になります",
+)
+
+# --- ユーザー入力：画像の書き出し品質 ---
+# 配置枠の物理サイズ × DPI まで縮小して JPEG 再エンコード（None は元画像のまま）
+EXPORT_DPI_OPTIONS = {
+    "標準（150dpi）":   150,
+    "高画質（220dpi）": 220,
+    "元画像のまま":     None,
+}
+export_quality = st.selectbox(
+    "画像の書き出し品質",
+    list(EXPORT_DPI_OPTIONS.keys()),
+    index=0
+)
+EXPORT_DPI   = EXPORT_DPI_OPTIONS[export_quality]
 
 # --- プレビュー設定（変更なし）---
 
@@ -259,14 +390,8 @@ TABLE_FONT   = Pt(10)   # 表の文字
 
 # --- カテゴリ定義 ---
 # --- 6. 画像アップロード & Preview ---
-categories = [
-    ("サムネイル：1枚のみ", "thumbs", False),
-    ("ロケ地写真", "photos", True),
-    ("アングル写真", "angles", True),
-    ("その他設備・搬入搬出経路", "others", True),
-    ("平面図", "floor", True),
-    ("ロケ地MAP", "map_img", True),
-]
+categories = CATEGORIES
+MULTI = {key: many for _, key, many in categories}   # カテゴリキー → 複数枚可
 
 def display_image(img, **kwargs):
     """
@@ -283,79 +408,317 @@ def display_image(img, **kwargs):
         fallback.pop("use_container_width", None)
         st.image(img, **fallback)
 
-# セッション初期化（省略）
+def keyed_container(key):
+    """
+    CSS で狙えるよう key 付きのコンテナを返す（class に st-key-<key> が付く）。
+    key 引数のない古い Streamlit では普通のコンテナ。
+    """
+    try:
+        return st.container(key=key)
+    except TypeError:
+        return st.container()
+
+def release_image(digest):
+    """どのカテゴリからも参照されなくなった画像をセッションから外す。"""
+    if not any(digest in st.session_state[f"{k}_index"]["pos"] for _, k, _ in categories):
+        st.session_state["images"].pop(digest, None)
+
+# セッション初期化（中身は open_project() でストアから読み込み済み）
+# images: 内容ハッシュ → store.put_images() のレコード（元画像・プレビューはパスで持つ）
+# {key}_index: カテゴリ内の並び・表示名・資料出力・選択（gallery.py の索引）
 for _, key, _ in categories:
-    st.session_state.setdefault(f"{key}_data", {})
-    st.session_state.setdefault(f"{key}_include", {})
-    st.session_state.setdefault(f"{key}_page", 1)
     st.session_state.setdefault(f"{key}_ctr", 0)
 
-for label, key, multi in categories:
-    data = st.session_state[f"{key}_data"]
+# fragment 対応版ではカテゴリごとのギャラリーだけを部分的に再実行する
+fragment = getattr(st, "fragment", None) or getattr(st, "experimental_fragment", None)
+
+def rerun_gallery():
+    """
+    いま描画中のギャラリー（fragment）だけを再実行する。
+    全体の実行中や fragment 非対応の版では全体を再実行。
+    """
+    try:
+        st.rerun(scope="fragment")
+    except (TypeError, st.errors.StreamlitAPIException):
+        st.rerun()
+
+def deck_changed():
+    """
+    資料に入る画像・並びが変わったときに呼ぶ。スライドのプレビューを表示中なら、
+    fragment の外にあるプレビューも描き直すよう全体を再実行させる。
+    """
+    if st.session_state.get("deck_preview"):
+        st.session_state["gallery_full_rerun"] = True
+
+def apply_gallery_changes(key, digests, action=None):
+    """
+    フォームの「資料出力」「選択」チェックをまとめて反映し、action の一括操作を行う
+    （送信ボタンの on_click）。digests は表示中のページの画像。
+    action: None（反映のみ）/ "all" / "none" / "invert" / "delete" / "front" /
+            "include" / "exclude" / "move"（移動先はフォームの選択ボックス）
+    """
+    pid = st.session_state["project_id"]
+    idx = st.session_state[f"{key}_index"]
+    include, selected = idx["include"], idx["selected"]
+
+    # ページ上のチェックを索引へ（チェックボックスの状態は捨て、索引の値で描き直す）
+    flags = {}
+    for digest in digests:
+        if digest not in idx["pos"]:
+            continue
+        inc = st.session_state.pop(f"inc_{key}_{digest}", include[digest])
+        if inc != include[digest]:
+            include[digest] = flags[digest] = inc
+        if st.session_state.pop(f"sel_{key}_{digest}", digest in selected):
+            selected.add(digest)
+        else:
+            selected.discard(digest)
+
+    if action == "all":
+        gallery.select_all(idx)
+    elif action == "none":
+        gallery.select_none(idx)
+    elif action == "invert":
+        gallery.select_invert(idx)
+    elif action in ("include", "exclude"):
+        for digest in selected:
+            if include[digest] != (action == "include"):
+                include[digest] = flags[digest] = action == "include"
+    elif action == "front":
+        gallery.move_to_front(idx, selected)
+        store.reorder_gallery(pid, key, idx["order"])
+    elif action == "delete":
+        removed = gallery.remove(idx, gallery.selection(idx))
+        for digest in removed:
+            flags.pop(digest, None)
+            release_image(digest)
+        store.remove_from_gallery(pid, key, removed)
+    elif action == "move" and MULTI.get(st.session_state.get(f"dst_{key}")):
+        dst   = st.session_state[f"dst_{key}"]
+        moved = gallery.selection(idx)
+        target = st.session_state[f"{dst}_index"]
+        for digest in moved:
+            gallery.append(target, digest, idx["name"][digest], include[digest])
+        gallery.remove(idx, moved)
+        store.set_included(pid, key, flags)   # 移動元の行ごと移すので先に反映
+        store.move_in_gallery(pid, key, dst, moved)
+        flags = {}
+        # 移動先のギャラリーも描き直すため全体を再実行する
+        st.session_state["gallery_full_rerun"] = True
+    store.set_included(pid, key, flags)
+    if flags or action in ("front", "delete"):
+        deck_changed()
+
+    new_total = max(1, (gallery.size(idx) + PREVIEW_PER_PAGE - 1) // PREVIEW_PER_PAGE)
+    st.session_state[f"{key}_page"] = min(st.session_state[f"{key}_page"], new_total)
+
+def add_images(key, items, run=None):
+    """
+    (ファイル名, 生バイト) のリストを取り込み、ストアとカテゴリ key のギャラリーに追加する。
+    デコード・向き補正・プレビュー生成はプールで並列に行う。
+    画像として読めなかったもの・保存できなかったものは追加せず、(ファイル名, 理由) のリストで返す。
+    """
+    from imaging import ingest_many
+    images = st.session_state["images"]
+    idx    = st.session_state[f"{key}_index"]
+    with metrics.phase(run, "hash"):
+        digests = [hashlib.sha256(raw).hexdigest() for _, raw in items]
+    new = {d: raw for d, (_, raw) in zip(digests, items) if d not in images}
+    errors = []
+    with metrics.phase(run, "decode", sum(map(len, new.values()))):
+        recs = ingest_many(list(new.values()), list(new), errors=errors)
+    # 元画像・プレビューはストアへ書き、セッションにはパスだけ残す
+    names  = {d: name for d, (name, _) in zip(digests, items)}
+    broken = {list(new)[i]: f"画像として読めない（{type(e).__name__}）" for i, e in errors}
+    recs  = [rec for rec in recs if rec is not None]
+    added = {}
+    for (name, _), digest in zip(items, digests):
+        if digest not in broken and digest not in idx["pos"]:
+            added.setdefault(digest, name)
+    # セッションの画像はこのプロジェクトのギャラリーの行が参照しているので消されない。
+    # 新しい画像は行・ギャラリー・ブロブを 1 つのトランザクションで書く
+    try:
+        with metrics.phase(run, "store", sum(len(r["raw"]) + len(r.get("preview") or b"")
+                                             for r in recs)):
+            images.update(store.put_images(st.session_state["project_id"], key, recs,
+                                           list(added.items())))
+    except sqlite3.IntegrityError:
+        return [(names[d], why) for d, why in broken.items()] + [
+            (name, "保存時の競合（もう一度追加してください）") for name in added.values()]
+    for rec in recs:
+        metrics.item(run, name=names[rec["hash"]], bytes=len(rec["raw"]),
+                     preview_bytes=len(rec.get("preview") or b""),
+                     size=rec["size"], probe_seconds=round(rec["probe_seconds"], 4))
+    for digest, name in added.items():
+        gallery.append(idx, digest, name)
+    return [(names[d], why) for d, why in broken.items()]
+
+# 近似重複（連写など）の検出
+DUP_THRESHOLD = 6    # 既定のしきい値（64bit の dHash で異なるビット数）
+DUP_SHOW      = 12   # 一覧に表示するグループ数の上限
+DUP_COLS      = 8    # 1 グループで並べる枚数の上限
+
+def duplicate_groups(key, threshold):
+    """
+    カテゴリ内の近似重複のグループ（ハッシュのリストのリスト）を返す。
+    並びとしきい値が前回と同じなら計算し直さない。
+    """
+    import imaging
+    import similar
+    idx    = st.session_state[f"{key}_index"]
+    images = st.session_state["images"]
+    sig    = (hash(tuple(idx["order"])), threshold)
+    cached = st.session_state.get(f"{key}_dups")
+    if cached and cached[0] == sig:
+        return cached[1]
+    # 特徴量のない画像（以前のバージョンで取り込んだもの）はプレビューから補う
+    for digest in idx["order"]:
+        rec = images[digest]
+        if rec.get("phash") is None:
+            rec["phash"], rec["sharpness"] = imaging.preview_features(rec["preview"])
+            store.set_features(digest, rec["phash"], rec["sharpness"])
+    order  = idx["order"]
+    groups = [[order[i] for i in g]
+              for g in similar.clusters([images[d]["phash"] for d in order], threshold)]
+    st.session_state[f"{key}_dups"] = (sig, groups)
+    return groups
+
+def keep_best(key, groups, mode):
+    """
+    各グループで鮮鋭度が最も高い 1 枚を残し、ほかを資料出力から外す（mode="exclude"）
+    か選択する（mode="select"、続けて一括削除などに使う）。ボタンの on_click。
+    """
+    import similar
+    idx    = st.session_state[f"{key}_index"]
+    images = st.session_state["images"]
+    flags  = {}
+    for group in groups:
+        best = similar.best_of(range(len(group)), [images[d]["sharpness"] or 0.0 for d in group])
+        for i, digest in enumerate(group):
+            if i == best or digest not in idx["pos"]:
+                continue
+            if mode == "exclude" and idx["include"][digest]:
+                idx["include"][digest] = flags[digest] = False
+            elif mode == "select":
+                idx["selected"].add(digest)
+            # フォームのチェックボックスを索引の値で描き直す
+            st.session_state.pop(f"inc_{key}_{digest}", None)
+            st.session_state.pop(f"sel_{key}_{digest}", None)
+    store.set_included(st.session_state["project_id"], key, flags)
+    if flags:
+        deck_changed()
+
+def duplicate_panel(key):
+    """近似重複のグループを表示し、ベストを残す一括操作を出す。"""
+    import similar
+    idx = st.session_state[f"{key}_index"]
+    with st.expander("🔍 似た写真（連写など）"):
+        if not st.checkbox("似た写真を探す", key=f"dupon_{key}"):
+            return
+        threshold = st.slider("しきい値（小さいほど「そっくり」なものだけ）", 0, 16,
+                              DUP_THRESHOLD, key=f"dupth_{key}")
+        groups = duplicate_groups(key, threshold)
+        if not groups:
+            st.caption("似た写真は見つかりませんでした")
+            return
+        images = st.session_state["images"]
+        st.caption(f"{len(groups)} グループ・{sum(map(len, groups))} 枚（★は各グループで最も鮮明な写真）")
+        b1, b2 = st.columns(2)
+        b1.button("各グループのベスト以外を資料出力から外す", key=f"dupx_{key}",
+                  on_click=keep_best, args=(key, groups, "exclude"))
+        b2.button("ベスト以外を選択", key=f"dups_{key}",
+                  on_click=keep_best, args=(key, groups, "select"))
+        for group in groups[:DUP_SHOW]:
+            best = group[similar.best_of(range(len(group)),
+                                         [images[d]["sharpness"] or 0.0 for d in group])]
+            for col, digest in zip(st.columns(DUP_COLS), group[:DUP_COLS]):
+                with col:
+                    preview = buffers.get(st.session_state["session_id"], key, digest,
+                                          path=images[digest]["preview"])
+                    mark = "★ " if digest == best else ("" if idx["include"][digest] else "（対象外）")
+                    display_image(preview, caption=mark + idx["name"][digest],
+                                  use_container_width=True)
+        if len(groups) > DUP_SHOW:
+            st.caption(f"ほか {len(groups) - DUP_SHOW} グループ")
+
+def category_gallery(label, key, multi):
+    """1 カテゴリ分のアップローダーとプレビュー（fragment として単独で再実行される）。"""
+    idx = st.session_state[f"{key}_index"]
     ctr = st.session_state[f"{key}_ctr"]
     uploaded = st.file_uploader(label, type=["png","jpg","jpeg"],
                                 accept_multiple_files=multi,
                                 key=f"upl_{key}_{ctr}")
     files = uploaded if isinstance(uploaded, list) else ([uploaded] if uploaded else [])
     if files:
-        for f in files:
-            if f.name not in data:
-                data[f.name] = Image.open(f)
-                st.session_state[f"{key}_include"][f.name] = True
-        st.session_state[f"{key}_ctr"] += 1
+        run = metrics.start("upload", category=key, files=len(files))
+        try:
+            failed = add_images(key, [(f.name, f.getvalue()) for f in files], run)
+        finally:
+            metrics.finish(run)
+            st.session_state[f"{key}_ctr"] += 1
+        if failed:
+            st.session_state[f"{key}_failed"] = failed
+        deck_changed()
+        rerun_gallery()
+    for name, why in st.session_state.pop(f"{key}_failed", []):
+        st.warning(f"{name}: {why}のため追加しませんでした")
+
+    if st.session_state.pop("gallery_full_rerun", False):
         st.rerun()
-
-    items = list(data.items())
-    if not items:
-        continue
+    if not gallery.size(idx):
+        return
 
     # ページ計算
-    total_pages = (len(items) + PREVIEW_PER_PAGE - 1) // PREVIEW_PER_PAGE
+    total_pages = (gallery.size(idx) + PREVIEW_PER_PAGE - 1) // PREVIEW_PER_PAGE
     page = st.session_state[f"{key}_page"]
     page = max(1, min(page, total_pages))
     st.session_state[f"{key}_page"] = page
 
-    # プレビュー表示
-    st.markdown(
-        f"<div style='border:1px solid #ddd; padding:{PADDING}px; margin-bottom:{PADDING}px; max-height:400px; overflow-y:auto;'>",
-        unsafe_allow_html=True,
-    )
-
-    # ── プレビュー画像のループ（削除をチェックボックスで） ──
-    # ── プレビュー表示ループ（チェックボックスで「削除」と「資料出力」）──
-    cols_ui = st.columns(PREVIEW_COLS)
+    # ── プレビュー表示（チェックボックスで「資料出力」と「選択」）──
+    # チェックはフォーム内で貯め、送信ボタンでまとめて適用する。
+    # 選択した画像（ページをまたいでよい）には一括操作ができる
     start = (page - 1) * PREVIEW_PER_PAGE
-
-    for idx, (name, img) in enumerate(items[start:start + PREVIEW_PER_PAGE]):
-        col = cols_ui[idx % PREVIEW_COLS]
-        with col:
-            display_image(img, use_container_width=True)
-
-            # 「資料出力」のチェック
-            inc = st.checkbox(
-                "資料出力",
-                key=f"inc_{key}_{name}",
-                value=st.session_state[f"{key}_include"][name]
-            )
-            st.session_state[f"{key}_include"][name] = inc
-
-            # 「削除」のチェックをオンにしたら即削除
-            delete = st.checkbox(
-                "削除",
-                key=f"del_{key}_{name}"
-            )
-            if delete:
-                data.pop(name)
-                st.session_state[f"{key}_include"].pop(name, None)
-                new_n     = len(data)
-                new_total = max(1, (new_n + PREVIEW_PER_PAGE - 1) // PREVIEW_PER_PAGE)
-                st.session_state[f"{key}_page"] = min(page, new_total)
-                st.rerun()
-
-
-
-
-    st.markdown("</div>", unsafe_allow_html=True)
+    page_digests = gallery.page(idx, start, start + PREVIEW_PER_PAGE)
+    with st.form(f"form_{key}"):
+        cols_ui = keyed_container(f"gallery_{key}").columns(PREVIEW_COLS)
+        for i, digest in enumerate(page_digests):
+            col = cols_ui[i % PREVIEW_COLS]
+            with col:
+                # プレビューはメモリ予算内でキャッシュ（追い出されたらストアから読み直す）
+                preview = buffers.get(st.session_state["session_id"], key, digest,
+                                      path=st.session_state["images"][digest]["preview"])
+                display_image(preview, caption=idx["name"][digest], use_container_width=True)
+
+                # 「資料出力」のチェック
+                st.checkbox(
+                    "資料出力",
+                    key=f"inc_{key}_{digest}",
+                    value=idx["include"][digest]
+                )
+                # 一括操作の「選択」
+                st.checkbox(
+                    "選択",
+                    key=f"sel_{key}_{digest}",
+                    value=digest in idx["selected"]
+                )
+
+        st.caption(f"選択中 {len(idx['selected'])} / {gallery.size(idx)} 枚")
+        buttons = [
+            ("変更を反映", None), ("全選択", "all"), ("選択解除", "none"), ("選択を反転", "invert"),
+            ("☑ 選択を資料出力", "include"), ("☐ 選択を対象外", "exclude"),
+            ("⬆ 選択を先頭へ", "front"), ("🗑 選択を削除", "delete"),
+        ]
+        for row in (buttons[:4], buttons[4:]):
+            for col, (text, action) in zip(st.columns(4), row):
+                col.form_submit_button(text, on_click=apply_gallery_changes,
+                                       args=(key, page_digests, action))
+        # 移動先は複数枚のカテゴリだけ（サムネイルは 1 枚のみなので ZIP 取り込みと同じく対象外）
+        others = [(lbl, k) for lbl, k, many in categories if k != key and many]
+        m1, m2 = st.columns([3, 1])
+        m1.selectbox("移動先", [k for _, k in others], key=f"dst_{key}",
+                     format_func=dict((k, lbl) for lbl, k in others).get)
+        m2.form_submit_button("➡ 選択を移動", on_click=apply_gallery_changes,
+                              args=(key, page_digests, "move"))
 
     # ページナビ
     if total_pages > 1:
@@ -369,241 +732,240 @@ for label, key, multi in categories:
         new_page = int(sel)
         if new_page != page:
             st.session_state[f"{key}_page"] = new_page
-            st.rerun()
-
-# --- PPTX 生成＆ダウンロード ---
-if st.button("💾 PPTX を生成"):
-    prs = Presentation()
-    prs.slide_width  = Inches(13.333)
-    prs.slide_height = Inches(7.5)
-
-    # 共通：Blank レイアウト取得
+            rerun_gallery()
+
+    if multi and gallery.size(idx) > 1:
+        duplicate_panel(key)
+
+# --- ZIP で一括アップロード ---
+# フォルダ名（thumbs / photos / … またはカテゴリの表示名）でカテゴリに振り分ける。
+# 1 ファイルずつ展開して ZIP_BATCH 枚ごとに取り込み、最後に 1 回だけ全体を再実行する
+ZIP_BATCH = 16
+st.session_state.setdefault("zip_ctr", 0)
+zip_file = st.file_uploader(
+    "📦 ZIP で一括アップロード（フォルダ名でカテゴリ分け）", type=["zip"],
+    key=f"zip_{st.session_state['zip_ctr']}",
+    help="例: photos/001.jpg、平面図/1F.png。フォルダ名はカテゴリキー "
+         f"（{', '.join(k for _, k, _ in categories)}）かカテゴリ名",
+)
+def import_zip(zip_file):
+    """
+    ZIP を展開してカテゴリごとに取り込み、結果を zip_report に残す。
+    ZIP として読めなければ zip_error に残す。展開・デコードできないファイルは
+    飛ばして「取り込まなかったファイル」に理由付きで載せる。
+    """
+    import zipfile
+    import archive
     try:
-        blank_layout = prs.slide_layouts[6]
-    except IndexError:
-        blank_layout = next(
-            (lay for lay in prs.slide_layouts if lay.name.lower()=="blank"),
-            prs.slide_layouts[5]
-        )
-
-    # --- 1枚目：サムネイルスライド ---
-    thumb_slide = prs.slides.add_slide(blank_layout)
-    # 上部にロケ地名
-    TITLE_W = Inches(10)
-    left    = (prs.slide_width - TITLE_W) / 2
-    tb = thumb_slide.shapes.add_textbox(left, Inches(0.2), TITLE_W, Inches(0.6))
-    p  = tb.text_frame.paragraphs[0]
-    run = p.add_run()
-    run.text = location_name
-    p.alignment  = PP_ALIGN.CENTER
-    run.font.name = "YuGothic"
-    run.font.size = Pt(24)
-
-    # サムネイル画像を中央に縮小表示（幅を60%に）
-    thumbs = list(st.session_state["thumbs_data"].values())
+        entries, skipped = archive.plan(zip_file)
+    except zipfile.BadZipFile as e:
+        st.session_state["zip_error"] = f"{zip_file.name}: ZIP ファイルとして読めません（{e}）"
+        return
+    # サムネイルは 1 枚だけ（すでにあれば追加しない）
+    thumbs = [e for e in entries if e[2] == "thumbs"]
     if thumbs:
-        img   = thumbs[0]
-        pic_w = prs.slide_width * 0.6
-        pic_h = pic_w * img.height / img.width
-        left  = (prs.slide_width - pic_w) / 2
-        top   = (prs.slide_height - pic_h) / 2 + Inches(0.2)
-        buf = io.BytesIO()
-        img.save(buf, format=img.format or "PNG")
-        buf.seek(0)
-        thumb_slide.shapes.add_picture(buf, left, top, width=pic_w, height=pic_h)
-
-    # --- 2枚目：メタデータスライド ---
-    meta_slide = prs.slides.add_slide(blank_layout)
-
-    # (A) タイトル「ロケ地情報」
-    META_TITLE_W = Inches(10)
-    left_title   = (prs.slide_width - META_TITLE_W) / 2
-    tb_meta_title = meta_slide.shapes.add_textbox(
-        left_title, Inches(0.2), META_TITLE_W, Inches(0.6)
-    )
-    p_title = tb_meta_title.text_frame.paragraphs[0]
-    run_title = p_title.add_run()
-    run_title.text = "ロケ地情報"
-    p_title.alignment = PP_ALIGN.CENTER
-    run_title.font.name = "YuGothic"
-    run_title.font.size = Pt(24)
-
-    # すべてのフィールドをリストに
-    fields = [
-        ("ロケ地名",       location_name),
-        ("住所",           address),
-        ("HPリンク",       hp_link),
-        ("大分類",         cat_main_val),
-        ("小分類",         cat_sub_val),
-        ("交通機関情報",   transport_info),
-        ("面積[m²]",       area_val),
-        ("天高[cm]",       ceiling_val),
-        ("担当者名",       contact_person),
-        ("電話番号",       phone1),
-        ("メールアドレス",  contact_email),
-        ("金額/day",       price_day),
-        ("金額/h",         price_hour),
-        ("金額備考",       price_note),
-        ("24時間可",       open_24h),
-        ("開始時間",       start_time.strftime("%H:%M")),
-        ("終了時間",       end_time.strftime("%H:%M")),
-        *[(k, detail_values[k]) for k in detail_values],
-        ("人数指定",       specify_num),
-        ("最大人数",       max_number),
-        ("上限なし",       unlimited),
-        ("不明(人数)",     unknown_count),
-        ("支払い方法",     payment),
-        ("支払い備考",     pay_note),
-        ("作品番号",       work_no),
-        ("担当者 PM",      pm_person),
-        ("担当者 P",       p_person),
-        ("コーディネーター", coordinator),
-    ]
-
-    # 2分割
-    mid = len(fields) // 2
-    left_fields  = fields[:mid]
-    right_fields = fields[mid:]
-
-    # 各コラムの基本設定
-    #margin_x  = Inches(0.7)
-    #half_w    = (prs.slide_width - margin_x*2) / 2
-    #label_w   = Inches(2.5)   # 左コラムはメールアドレスに合わせて広め
-    #value_w   = half_w - label_w - Inches(0.2)
-    #row_h     = Inches(0.25)  # 行間
-    #start_y   = Inches(0.5)
-
-    # ↓↓ ここから調整可能 ↓↓
-    # 項目のY開始位置を0.2→1.0インチに下げてタイトルと被らなくする
-    start_y   = Inches(1.0)
-
-    # 左右マージン
-    margin_x  = Inches(0.7)
-    # コラム幅（左右で均等）
-    half_w    = (prs.slide_width - margin_x*2) / 2
-    # 左コラム：ラベル幅を2.5→2.2インチに少し狭く
-    label_w   = Inches(2.0)
-    # 値幅は自動計算
-    value_w   = half_w - label_w - Inches(0.1)
-    # 行の高さ（行間）は0.25→0.3インチに調整
-    row_h     = Inches(0.3)
-    # ↑↑ ここまで調整可能 ↑↑
-
-
-    # 左コラム
-    for i, (label, val) in enumerate(left_fields):
-        y = start_y + row_h * i
-        # ラベル
-        tb_lab = meta_slide.shapes.add_textbox(margin_x, y, label_w, row_h)
-        p_lab  = tb_lab.text_frame.paragraphs[0]
-        p_lab.text = label
-        p_lab.font.name = "YuGothic"
-        p_lab.font.size = Pt(10)
-        # 値
-        tb_val = meta_slide.shapes.add_textbox(
-            margin_x + label_w + Inches(0.1), y, value_w, row_h
-        )
-        p_val  = tb_val.text_frame.paragraphs[0]
-        p_val.text = str(val)
-        p_val.font.name = "YuGothic"
-        p_val.font.size = Pt(10)
-
-    # 右コラム（Coordinator に合わせてラベル幅設定）
-    label_w_r = Inches(1.8)
-    value_w_r = half_w - label_w_r - Inches(0.2)
-    for i, (label, val) in enumerate(right_fields):
-        y = start_y + row_h * i
-        x0 = margin_x + half_w
-        tb_lab = meta_slide.shapes.add_textbox(x0, y, label_w_r, row_h)
-        p_lab  = tb_lab.text_frame.paragraphs[0]
-        p_lab.text = f"{label}"
-        p_lab.font.name = "YuGothic"
-        p_lab.font.size = Pt(10)
-        tb_val = meta_slide.shapes.add_textbox(x0 + label_w_r + Inches(0.1), y, value_w_r, row_h)
-        p_val  = tb_val.text_frame.paragraphs[0]
-        p_val.text = f"{val}"
-        p_val.font.name = "YuGothic"
-        p_val.font.size = Pt(10)
-
-    # --- 3枚目以降：その他カテゴリの画像スライド（省略せず従来どおり） ---
-    for label, key, _ in categories:
-        if key == "thumbs":
-            continue
-        imgs = [
-            img for name,img in st.session_state[f"{key}_data"].items()
-            if st.session_state[f"{key}_include"][name]
-        ]
-        if not imgs:
-            continue
+        drop = thumbs[1:] if not gallery.size(st.session_state["thumbs_index"]) else thumbs
+        entries = [e for e in entries if e not in drop]
+        skipped += [(name, "サムネイルは 1 枚のみ") for _, name, _ in drop]
+    paths  = {(key, PurePosixPath(name).name): name for _, name, key in entries}
+    before = sum(gallery.size(st.session_state[f"{k}_index"]) for _, k, _ in categories)
+    bar = st.progress(0.0, text=f"ZIP を取り込み中… 0/{len(entries)}")
+    run = metrics.start("upload", category="zip", files=len(entries))
+    pending, error = defaultdict(list), None
+
+    def flush():
+        for k, items in pending.items():
+            skipped.extend((paths.get((k, name), name), why)
+                           for name, why in add_images(k, items, run))
+        pending.clear()
 
-        for i in range(0, len(imgs), PPT_PER_SLIDE):
-            chunk = imgs[i:i + PPT_PER_SLIDE]
-            slide = prs.slides.add_slide(blank_layout)
+    try:
+        for n, (key, name, raw) in enumerate(archive.iter_images(zip_file, entries, skipped), 1):
+            pending[key].append((name, raw))
+            if n % ZIP_BATCH == 0:
+                flush()
+            bar.progress(n / len(entries), text=f"ZIP を取り込み中… {n}/{len(entries)}")
+        flush()
+    except Exception as e:
+        error = repr(e)
+        raise
+    finally:
+        metrics.finish(run, error)
+    after = sum(gallery.size(st.session_state[f"{k}_index"]) for _, k, _ in categories)
+    st.session_state["zip_report"] = (zip_file.name, len(entries), after - before, skipped)
+
+if zip_file is not None:
+    # 失敗しても同じファイルで取り込みを繰り返さないよう、アップローダーは必ず作り直す
+    try:
+        import_zip(zip_file)
+    finally:
+        st.session_state["zip_ctr"] += 1
+    st.rerun()
+if "zip_error" in st.session_state:
+    st.error(st.session_state.pop("zip_error"))
+if "zip_report" in st.session_state:
+    zip_name, n_files, n_added, skipped = st.session_state.pop("zip_report")
+    st.success(f"{zip_name}: 画像 {n_files} 件を処理し、{n_added} 枚を追加しました"
+               "（同じ画像・登録済みの画像は追加しません）")
+    if skipped:
+        with st.expander(f"取り込まなかったファイル（{len(skipped)} 件）"):
+            st.dataframe([{"ファイル": name, "理由": why} for name, why in skipped],
+                         hide_index=True)
+
+show_gallery = fragment(category_gallery) if fragment else category_gallery
+for label, key, multi in categories:
+    show_gallery(label, key, multi)
+
+@st.cache_resource
+def deck_executor():
+    """PPTX 生成ジョブ用のプロセス共通スレッドプール（画像処理プールとは別）。"""
+    return ThreadPoolExecutor(max_workers=2, thread_name_prefix="deck")
+
+def deck_job(record, images, per_slide, dpi, layout_mode, out, progress):
+    """バックグラウンドで PPTX を生成し、工程ごとの計測を記録する。"""
+    from deck import render_deck
+    run = metrics.start("pptx", images=sum(map(len, images.values())),
+                        per_slide=per_slide, dpi=dpi, layout=layout_mode)
+    error = None
+    try:
+        # エンコード済みの画像はストアに残し、再生成では変わった画像だけエンコードする
+        return render_deck(record, images, per_slide, dpi,
+                           out=out, progress=progress, measure=run,
+                           rendition_dir=store.RENDITION_DIR, layout_mode=layout_mode)
+    except Exception as e:
+        error = f"{type(e).__name__}: {e}"
+        raise
+    finally:
+        metrics.finish(run, error)
+        # 書き出しのたびに増えるキャッシュを上限・期限内に保つ（間隔はストア側で制限）
+        store.sweep_renditions()
 
-            # カテゴリ見出し
-            tb_cat = slide.shapes.add_textbox(
-                Inches(0.5), Inches(0.3),
-                Inches(3), Inches(0.5)
-            )
-            p_cat    = tb_cat.text_frame.paragraphs[0]
-            run_cat  = p_cat.add_run()
-            run_cat.text = label
-            p_cat.alignment = PP_ALIGN.LEFT
-            run_cat.font.name = "YuGothic"
-            run_cat.font.size = HEADING_FONT
-
-            # ロケ地名
-            TEXT_W = Inches(10)
-            LEFT   = (prs.slide_width - TEXT_W) / 2
-            tb_loc2 = slide.shapes.add_textbox(LEFT, Inches(0.3), TEXT_W, Inches(0.5))
-            p_loc2  = tb_loc2.text_frame.paragraphs[0]
-            run_loc2= p_loc2.add_run()
-            run_loc2.text = location_name
-            p_loc2.alignment = PP_ALIGN.CENTER
-            run_loc2.font.name = "YuGothic"
-            run_loc2.font.size = HEADING_FONT
-
-            # 画像グリッド…
-            usable_w = prs.slide_width - Inches(1)
-            usable_h = prs.slide_height - Inches(1.5)
-            gap_w, gap_h = Inches(0.2), Inches(0.2)
-            cell_w = (usable_w - gap_w*(PPT_COLS-1)) / PPT_COLS
-            cell_h = (usable_h - gap_h*(PPT_ROWS-1)) / PPT_ROWS
-            left_m, top_m = Inches(0.5), Inches(1.5)
-
-            for idx, img in enumerate(chunk):
-                r, c = divmod(idx, PPT_COLS)
-                x = left_m + c*(cell_w+gap_w)
-                y = top_m + r*(cell_h+gap_h)
-                ow, oh = img.size
-                ratio, cell_ratio = ow/oh, cell_w/cell_h
-                if ratio > cell_ratio:
-                    pw, ph = cell_w, cell_w/ratio
-                else:
-                    ph, pw = cell_h, cell_h*ratio
-                px = x + (cell_w-pw)/2
-                py = y + (cell_h-ph)/2
-                #if pw<cell_w or ph<cell_h:
-                #    bg = slide.shapes.add_shape(MSO_SHAPE.RECTANGLE, x, y, cell_w, cell_h)
-                #    bg.fill.solid()
-                #    bg.fill.fore_color.rgb = RGBColor(255,255,255)
-                #    bg.line.fill.background()
-                buf = io.BytesIO()
-                img.save(buf, format=img.format or "PNG")
-                buf.seek(0)
-                slide.shapes.add_picture(buf, px, py, width=pw, height=ph)
-
-    # 保存＆ストア
-    out = io.BytesIO()
-    prs.save(out)
-    out.seek(0)
-    st.session_state['pptx_bytes'] = out.getvalue()
+
+# --- PPTX 生成＆ダウンロード ---
+# 生成はセッションごとのバックグラウンドジョブとして投入し、
+# 同じ入力での再クリックや実行中のクリックは 1 つにまとめる
+images    = st.session_state["images"]
+deck_imgs = {
+    key: [images[d] for d in (st.session_state[f"{key}_index"]["order"] if key == "thumbs"
+                              else gallery.included(st.session_state[f"{key}_index"]))]
+    for _, key, _ in categories
+}
+deck_sig = hashlib.sha256(repr((
+    record, {key: [r["hash"] for r in recs] for key, recs in deck_imgs.items()},
+    total_per_slide, EXPORT_DPI, layout_mode,
+)).encode()).hexdigest()
+
+# --- スライドのプレビュー（書き出し前の確認用） ---
+# 書き出しと同じ配置で各スライドを小さく描く。描いたスライドはプロセス内でキャッシュし、
+# 枚数や資料出力を切り替えても変わったスライドだけ描き直す。ギャラリー（fragment）内の変更は
+# deck_changed() が全体を再実行させて反映する
+if st.toggle("👀 スライドのプレビュー", key="deck_preview"):
+    import preview
+    slides, drawn = preview.render_slides(record, deck_imgs, total_per_slide, layout_mode)
+    st.caption(f"{len(slides)} スライド（今回描いたもの {drawn} 枚、残りはキャッシュ）")
+    st.image([data for _, data in slides], caption=[title for title, _ in slides],
+             width=preview.PREVIEW_WIDTH // 2)
+
+job     = st.session_state.get("pptx_job")
+running = job is not None and not job["future"].done()
+
+if st.button("💾 PPTX を生成", disabled=running):
+    if st.session_state.get("pptx_sig") != deck_sig:
+        job = {"sig": deck_sig, "done": 0, "total": 0,
+               "out": artifacts.new_path(st.session_state["session_id"], ".pptx")}
+        job["future"] = deck_executor().submit(
+            deck_job, record, deck_imgs, total_per_slide, EXPORT_DPI, layout_mode,
+            out=job["out"],
+            progress=lambda d, t, job=job: job.update(done=d, total=t),
+        )
+        st.session_state["pptx_job"] = job
+        running = True
+
+def show_pptx_job():
+    """実行中のジョブの進捗を表示し、終わったら結果を受け取って全体を再実行。"""
+    job = st.session_state.get("pptx_job")
+    if job is None:
+        return
+    if not job["future"].done():
+        total = job["total"]
+        frac  = job["done"] / total if total else 0.0
+        st.progress(frac, text=f"PPTX を生成中… 画像 {job['done']}/{total or '?'}")
+        return
+    st.session_state.pop("pptx_job")
+    try:
+        path = job["future"].result()
+    except Exception as e:
+        artifacts.discard(job["out"])
+        st.error(f"PPTX の生成に失敗しました: {e}")
+        return
+    # 新しい生成物で置き換え、前回分はすぐ削除
+    artifacts.discard(st.session_state.get("pptx_path"))
+    st.session_state["pptx_path"] = path
+    st.session_state["pptx_sig"]  = job["sig"]
+    st.rerun()
+
+if running and fragment:
+    fragment(run_every=1)(show_pptx_job)()
+elif "pptx_job" in st.session_state:
+    show_pptx_job()
+    if running:
+        st.button("🔄 進捗を更新")
 
 # --- ダウンロードボタン（ifブロック外） ---
-if 'pptx_bytes' in st.session_state:
-    st.download_button(
+# 期限切れで消えた生成物は忘れる
+if 'pptx_path' in st.session_state and not artifacts.is_alive(st.session_state['pptx_path']):
+    st.session_state.pop('pptx_path')
+    st.session_state.pop('pptx_sig', None)
+if 'pptx_path' in st.session_state:
+    download_artifact(
         "📥 PPTXをダウンロード",
-        data=st.session_state['pptx_bytes'],
+        st.session_state['pptx_path'],
         file_name="location_pictures.pptx",
         mime="application/vnd.openxmlformats-officedocument.presentationml.presentation"
     )
+
+# --- メモリ使用量（管理者向け、サーバーの環境変数 MEMORY_READOUT=1 のときだけ表示） ---
+# セッション × カテゴリごとのバッファ量。コンテナのメモリ量を決める目安にする
+# 他のセッションは ID を出さず、使用量の多い順の番号で示す
+if buffers.SHOW_READOUT:
+    per_session, total = buffers.usage()
+    rss = buffers.process_rss()
+    with st.sidebar.expander("メモリ使用量", expanded=True):
+        st.caption(
+            f"バッファ合計 {total / buffers.MB:.1f} MB（上限 {buffers.PROCESS_BUDGET // buffers.MB} MB、"
+            f"1 セッション {buffers.SESSION_BUDGET // buffers.MB} MB）"
+            + (f"／プロセス RSS {rss / buffers.MB:.0f} MB" if rss else "")
+            + "。表の単位は KB"
+        )
+        me = st.session_state["session_id"]
+        st.dataframe(
+            [
+                {"セッション": "自分" if sid == me else f"#{n}",
+                 **{label: round(cats.get(key, 0) / 1024) for label, key, _ in categories},
+                 "合計": round(sum(cats.values()) / 1024)}
+                for n, (sid, cats) in enumerate(
+                    sorted(per_session.items(), key=lambda kv: -sum(kv[1].values())), 1)
+            ],
+            hide_index=True,
+        )
+
+# --- 処理時間（デバッグ用、METRICS_PANEL=1 で表示） ---
+# このプロセスで直近に記録した取り込み・書き出しの工程別の時間とバイト数
+# （全セッション分なので、URL ではなくサーバー側の設定でだけ表示する）
+if metrics.SHOW_PANEL:
+    with st.sidebar.expander("処理時間（直近）", expanded=True):
+        st.caption(f"メトリクス出力: {metrics.METRICS_FILE or 'なし'}（{metrics.METRICS_FORMAT}）")
+        runs = list(reversed(metrics.recent))
+        if runs:
+            st.dataframe(
+                [
+                    {"種類": r["kind"], "合計[s]": r["seconds"],
+                     **{f"{name}[s]": p["seconds"] for name, p in r["phases"].items()},
+                     "エラー": r["error"] or ""}
+                    for r in runs
+                ],
+                hide_index=True,
+            )
+            st.json(runs[0], expanded=False)
+        else:
+            st.caption("まだ記録がありません")
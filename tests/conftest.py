@@ -0,0 +1,6 @@
+# tests/conftest.py
+# リポジトリ直下のモジュール（layout / service など）を import できるようにする。
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
@@ -0,0 +1,61 @@
+# tests/test_archive.py
+# archive.category_of() のフォルダ名の判定と、plan() / iter_images() の振り分け・読み飛ばし。
+
+import io
+import zipfile
+
+import pytest
+
+import archive
+
+
+@pytest.mark.parametrize("name, key", [
+    ("photos/a.jpg", "photos"),
+    ("PHOTOS/a.jpg", "photos"),
+    ("ロケA/photos/a.jpg", "photos"),
+    ("平面図/1F.png", "floor"),
+    ("ロケ地MAP/map.png", "map_img"),
+    ("サムネイル/t.jpg", "thumbs"),
+    ("サムネイル：1枚のみ/t.jpg", "thumbs"),
+    ("photos/平面図/1F.png", "floor"),   # 一番内側のフォルダを優先
+    ("平面図/misc/1F.png", "floor"),
+    ("a.jpg", None),
+    ("misc/a.jpg", None),
+    ("photos.jpg", None),                # ファイル名はフォルダ名として見ない
+])
+def test_category_of(name, key):
+    assert archive.category_of(name) == key
+
+
+def make_zip(members):
+    buf = io.BytesIO()
+    with zipfile.ZipFile(buf, "w", zipfile.ZIP_STORED) as zf:
+        for name, data in members:
+            zf.writestr(name, data)
+    return buf
+
+
+def test_plan_sorts_and_skips():
+    buf = make_zip([("photos/b.jpg", b"b"), ("photos/a.JPG", b"a"), ("photos/readme.txt", b"x"),
+                    ("misc/c.jpg", b"c"), ("__MACOSX/photos/._a.jpg", b"x"), ("photos/.hidden.jpg", b"x")])
+    entries, skipped = archive.plan(buf)
+    assert [(name, key) for _, name, key in entries] == [("photos/a.JPG", "photos"),
+                                                        ("photos/b.jpg", "photos")]
+    assert skipped == [("photos/readme.txt", "画像以外"), ("misc/c.jpg", "カテゴリ不明のフォルダ")]
+
+
+def test_plan_rejects_non_zip():
+    with pytest.raises(zipfile.BadZipFile):
+        archive.plan(io.BytesIO(b"not a zip"))
+
+
+def test_iter_images_skips_broken_member():
+    buf = make_zip([("photos/a.jpg", b"A" * 100), ("photos/b.jpg", b"B" * 100)])
+    raw = bytearray(buf.getvalue())
+    raw[raw.index(b"B" * 100) + 10] ^= 0xFF   # b.jpg の CRC が合わなくなる
+    buf = io.BytesIO(bytes(raw))
+    entries, _ = archive.plan(buf)
+    skipped = []
+    got = list(archive.iter_images(buf, entries, skipped))
+    assert got == [("photos", "a.jpg", b"A" * 100)]
+    assert skipped == [("photos/b.jpg", "展開できない（壊れている）")]
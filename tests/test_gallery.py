@@ -0,0 +1,60 @@
+# tests/test_gallery.py
+# gallery の索引（並び・位置・選択）が操作のあとも食い違わないこと。
+
+import gallery
+
+
+def make(n):
+    return gallery.new((f"h{i}", f"{i}.jpg", i % 3 != 0) for i in range(n))
+
+
+def assert_consistent(idx):
+    assert idx["pos"] == {d: i for i, d in enumerate(idx["order"])}
+    assert set(idx["name"]) == set(idx["include"]) == set(idx["order"])
+    assert idx["selected"] <= set(idx["order"])
+
+
+def test_new_and_append():
+    idx = make(5)
+    assert gallery.size(idx) == 5
+    assert not gallery.append(idx, "h2", "dup.jpg")
+    assert gallery.append(idx, "h5", "5.jpg")
+    assert idx["name"]["h2"] == "2.jpg"
+    assert gallery.page(idx, 4, 10) == ["h4", "h5"]
+    assert_consistent(idx)
+
+
+def test_included():
+    assert gallery.included(make(7)) == ["h1", "h2", "h4", "h5"]
+
+
+def test_remove():
+    idx = make(6)
+    gallery.select_all(idx)
+    assert gallery.remove(idx, ["h4", "h1", "h1", "nope"]) == ["h4", "h1"]
+    assert idx["order"] == ["h0", "h2", "h3", "h5"]
+    assert idx["selected"] == {"h0", "h2", "h3", "h5"}
+    assert gallery.remove(idx, []) == []
+    assert_consistent(idx)
+
+
+def test_move_to_front_keeps_relative_order():
+    idx = make(6)
+    gallery.move_to_front(idx, ["h4", "h2", "nope"])
+    assert idx["order"] == ["h2", "h4", "h0", "h1", "h3", "h5"]
+    assert_consistent(idx)
+
+
+def test_selection_in_gallery_order():
+    idx = make(40)
+    gallery.select_none(idx)
+    idx["selected"] |= {"h30", "h3"}   # 少ないとき（位置で並べる）
+    assert gallery.selection(idx) == ["h3", "h30"]
+    gallery.move_to_front(idx, ["h30"])
+    assert gallery.selection(idx) == ["h30", "h3"]
+    gallery.select_invert(idx)           # 多いとき（並びを走査）
+    assert len(gallery.selection(idx)) == 38
+    assert gallery.selection(idx) == [d for d in idx["order"] if d not in ("h3", "h30")]
+    gallery.select_all(idx)
+    assert gallery.selection(idx) == idx["order"]
+    assert_consistent(idx)
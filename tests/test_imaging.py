@@ -0,0 +1,62 @@
+# tests/test_imaging.py
+# imaging.submit_rendition() のディスクキャッシュ：再利用・消えたときの作り直し・一時ファイル。
+
+import io
+import time
+from pathlib import Path
+
+from PIL import Image
+
+import imaging
+from layout import inches
+
+
+def jpeg(w=800, h=600):
+    buf = io.BytesIO()
+    Image.new("RGB", (w, h), (200, 80, 40)).save(buf, "JPEG")
+    return imaging.make_record(buf.getvalue())
+
+
+def rendition(rec, cache_dir):
+    return imaging.submit_rendition(rec, inches(3), inches(2), 96, cache_dir=cache_dir).result()
+
+
+def cached_files(cache_dir):
+    # ディスクへの書き込みはエンコード完了後のコールバックなので、少し待つ
+    for _ in range(100):
+        files = sorted(p.name for p in Path(cache_dir).rglob("*") if p.is_file())
+        if files and not any(name.startswith(".") for name in files):
+            return files
+        time.sleep(0.01)
+    return files
+
+
+def test_reuses_disk_cache(tmp_path, monkeypatch):
+    rec = jpeg()
+    first = rendition(rec, tmp_path)
+    [name] = cached_files(tmp_path)
+    assert not name.startswith(".")   # 一時ファイルは残らない
+    monkeypatch.setattr(imaging, "render", lambda *a, **k: 1 / 0)   # もうエンコードしない
+    assert rendition(rec, tmp_path) == first
+
+
+def test_box_is_bucketed():
+    w, h = imaging.rendition_box(inches(3), inches(2), 96)
+    assert w == h and w % imaging.RENDITION_STEP == 0 and 288 <= w < 288 + imaging.RENDITION_STEP
+
+
+def test_file_removed_while_reading_is_re_encoded(tmp_path, monkeypatch):
+    rec = jpeg()
+    first = rendition(rec, tmp_path)
+    cached_files(tmp_path)
+    real = Path.read_bytes
+
+    def vanished(self):   # 掃除が存在確認と読み込みの間に消した状態
+        if self.parent.parent == tmp_path:
+            raise FileNotFoundError(self)
+        return real(self)
+
+    monkeypatch.setattr(Path, "read_bytes", vanished)
+    data = rendition(rec, tmp_path)
+    with Image.open(io.BytesIO(data)) as img, Image.open(io.BytesIO(first)) as ref:
+        assert img.size == ref.size
@@ -0,0 +1,85 @@
+# tests/test_layout.py
+# layout.justified_pages()：並び順・配置範囲・行の縮小の下限・最後の行。
+
+import random
+from itertools import groupby
+
+import pytest
+
+from layout import GRID_LAYOUTS, MIN_ROW_SCALE, SLIDE_W, SLIDE_H, _image_area, justified_pages
+
+EPS = 1   # EMU（丸め誤差の分）
+LEFT, TOP, USABLE_W, USABLE_H, GAP = _image_area(SLIDE_W, SLIDE_H)
+
+
+def mixed_sizes(n, seed=0):
+    rng = random.Random(seed)
+    return [rng.choice([(4000, 3000), (3000, 4000), (1920, 1080), (2000, 2000), (6000, 2000)])
+            for _ in range(n)]
+
+
+def rows_of(page):
+    # 同じ行の画像は同じ y に並ぶ
+    return [list(row) for _, row in groupby(page, key=lambda p: round(p[2]))]
+
+
+def target_height(rows):
+    return (USABLE_H - GAP*(rows-1)) / rows
+
+
+CASES = [(n, rows, seed) for n in (1, 7, 40, 101) for rows in (2, 3) for seed in (0, 1)]
+
+
+@pytest.mark.parametrize("n, rows, seed", CASES)
+def test_order_preserved(n, rows, seed):
+    pages = justified_pages(mixed_sizes(n, seed), rows, SLIDE_W, SLIDE_H)
+    assert [i for page in pages for i, *_ in page] == list(range(n))
+    assert all(pages)
+
+
+@pytest.mark.parametrize("n, rows, seed", CASES)
+def test_inside_usable_area(n, rows, seed):
+    for page in justified_pages(mixed_sizes(n, seed), rows, SLIDE_W, SLIDE_H):
+        for _, x, y, w, h in page:
+            assert LEFT - EPS <= x and x + w <= LEFT + USABLE_W + EPS
+            assert TOP - EPS <= y and y + h <= TOP + USABLE_H + EPS
+
+
+@pytest.mark.parametrize("n, rows, seed", CASES)
+def test_keeps_aspect_and_row_height(n, rows, seed):
+    sizes = mixed_sizes(n, seed)
+    for page in justified_pages(sizes, rows, SLIDE_W, SLIDE_H):
+        for row in rows_of(page):
+            assert len({round(h) for *_, h in row}) == 1
+            for i, _, _, w, h in row:
+                assert w / h == pytest.approx(sizes[i][0] / sizes[i][1])
+
+
+@pytest.mark.parametrize("n, rows, seed", CASES)
+def test_rows_not_shrunk_below_min_scale(n, rows, seed):
+    # 最後の行以外は横幅いっぱいに並べた後で縮めるだけなので、行の幅 / 横幅 = 縮小率
+    pages = justified_pages(mixed_sizes(n, seed), rows, SLIDE_W, SLIDE_H)
+    all_rows = [row for page in pages for row in rows_of(page)]
+    for row in all_rows[:-1]:
+        width = sum(w for *_, w, _ in row) + GAP*(len(row)-1)
+        assert width >= USABLE_W * MIN_ROW_SCALE - EPS
+
+
+@pytest.mark.parametrize("rows", [cols_rows[1] for cols_rows in GRID_LAYOUTS.values()])
+def test_last_row_not_stretched(rows):
+    # 横長 7 枚：最後の行が 1〜2 枚になっても目安の高さより大きくしない
+    sizes = [(1920, 1080)] * 7
+    pages = justified_pages(sizes, rows, SLIDE_W, SLIDE_H)
+    last = rows_of(pages[-1])[-1]
+    width = sum(w for *_, w, _ in last) + GAP*(len(last)-1)
+    assert last[0][4] <= target_height(rows) + EPS
+    assert width < USABLE_W
+
+
+def test_single_tall_image_fits():
+    [[(i, x, y, w, h)]] = justified_pages([(1000, 8000)], 2, SLIDE_W, SLIDE_H)
+    assert i == 0 and h <= USABLE_H + EPS and w == pytest.approx(h / 8)
+
+
+def test_empty():
+    assert justified_pages([], 2, SLIDE_W, SLIDE_H) == []
@@ -0,0 +1,51 @@
+# tests/test_metrics.py
+# metrics のファイル出力：jsonl の追記と上限でのローテーション。
+
+import json
+
+import pytest
+
+import metrics
+
+
+@pytest.fixture
+def out(tmp_path, monkeypatch):
+    path = tmp_path / "m.jsonl"
+    monkeypatch.setattr(metrics, "METRICS_FILE", str(path))
+    monkeypatch.setattr(metrics, "METRICS_FORMAT", "jsonl")
+    return path
+
+
+def run_once(**labels):
+    run = metrics.start("upload", **labels)
+    with metrics.phase(run, "decode", 10):
+        pass
+    metrics.item(run, name="a.jpg")
+    return metrics.finish(run)
+
+
+def test_appends_one_line_per_run(out):
+    run_once(files=1)
+    entry = run_once(files=2)
+    lines = [json.loads(x) for x in out.read_text(encoding="utf-8").splitlines()]
+    assert [x["files"] for x in lines] == [1, 2]
+    assert lines[-1]["phases"]["decode"]["bytes"] == 10
+    assert lines[-1]["items"] == [{"name": "a.jpg"}] and entry == lines[-1]
+
+
+def test_rotates_at_limit(out, monkeypatch):
+    run_once(files=0)
+    monkeypatch.setattr(metrics, "METRICS_MAX_BYTES", out.stat().st_size * 3)
+    for i in range(1, 10):
+        run_once(files=i)
+    backup = out.with_name(out.name + ".1")
+    assert out.stat().st_size <= metrics.METRICS_MAX_BYTES
+    assert backup.stat().st_size <= metrics.METRICS_MAX_BYTES
+    assert json.loads(out.read_text(encoding="utf-8").splitlines()[-1])["files"] == 9
+    assert sorted(p.name for p in out.parent.iterdir()) == ["m.jsonl", "m.jsonl.1"]
+
+
+def test_empty_file_setting_writes_nothing(tmp_path, monkeypatch):
+    monkeypatch.setattr(metrics, "METRICS_FILE", "")
+    assert run_once()["kind"] == "upload"
+    assert not list(tmp_path.iterdir())
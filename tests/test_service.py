@@ -0,0 +1,111 @@
+# tests/test_service.py
+# service.parse_job() の入力検証と、不正なリクエストへの 400。
+
+import threading
+import http.client
+
+import pytest
+
+import service
+
+
+@pytest.fixture
+def root(tmp_path):
+    for name in ("thumbs/t1.jpg", "thumbs/t2.jpg", "photos/a.jpg", "photos/b.png"):
+        (tmp_path / name).parent.mkdir(exist_ok=True)
+        (tmp_path / name).write_bytes(b"")
+    return tmp_path
+
+
+def test_images_and_defaults(root):
+    record, images, per_slide, dpi, layout_mode = service.parse_job(
+        {"record": {"ロケ地名": "スタジオ", "面積": 120, "備考": ["a"]},
+         "images": {"photos": [str(root / "photos/a.jpg")]}}, root)
+    assert record == {"ロケ地名": "スタジオ", "面積": 120, "備考": "['a']"}
+    assert images == {"photos": [root / "photos/a.jpg"], "thumbs": []}
+    assert (per_slide, dpi, layout_mode) == (6, 150, "grid")
+
+
+def test_image_dir_keeps_one_thumb(root):
+    _, images, *_ = service.parse_job({"record": {"a": 1}, "image_dir": str(root)}, root)
+    assert images["thumbs"] == [root / "thumbs/t1.jpg"]
+    assert images["photos"] == [root / "photos/a.jpg", root / "photos/b.png"]
+
+
+@pytest.mark.parametrize("payload", [
+    {"record": {"a": 1}, "images": {"photos": ["/etc/passwd"]}},
+    {"record": {"a": 1}, "images": {"photos": ["photos/../../x.jpg"]}},
+    {"record": {"a": 1}, "image_dir": "/"},
+])
+def test_rejects_paths_outside_root(root, payload, monkeypatch):
+    monkeypatch.chdir(root)
+    with pytest.raises(ValueError, match="image-root"):
+        service.parse_job(payload, root)
+
+
+def test_root_defaults_to_cwd(root, tmp_path_factory, monkeypatch):
+    other = tmp_path_factory.mktemp("other")
+    monkeypatch.chdir(other)
+    with pytest.raises(ValueError, match="image-root"):
+        service.parse_job({"record": {"a": 1}, "image_dir": str(root)})
+    monkeypatch.chdir(root)
+    _, images, *_ = service.parse_job({"record": {"a": 1}, "images": {"photos": ["photos/a.jpg"]}})
+    assert images["photos"] == [root / "photos/a.jpg"]
+
+
+@pytest.mark.parametrize("payload, message", [
+    ([], "JSON オブジェクト"),
+    ({"record": {}}, "record"),
+    ({"record": {"a": 1}, "images": ["x.jpg"]}, "images"),
+    ({"record": {"a": 1}, "images": {"xx": []}}, "不明なカテゴリキー: xx"),
+    ({"record": {"a": 1}, "images": {"photos": ["photos/none.jpg"]}}, "見つかりません"),
+    ({"record": {"a": 1}, "image_dir": "missing"}, "画像フォルダがありません"),
+    ({"record": {"a": 1}, "per_slide": 4}, "per_slide"),
+    ({"record": {"a": 1}, "dpi": 0}, "dpi"),
+    ({"record": {"a": 1}, "dpi": "150"}, "dpi"),
+    ({"record": {"a": 1}, "layout": "mosaic"}, "layout"),
+    ({"record": {"a": 1}, "images": {"photos": 5}}, "リストにしてください: photos"),
+    ({"record": {"a": 1}, "images": {"photos": "photos/a.jpg"}}, "リスト"),
+    ({"record": {"a": 1}, "images": {"photos": [["photos/a.jpg"]]}}, "リスト"),
+    ({"record": {"a": 1}, "image_dir": ["."]}, "image_dir"),
+    ({"record": {"a": 1}, "per_slide": [6]}, "per_slide"),
+    ({"record": {"a": 1}, "per_slide": 6.0}, "per_slide"),
+    ({"record": {"a": 1}, "dpi": True}, "dpi"),
+    ({"record": {"a": 1}, "layout": ["grid"]}, "layout"),
+    ({"record": {"a": 1}, "layout": {"grid": 1}}, "layout"),
+])
+def test_rejects_invalid(root, payload, message, monkeypatch):
+    monkeypatch.chdir(root)
+    with pytest.raises(ValueError, match=message):
+        service.parse_job(payload, root)
+
+
+def test_options(root):
+    _, _, per_slide, dpi, layout_mode = service.parse_job(
+        {"record": {"a": 1}, "per_slide": 9, "dpi": None, "layout": "justified"}, root)
+    assert (per_slide, dpi, layout_mode) == (9, None, "justified")
+
+
+def test_http_bad_requests_get_400(root):
+    state  = service.new_service(root / "out", workers=1, queue_size=1, image_root=root)
+    server = service.make_server(state, port=0)
+    server.RequestHandlerClass.log_message = lambda *a: None
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    port = server.server_address[1]
+    try:
+        for length in ("abc", "-1"):
+            conn = http.client.HTTPConnection("127.0.0.1", port, timeout=10)
+            conn.putrequest("POST", "/jobs")
+            conn.putheader("Content-Length", length)
+            conn.endheaders()
+            assert conn.getresponse().status == 400
+            conn.close()
+        for payload in ({"record": {"a": 1}, "images": {"photos": 5}},
+                        {"record": {"a": 1}, "per_slide": [6]},
+                        {"record": {"a": 1}, "layout": ["grid"]}):
+            assert service.request("POST", "/jobs", payload, port=port)[0] == 400
+        code, _, _ = service.request("POST", "/jobs", None, port=port)
+        assert code == 400
+    finally:
+        server.shutdown()
+        server.server_close()
@@ -0,0 +1,99 @@
+# tests/test_similar.py
+# similar.clusters() を総当たりの結果と比べる（ブロックの境目・popcount の代替経路を含む）。
+
+import random
+
+import numpy as np
+import pytest
+from PIL import Image
+
+import similar
+
+
+def brute_force(phashes, threshold):
+    n = len(phashes)
+    hs = [int(p, 16) for p in phashes]
+    parent = list(range(n))
+
+    def find(i):
+        while parent[i] != i:
+            i = parent[i]
+        return i
+
+    for a in range(n):
+        for b in range(a + 1, n):
+            if bin(hs[a] ^ hs[b]).count("1") <= threshold:
+                ra, rb = find(a), find(b)
+                parent[max(ra, rb)] = min(ra, rb)
+    groups = {}
+    for i in range(n):
+        groups.setdefault(find(i), []).append(i)
+    return [g for g in groups.values() if len(g) > 1]
+
+
+def near_duplicates(n, seed):
+    # 少数の元ハッシュから数ビットずつ変えたものを混ぜる
+    rng = random.Random(seed)
+    bases = [rng.getrandbits(64) for _ in range(max(1, n // 4))]
+    out = []
+    for _ in range(n):
+        h = rng.choice(bases)
+        for _ in range(rng.randint(0, 8)):
+            h ^= 1 << rng.randrange(64)
+        out.append(f"{h:016x}")
+    return out
+
+
+@pytest.mark.parametrize("n", [0, 1, 2, 37, 150])
+@pytest.mark.parametrize("threshold", [0, 6, 10])
+def test_matches_brute_force(n, threshold, monkeypatch):
+    monkeypatch.setattr(similar, "BLOCK", 16)   # ブロックをまたぐペアも確かめる
+    phashes = near_duplicates(n, seed=n + threshold)
+    assert similar.clusters(phashes, threshold) == brute_force(phashes, threshold)
+
+
+@pytest.mark.parametrize("seed", range(5))
+def test_shuffled_chain_matches_brute_force(seed, monkeypatch):
+    # 1 ビットずつ変わっていく連写を並べ替えたもの：成分が長い鎖になる（ラベルの伝播が遅い形）
+    monkeypatch.setattr(similar, "BLOCK", 32)
+    rng = random.Random(seed)
+    h, phashes = rng.getrandbits(64), []
+    for _ in range(300):
+        h ^= 1 << rng.randrange(64)
+        phashes.append(f"{h:016x}")
+        if rng.random() < 0.05:
+            h = rng.getrandbits(64)
+    rng.shuffle(phashes)
+    assert similar.clusters(phashes, 1) == brute_force(phashes, 1)
+
+
+def test_many_identical():
+    assert similar.clusters(["ffff0000ffff0000"] * 3000 + ["0000ffff0000ffff"]) == [list(range(3000))]
+
+
+def test_transitive_chain():
+    # a–b、b–c は近いが a–c は遠い：1 つのグループにまとまる
+    a, b, c, far = 0, 0b111, 0b111111, (1 << 64) - 1
+    phashes = [f"{x:016x}" for x in (far, a, b, c)]
+    assert similar.clusters(phashes, threshold=3) == [[1, 2, 3]]
+
+
+def test_popcount_fallback_matches():
+    x = np.array([0, 1, (1 << 64) - 1, 0x0F0F0F0F0F0F0F0F], dtype=np.uint64)
+    fallback = similar._POPCOUNT8[x.view(np.uint8)].reshape(*x.shape, 8).sum(axis=-1)
+    assert similar._popcount(x).tolist() == fallback.tolist() == [0, 1, 64, 32]
+
+
+def test_features_of_near_copies_are_close():
+    rng = np.random.default_rng(0)
+    base = Image.fromarray(rng.integers(0, 256, (120, 160, 3), dtype=np.uint8)).resize((320, 240))
+    other = Image.fromarray(rng.integers(0, 256, (120, 160, 3), dtype=np.uint8)).resize((320, 240))
+    h0, s0 = similar.features(base)
+    h1, _ = similar.features(base.resize((300, 225)))
+    h2, _ = similar.features(other)
+    assert similar.clusters([h0, h1, h2]) == [[0, 1]]
+    assert s0 > 0
+
+
+def test_best_of_prefers_first_on_tie():
+    assert similar.best_of([0, 1, 2], [1.0, 3.0, 3.0]) == 1
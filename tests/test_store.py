@@ -0,0 +1,56 @@
+# tests/test_store.py
+# store.put_images()：画像の行・ギャラリーの行・ブロブを 1 つのトランザクションで書く。
+
+import sqlite3
+import threading
+
+import pytest
+
+import store
+
+
+@pytest.fixture(autouse=True)
+def tmp_store(tmp_path, monkeypatch):
+    monkeypatch.setattr(store, "STORE_DIR", tmp_path)
+    monkeypatch.setattr(store, "DB_PATH", tmp_path / "projects.sqlite3")
+    monkeypatch.setattr(store, "BLOB_DIR", tmp_path / "blobs")
+    monkeypatch.setattr(store, "RENDITION_DIR", tmp_path / "blobs" / "rendition")
+    monkeypatch.setattr(store, "_local", threading.local())
+    monkeypatch.setattr(store, "_schema_done", False)
+
+
+def rec(n):
+    return {"hash": f"{n:064x}", "raw": b"raw%d" % n, "preview": b"pv%d" % n,
+            "size": (40, 30), "format": "JPEG", "orientation": 1}
+
+
+def test_put_images_adds_rows_and_gallery():
+    pid = store.new_project()
+    out = store.put_images(pid, "photos", [rec(1), rec(2)], [(rec(1)["hash"], "a.jpg"),
+                                                            (rec(2)["hash"], "b.jpg")])
+    assert set(out) == {rec(1)["hash"], rec(2)["hash"]}
+    assert "raw" not in out[rec(1)["hash"]]
+    assert store.load_gallery(pid, "photos") == [(rec(1)["hash"], "a.jpg", True),
+                                                 (rec(2)["hash"], "b.jpg", True)]
+    assert store.blob_path(rec(1)["hash"]).read_bytes() == b"raw1"
+
+
+def test_released_image_is_restored_with_blobs():
+    a, b = store.new_project(), store.new_project()
+    digest = rec(1)["hash"]
+    store.put_images(a, "photos", [rec(1)], [(digest, "a.jpg")])
+    store.remove_from_gallery(a, "photos", [digest])
+    assert not store.blob_path(digest).exists()
+    store.put_images(b, "photos", [rec(1)], [(digest, "b.jpg")])
+    assert store.blob_path(digest).exists() and store.blob_path(digest, "preview").exists()
+    store.release_images([digest])   # b が参照しているので消えない
+    assert store.get_images([digest]) and store.blob_path(digest).exists()
+
+
+def test_unknown_gallery_item_rolls_back():
+    pid = store.new_project()
+    with pytest.raises(sqlite3.IntegrityError):
+        store.put_images(pid, "photos", [rec(1)], [(rec(1)["hash"], "a.jpg"),
+                                                   (rec(9)["hash"], "x.jpg")])
+    assert store.get_images([rec(1)["hash"]]) == {}
+    assert store.load_gallery(pid, "photos") == []